@@ -17,10 +17,26 @@ from datetime import datetime, date, timedelta
 import hashlib
 from io import BytesIO
 import json
+import re
 import base64
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import zipfile
+import tempfile
+import shutil
+from contextlib import contextmanager
+import functools
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from credenciales import (
+    hash_contraseña, necesita_rehash, verificar_en_segundo_plano,
+    segundos_bloqueo, registrar_fallo, registrar_exito
+)
+from kpi import (
+    reconstruir_kpi_equipo_diario, actualizar_kpi_equipo_diario, leer_kpi_periodo, indicadores
+)
 
 # ===============================DETECCIÓN AUTOMÁTICA DE ENTORNO================================
 # Determinar si estamos en Streamlit Cloud o local
@@ -38,37 +54,130 @@ USAR_GOOGLE_SHEETS = True  # Cambiar a False si quieres deshabilitar
 # Inicializar Google Sheets si está habilitado
 st.session_state.use_google_sheets = False
 st.session_state.gs_client = None
-st.session_state.spreadsheet = None  # Para almacenar la hoja principal
+
+SCOPE = ["https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"]
+NOMBRE_SPREADSHEET = "Sistema_Mantenimiento"
+
+# Límite de escrituras de la API de Sheets (por usuario y minuto) y concurrencia
+LIMITE_ESCRITURAS_POR_MINUTO = 60
+RAFAGA_ESCRITURAS = 10
+SYNC_HILOS = 3
+
+# ===============================RECURSOS DE GOOGLE SHEETS (CACHÉ POR PROCESO)================================
+# Cliente autorizado, hoja principal y mapa título -> worksheet compartidos por todas las
+# sesiones e hilos. En estado estable, guardar no hace llamadas de metadatos.
+
+@st.cache_resource(show_spinner=False)
+def obtener_recursos_gs():
+    """Contenedor único por proceso con el cliente, la hoja principal y las worksheets"""
+    return {
+        'lock': threading.RLock(),
+        'client': None,
+        'spreadsheet': None,
+        'hojas': {},
+        'limitador': nuevo_limitador(LIMITE_ESCRITURAS_POR_MINUTO, RAFAGA_ESCRITURAS),
+        'resumen_sync': None
+    }
+
+def nuevo_limitador(por_minuto, rafaga):
+    """Token bucket: 'rafaga' llamadas seguidas y luego 'por_minuto' llamadas por minuto"""
+    return {
+        'lock': threading.Lock(),
+        'tasa': por_minuto / 60.0,
+        'capacidad': float(rafaga),
+        'tokens': float(rafaga),
+        'ultimo': time.monotonic()
+    }
+
+def esperar_cuota_api(recursos, costo=1):
+    """Bloquear hasta que el limitador compartido permita otra escritura a la API"""
+    if not recursos:
+        return
+    
+    limitador = recursos['limitador']
+    while True:
+        with limitador['lock']:
+            ahora = time.monotonic()
+            limitador['tokens'] = min(limitador['capacidad'],
+                                      limitador['tokens'] + (ahora - limitador['ultimo']) * limitador['tasa'])
+            limitador['ultimo'] = ahora
+            if limitador['tokens'] >= costo:
+                limitador['tokens'] -= costo
+                return
+            espera = (costo - limitador['tokens']) / limitador['tasa']
+        time.sleep(espera)
+
+def cliente_gs(recursos):
+    """Cliente gspread autorizado (se autoriza una sola vez por proceso)"""
+    with recursos['lock']:
+        if recursos['client'] is None:
+            creds_dict = dict(st.secrets["google_credentials"])
+            creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPE)
+            recursos['client'] = gspread.authorize(creds)
+            print("✅ Cliente de Google Sheets autorizado")
+        return recursos['client']
+
+def spreadsheet_gs(recursos):
+    """Hoja principal cacheada (se abre o crea una sola vez por proceso)"""
+    with recursos['lock']:
+        if recursos['spreadsheet'] is None:
+            recursos['spreadsheet'] = abrir_spreadsheet(cliente_gs(recursos))
+        return recursos['spreadsheet']
+
+def worksheet_gs(recursos, worksheet_name, crear=True):
+    """Worksheet cacheada por título; crear=False lanza WorksheetNotFound si no existe"""
+    with recursos['lock']:
+        worksheet = recursos['hojas'].get(worksheet_name)
+        if worksheet is not None:
+            return worksheet
+        
+        spreadsheet = spreadsheet_gs(recursos)
+        if not spreadsheet:
+            return None
+        
+        if crear:
+            worksheet = get_or_create_worksheet(spreadsheet, worksheet_name)
+        else:
+            worksheet = spreadsheet.worksheet(worksheet_name)
+        
+        if worksheet is not None:
+            recursos['hojas'][worksheet_name] = worksheet
+        return worksheet
+
+def es_error_autenticacion(error):
+    """Detectar errores de credenciales/token (401/403 o refresco fallido)"""
+    respuesta = getattr(error, 'response', None)
+    codigo = getattr(respuesta, 'status_code', None)
+    return codigo in (401, 403) or type(error).__name__ == 'RefreshError' or 'invalid_grant' in str(error)
+
+def invalidar_recursos_gs(recursos, error, worksheet_name=None):
+    """Descartar los handles cacheados que el error dejó inválidos"""
+    with recursos['lock']:
+        if es_error_autenticacion(error):
+            print("⚠️ Error de autenticación con Google Sheets, se reinicia el cliente")
+            recursos['client'] = None
+            recursos['spreadsheet'] = None
+            recursos['hojas'].clear()
+        elif isinstance(error, gspread.exceptions.SpreadsheetNotFound):
+            recursos['spreadsheet'] = None
+            recursos['hojas'].clear()
+        elif worksheet_name and (
+                isinstance(error, gspread.exceptions.WorksheetNotFound)
+                or (isinstance(error, gspread.exceptions.APIError) and not es_error_cuota(error))):
+            # La worksheet pudo ser borrada o renombrada desde la hoja
+            recursos['hojas'].pop(worksheet_name, None)
 
 if USAR_GOOGLE_SHEETS:
     try:
         import gspread
         from google.oauth2.service_account import Credentials
         
-        print("🔄 Intentando conectar a Google Sheets...")
-        
         # Verificar si hay credenciales
         if 'google_credentials' in st.secrets:
-            print("✅ Credenciales de Google Sheets encontradas")
-            
-            SCOPE = ["https://www.googleapis.com/auth/spreadsheets",
-                    "https://www.googleapis.com/auth/drive"]
-            
-            creds_dict = dict(st.secrets["google_credentials"])
-            creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPE)
-            gs_client = gspread.authorize(creds)
-            
-            # Probar la conexión
-            try:
-                # Intentar listar archivos para verificar conexión
-                files = gs_client.list_spreadsheet_files()
-                st.session_state.gs_client = gs_client
-                st.session_state.use_google_sheets = True
-                print(f"✅ Conexión a Google Sheets exitosa. {len(files)} archivos encontrados")
-            except Exception as e:
-                print(f"❌ Error al conectar con Google Sheets: {e}")
-                st.session_state.gs_client = None
-                st.session_state.use_google_sheets = False
+            # La conexión se valida en el primer acceso a la hoja (no bloquear el arranque)
+            st.session_state.gs_client = cliente_gs(obtener_recursos_gs())
+            st.session_state.use_google_sheets = True
         else:
             print("⚠️ No hay credenciales de Google Sheets en secrets")
             st.session_state.gs_client = None
@@ -93,40 +202,33 @@ def get_spreadsheet():
         return None
     
     try:
-        client = st.session_state.gs_client
-        if not client:
-            return None
-        
-        spreadsheet_name = "Sistema_Mantenimiento"
-        
-        # Si ya tenemos la hoja en session_state, usarla
-        if hasattr(st.session_state, 'spreadsheet') and st.session_state.spreadsheet:
-            return st.session_state.spreadsheet
-        
-        try:
-            # Intentar abrir existente
-            print(f"🔍 Buscando hoja: {spreadsheet_name}")
-            spreadsheet = client.open(spreadsheet_name)
-            print(f"✅ Hoja encontrada: {spreadsheet_name}")
-        except gspread.exceptions.SpreadsheetNotFound:
-            # Crear nueva si no existe
-            print(f"📄 Creando nueva hoja: {spreadsheet_name}")
-            try:
-                # Crear hoja de cálculo principal
-                spreadsheet = client.create(spreadsheet_name)
-                time.sleep(3)
-                print(f"✅ Hoja creada exitosamente: {spreadsheet_name}")
-            except Exception as e:
-                print(f"❌ Error creando hoja principal: {e}")
-                return None
-        
-        # Guardar en session_state para reutilizar
-        st.session_state.spreadsheet = spreadsheet
-        return spreadsheet
+        return spreadsheet_gs(obtener_recursos_gs())
     except Exception as e:
+        invalidar_recursos_gs(obtener_recursos_gs(), e)
         print(f"❌ Error en get_spreadsheet: {e}")
         return None
 
+def abrir_spreadsheet(client):
+    """Abrir (o crear) la hoja principal con un cliente dado"""
+    try:
+        # Intentar abrir existente
+        print(f"🔍 Buscando hoja: {NOMBRE_SPREADSHEET}")
+        spreadsheet = client.open(NOMBRE_SPREADSHEET)
+        print(f"✅ Hoja encontrada: {NOMBRE_SPREADSHEET}")
+    except gspread.exceptions.SpreadsheetNotFound:
+        # Crear nueva si no existe
+        print(f"📄 Creando nueva hoja: {NOMBRE_SPREADSHEET}")
+        try:
+            # Crear hoja de cálculo principal
+            spreadsheet = client.create(NOMBRE_SPREADSHEET)
+            time.sleep(3)
+            print(f"✅ Hoja creada exitosamente: {NOMBRE_SPREADSHEET}")
+        except Exception as e:
+            print(f"❌ Error creando hoja principal: {e}")
+            return None
+    
+    return spreadsheet
+
 def get_or_create_worksheet(spreadsheet, worksheet_name):
     """Obtener o crear worksheet dentro de la hoja principal"""
     try:
@@ -155,112 +257,533 @@ def get_or_create_worksheet(spreadsheet, worksheet_name):
         print(f"❌ Error en get_or_create_worksheet: {e}")
         return None
 
-def guardar_en_google_sheets(tabla_nombre, conn_local):
-    """Guardar datos en worksheet específica de la hoja principal"""
-    if not st.session_state.use_google_sheets:
-        return False
+# ===============================SINCRONIZACIÓN INCREMENTAL (MANIFIESTO DE FILAS)================================
+# Modos de sincronización hacia Google Sheets:
+#   - 'incremental': solo envía filas insertadas, actualizadas y eliminadas desde la última sincronización
+#   - 'reconstruir': borra la hoja y la reescribe completa (respaldo explícito)
+MODO_SYNC_INCREMENTAL = 'incremental'
+MODO_SYNC_RECONSTRUIR = 'reconstruir'
+
+def init_manifiesto_sync(conn_local, tabla_nombre):
+    """Crear tablas de control de sincronización y trigger de actualizado_en para una tabla"""
+    c = conn_local.cursor()
+    
+    # Manifiesto: una fila por registro sincronizado (clave -> fila en la hoja + hash del contenido)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_manifiesto (
+            tabla TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            fila_hoja INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            PRIMARY KEY (tabla, clave)
+        )
+    ''')
+    
+    # Marcas de agua por tabla (último rowid y último actualizado_en enviados)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_marcas (
+            tabla TEXT PRIMARY KEY,
+            max_rowid INTEGER DEFAULT 0,
+            max_actualizado_en TEXT DEFAULT '',
+            encabezados TEXT,
+            sincronizado_en TIMESTAMP
+        )
+    ''')
+    
+    # Mantener actualizado_en al día aunque el UPDATE no lo incluya
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{tabla_nombre}_actualizado_en
+        AFTER UPDATE ON {tabla_nombre}
+        WHEN NEW.actualizado_en IS OLD.actualizado_en
+        BEGIN
+            UPDATE {tabla_nombre} SET actualizado_en = CURRENT_TIMESTAMP WHERE rowid = NEW.rowid;
+        END
+    ''')
+
+def _valor_celda(valor):
+    """Convertir un valor de SQLite al texto que se guarda en la celda"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bytes):
+        return base64.b64encode(valor).decode('utf-8')
+    return str(valor)
+
+def _hash_fila(celdas):
+    """Hash estable del contenido de una fila ya convertida a celdas"""
+    return hashlib.sha256('\x1f'.join(celdas).encode('utf-8')).hexdigest()
+
+def _columnas_tabla(conn_local, tabla_nombre):
+    """Obtener (columnas, columna_clave) de una tabla local"""
+    c = conn_local.cursor()
+    c.execute(f"PRAGMA table_info({tabla_nombre})")
+    info = c.fetchall()
+    columnas = [col[1] for col in info]
+    claves = [col[1] for col in info if col[5] == 1]
+    return columnas, (claves[0] if claves else None)
+
+def _leer_filas_locales(conn_local, tabla_nombre, where="", params=()):
+    """Leer filas locales como (rowid, clave, celdas) en el orden de las columnas"""
+    columnas, columna_clave = _columnas_tabla(conn_local, tabla_nombre)
+    idx_clave = columnas.index(columna_clave) if columna_clave else None
+    
+    c = conn_local.cursor()
+    c.execute(f"SELECT rowid, * FROM {tabla_nombre} {where} ORDER BY rowid", params)
+    for fila in c:
+        rowid = fila[0]
+        valores = fila[1:]
+        clave = str(valores[idx_clave]) if idx_clave is not None else str(rowid)
+        yield rowid, clave, [_valor_celda(v) for v in valores], valores
+
+def _guardar_marcas(conn_local, tabla_nombre, max_rowid, max_actualizado_en, encabezados):
+    """Registrar las marcas de agua de la última sincronización"""
+    c = conn_local.cursor()
+    c.execute('''
+        INSERT INTO sync_marcas (tabla, max_rowid, max_actualizado_en, encabezados, sincronizado_en)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(tabla) DO UPDATE SET
+            max_rowid = excluded.max_rowid,
+            max_actualizado_en = excluded.max_actualizado_en,
+            encabezados = excluded.encabezados,
+            sincronizado_en = excluded.sincronizado_en
+    ''', (tabla_nombre, max_rowid, max_actualizado_en or '', json.dumps(encabezados)))
+
+def reiniciar_manifiesto(conn_local, tabla_nombre):
+    """Olvidar el estado sincronizado de una tabla (la próxima sincronización será completa)"""
+    c = conn_local.cursor()
+    c.execute('DELETE FROM sync_manifiesto WHERE tabla = ?', (tabla_nombre,))
+    c.execute('DELETE FROM sync_marcas WHERE tabla = ?', (tabla_nombre,))
+    conn_local.commit()
+
+def registrar_manifiesto_desde_hoja(conn_local, tabla_nombre, claves_en_hoja):
+    """Sembrar el manifiesto después de cargar la tabla completa desde la hoja.
+    
+    claves_en_hoja: lista de claves en el mismo orden que las filas de la hoja (fila 2 en adelante)
+    """
+    columnas, _ = _columnas_tabla(conn_local, tabla_nombre)
+    idx_act = columnas.index('actualizado_en') if 'actualizado_en' in columnas else None
+    
+    hashes = {}
+    max_rowid = 0
+    max_act = ''
+    for rowid, clave, celdas, valores in _leer_filas_locales(conn_local, tabla_nombre):
+        hashes[clave] = _hash_fila(celdas)
+        max_rowid = max(max_rowid, rowid)
+        if idx_act is not None and valores[idx_act]:
+            max_act = max(max_act, str(valores[idx_act]))
+    
+    c = conn_local.cursor()
+    c.execute('DELETE FROM sync_manifiesto WHERE tabla = ?', (tabla_nombre,))
+    c.executemany(
+        'INSERT OR REPLACE INTO sync_manifiesto (tabla, clave, fila_hoja, hash) VALUES (?, ?, ?, ?)',
+        ((tabla_nombre, clave, i + 2, hashes[clave])
+         for i, clave in enumerate(claves_en_hoja) if clave in hashes)
+    )
+    _guardar_marcas(conn_local, tabla_nombre, max_rowid, max_act, columnas)
+    conn_local.commit()
+
+def _fila_inicial_de_rango(rango_a1):
+    """Extraer el número de fila inicial de un rango tipo 'avisos'!A102:AO110"""
+    celda = rango_a1.split('!')[-1].split(':')[0]
+    coincidencia = re.search(r'(\d+)$', celda)
+    return int(coincidencia.group(1)) if coincidencia else None
+
+def _reconstruir_hoja(worksheet, tabla_nombre, conn_local, recursos=None):
+    """Reescribir la worksheet completa y regenerar el manifiesto (modo 'reconstruir')"""
+    columnas, _ = _columnas_tabla(conn_local, tabla_nombre)
+    idx_act = columnas.index('actualizado_en') if 'actualizado_en' in columnas else None
+    
+    claves = []
+    datos = []
+    max_rowid = 0
+    max_act = ''
+    for rowid, clave, celdas, valores in _leer_filas_locales(conn_local, tabla_nombre):
+        claves.append(clave)
+        datos.append(celdas)
+        max_rowid = max(max_rowid, rowid)
+        if idx_act is not None and valores[idx_act]:
+            max_act = max(max_act, str(valores[idx_act]))
+    
+    if not datos:
+        print(f"ℹ️ Tabla {tabla_nombre} vacía")
+        # Solo crear encabezados si la hoja está vacía
+        try:
+            existing_data = worksheet.get_all_values()
+            if len(existing_data) == 0:
+                esperar_cuota_api(recursos)
+                worksheet.update([columnas])
+                print(f"✅ Encabezados creados para {tabla_nombre}")
+        except Exception as e:
+            print(f"⚠️ Error creando encabezados: {e}")
+        return True
+    
+    print(f"💾 Reconstruyendo {tabla_nombre} con {len(datos)} registros...")
     
     try:
-        # Obtener hoja principal
-        spreadsheet = get_spreadsheet()
-        if not spreadsheet:
-            return False
-        
-        # Obtener worksheet específica para esta tabla
-        worksheet = get_or_create_worksheet(spreadsheet, tabla_nombre)
-        if not worksheet:
-            return False
-        
-        # Leer datos locales
-        df = pd.read_sql_query(f"SELECT * FROM {tabla_nombre}", conn_local)
-        
-        if df.empty:
-            print(f"ℹ️ Tabla {tabla_nombre} vacía")
-            # Solo crear encabezados si la hoja está vacía
-            try:
-                existing_data = worksheet.get_all_values()
-                if len(existing_data) == 0:
-                    # Obtener columnas de la tabla para crear encabezados
-                    c = conn_local.cursor()
-                    c.execute(f"PRAGMA table_info({tabla_nombre})")
-                    columnas = [col[1] for col in c.fetchall()]
-                    worksheet.update([columnas])
-                    print(f"✅ Encabezados creados para {tabla_nombre}")
-            except Exception as e:
-                print(f"⚠️ Error creando encabezados: {e}")
-            return True
-        
-        print(f"💾 Guardando {len(df)} registros en {tabla_nombre}...")
-        
-        # Preparar datos
-        df = df.fillna('')
-        
-        # Convertir bytes a base64
-        for col in df.columns:
-            if df[col].apply(lambda x: isinstance(x, bytes)).any():
-                df[col] = df[col].apply(lambda x: base64.b64encode(x).decode('utf-8') if isinstance(x, bytes) else str(x))
-        
-        # Convertir todo a string
-        df = df.astype(str)
-        encabezados = df.columns.tolist()
-        datos = df.values.tolist()
+        # Limpiar hoja
+        esperar_cuota_api(recursos)
+        worksheet.clear()
+        
+        # Actualizar en lotes pequeños
+        batch_size = 100
+        all_data = [columnas] + datos
+        
+        for i in range(0, len(all_data), batch_size):
+            batch = all_data[i:i+batch_size]
+            esperar_cuota_api(recursos)
+            if i == 0:
+                worksheet.update(batch)
+            else:
+                worksheet.append_rows(batch)
+    except Exception as e:
+        print(f"⚠️ Error actualizando {tabla_nombre}: {e}")
         
-        # Actualizar hoja
+        # Intentar método más simple
         try:
-            # Limpiar hoja
+            esperar_cuota_api(recursos, 2)
             worksheet.clear()
-            time.sleep(1)
-            
-            # Actualizar en lotes pequeños
-            batch_size = 100
-            all_data = [encabezados] + datos
-            
-            for i in range(0, len(all_data), batch_size):
-                batch = all_data[i:i+batch_size]
-                if i == 0:
-                    worksheet.update(batch)
-                else:
-                    worksheet.append_rows(batch)
-                time.sleep(1)
-            
-            print(f"✅ {len(df)} registros guardados en {tabla_nombre}")
-            return True
-            
-        except Exception as e:
-            print(f"⚠️ Error actualizando {tabla_nombre}: {e}")
-            
-            # Intentar método más simple
-            try:
-                worksheet.clear()
-                worksheet.update([encabezados] + datos)
-                print(f"✅ {tabla_nombre} actualizado con método simple")
-                return True
-            except Exception as e2:
-                print(f"❌ Error método simple para {tabla_nombre}: {e2}")
-                return False
-            
+            worksheet.update([columnas] + datos)
+            print(f"✅ {tabla_nombre} actualizado con método simple")
+        except Exception as e2:
+            print(f"❌ Error método simple para {tabla_nombre}: {e2}")
+            reiniciar_manifiesto(conn_local, tabla_nombre)
+            if es_error_cuota(e2):
+                raise
+            return False
+    
+    # La hoja quedó en el mismo orden que las filas locales
+    c = conn_local.cursor()
+    c.execute('DELETE FROM sync_manifiesto WHERE tabla = ?', (tabla_nombre,))
+    c.executemany(
+        'INSERT OR REPLACE INTO sync_manifiesto (tabla, clave, fila_hoja, hash) VALUES (?, ?, ?, ?)',
+        ((tabla_nombre, clave, i + 2, _hash_fila(celdas)) for i, (clave, celdas) in enumerate(zip(claves, datos)))
+    )
+    _guardar_marcas(conn_local, tabla_nombre, max_rowid, max_act, columnas)
+    conn_local.commit()
+    
+    print(f"✅ {len(datos)} registros guardados en {tabla_nombre}")
+    return True
+
+def _sincronizar_incremental(worksheet, tabla_nombre, conn_local, recursos=None):
+    """Enviar solo las filas insertadas, actualizadas y eliminadas.
+    
+    Devuelve None cuando no hay manifiesto utilizable y hace falta reconstruir.
+    """
+    columnas, _ = _columnas_tabla(conn_local, tabla_nombre)
+    c = conn_local.cursor()
+    
+    c.execute('SELECT max_rowid, max_actualizado_en, encabezados FROM sync_marcas WHERE tabla = ?', (tabla_nombre,))
+    marcas = c.fetchone()
+    if not marcas or marcas[2] != json.dumps(columnas):
+        # Nunca sincronizada o cambió el esquema
+        return None
+    
+    c.execute('SELECT clave, fila_hoja, hash FROM sync_manifiesto WHERE tabla = ?', (tabla_nombre,))
+    manifiesto = {clave: (fila, h) for clave, fila, h in c.fetchall()}
+    if not manifiesto:
+        return None
+    
+    max_rowid, max_act = marcas[0] or 0, marcas[1] or ''
+    idx_act = columnas.index('actualizado_en') if 'actualizado_en' in columnas else None
+    
+    # 1. Candidatos según marcas de agua (filas nuevas o tocadas desde la última vez)
+    if idx_act is not None:
+        where, params = "WHERE rowid > ? OR actualizado_en >= ?", (max_rowid, max_act)
+    else:
+        where, params = "", ()
+    
+    actualizaciones = []   # (clave, fila_hoja, celdas, hash)
+    inserciones = []       # (clave, celdas, hash)
+    nuevo_max_rowid, nuevo_max_act = max_rowid, max_act
+    for rowid, clave, celdas, valores in _leer_filas_locales(conn_local, tabla_nombre, where, params):
+        nuevo_max_rowid = max(nuevo_max_rowid, rowid)
+        if idx_act is not None and valores[idx_act]:
+            nuevo_max_act = max(nuevo_max_act, str(valores[idx_act]))
+        
+        h = _hash_fila(celdas)
+        if clave in manifiesto:
+            fila, h_anterior = manifiesto[clave]
+            if h != h_anterior:
+                actualizaciones.append((clave, fila, celdas, h))
+        else:
+            inserciones.append((clave, celdas, h))
+    
+    # 2. Eliminaciones: claves del manifiesto que ya no existen localmente
+    _, columna_clave = _columnas_tabla(conn_local, tabla_nombre)
+    expr_clave = f"CAST({columna_clave} AS TEXT)" if columna_clave else "CAST(rowid AS TEXT)"
+    c.execute(f'''
+        SELECT clave, fila_hoja FROM sync_manifiesto
+        WHERE tabla = ? AND clave NOT IN (SELECT {expr_clave} FROM {tabla_nombre})
+        ORDER BY fila_hoja DESC
+    ''', (tabla_nombre,))
+    eliminaciones = c.fetchall()
+    
+    if not (actualizaciones or inserciones or eliminaciones):
+        print(f"✅ {tabla_nombre} sin cambios desde la última sincronización")
+        _guardar_marcas(conn_local, tabla_nombre, nuevo_max_rowid, nuevo_max_act, columnas)
+        conn_local.commit()
+        return True
+    
+    print(f"💾 {tabla_nombre}: {len(inserciones)} nuevas, {len(actualizaciones)} actualizadas, {len(eliminaciones)} eliminadas")
+    
+    # 3. Actualizaciones puntuales por rango (una sola llamada)
+    if actualizaciones:
+        esperar_cuota_api(recursos)
+        worksheet.batch_update([
+            {'range': f"A{fila}", 'values': [celdas]}
+            for _, fila, celdas, _ in actualizaciones
+        ])
+        c.executemany(
+            'UPDATE sync_manifiesto SET hash = ? WHERE tabla = ? AND clave = ?',
+            ((h, tabla_nombre, clave) for clave, _, _, h in actualizaciones)
+        )
+    
+    # 4. Eliminaciones de abajo hacia arriba, agrupando filas contiguas
+    if eliminaciones:
+        grupos = []
+        for clave, fila in eliminaciones:
+            if grupos and grupos[-1][0] == fila + 1:
+                grupos[-1][0] = fila
+                grupos[-1][2].append(clave)
+            else:
+                grupos.append([fila, fila, [clave]])
+        
+        for inicio, fin, claves in grupos:
+            esperar_cuota_api(recursos)
+            worksheet.delete_rows(inicio, fin)
+            c.executemany('DELETE FROM sync_manifiesto WHERE tabla = ? AND clave = ?',
+                          ((tabla_nombre, clave) for clave in claves))
+            # Las filas de abajo suben
+            c.execute('''
+                UPDATE sync_manifiesto SET fila_hoja = fila_hoja - ?
+                WHERE tabla = ? AND fila_hoja > ?
+            ''', (fin - inicio + 1, tabla_nombre, fin))
+    
+    # 5. Inserciones al final de la hoja
+    if inserciones:
+        esperar_cuota_api(recursos)
+        respuesta = worksheet.append_rows([celdas for _, celdas, _ in inserciones], table_range='A1')
+        rango = (respuesta or {}).get('updates', {}).get('updatedRange', '')
+        fila_inicial = _fila_inicial_de_rango(rango) if rango else None
+        if fila_inicial is None:
+            c.execute('SELECT COALESCE(MAX(fila_hoja), 1) FROM sync_manifiesto WHERE tabla = ?', (tabla_nombre,))
+            fila_inicial = c.fetchone()[0] + 1
+        c.executemany(
+            'INSERT OR REPLACE INTO sync_manifiesto (tabla, clave, fila_hoja, hash) VALUES (?, ?, ?, ?)',
+            ((tabla_nombre, clave, fila_inicial + i, h) for i, (clave, _, h) in enumerate(inserciones))
+        )
+    
+    _guardar_marcas(conn_local, tabla_nombre, nuevo_max_rowid, nuevo_max_act, columnas)
+    conn_local.commit()
+    print(f"✅ {tabla_nombre} sincronizado de forma incremental")
+    return True
+
+def es_error_cuota(error):
+    """Detectar errores de cuota / límite de velocidad de la API de Google"""
+    texto = str(error)
+    respuesta = getattr(error, 'response', None)
+    codigo = getattr(respuesta, 'status_code', None)
+    return codigo == 429 or '429' in texto or 'RESOURCE_EXHAUSTED' in texto or 'Quota' in texto
+
+def sincronizar_tabla_en_hoja(recursos, tabla_nombre, conn_local, modo=MODO_SYNC_INCREMENTAL):
+    """Sincronizar una tabla contra su worksheet. Lanza los errores de cuota para reintentar."""
+    try:
+        return _sincronizar_tabla_en_worksheet(recursos, tabla_nombre, conn_local, modo)
     except Exception as e:
-        print(f"❌ Error guardando {tabla_nombre}: {e}")
+        # Handles cacheados inválidos (hoja borrada, token revocado): se vuelven a pedir
+        invalidar_recursos_gs(recursos, e, tabla_nombre)
+        raise
+
+def _sincronizar_tabla_en_worksheet(recursos, tabla_nombre, conn_local, modo):
+    """Elegir entre sincronización incremental y reconstrucción para una tabla"""
+    # Obtener worksheet específica para esta tabla (cacheada)
+    worksheet = worksheet_gs(recursos, tabla_nombre)
+    if not worksheet:
         return False
+    
+    if modo == MODO_SYNC_INCREMENTAL:
+        try:
+            resultado = _sincronizar_incremental(worksheet, tabla_nombre, conn_local, recursos)
+            if resultado is not None:
+                return resultado
+            print(f"ℹ️ {tabla_nombre} sin manifiesto de sincronización, se reconstruye la hoja")
+        except Exception as e:
+            # El manifiesto ya no es confiable: reconstruir
+            print(f"⚠️ Error en sincronización incremental de {tabla_nombre}: {e}")
+            conn_local.rollback()
+            reiniciar_manifiesto(conn_local, tabla_nombre)
+            if es_error_cuota(e):
+                raise
+    
+    return _reconstruir_hoja(worksheet, tabla_nombre, conn_local, recursos)
 
-def cargar_desde_google_sheets(tabla_nombre, conn_local):
-    """Cargar datos desde worksheet específica"""
-    if not st.session_state.use_google_sheets:
-        return True  # Devuelve True para continuar sin error
+# ===============================CARGA MASIVA DESDE GOOGLE SHEETS================================
+def _convertidor_columna(tipo_declarado, es_clave_entera):
+    """Función que convierte el texto de una celda al valor que se guarda en SQLite"""
+    tipo = (tipo_declarado or '').upper()
+    
+    if es_clave_entera:
+        # INTEGER PRIMARY KEY rechaza valores no enteros: se valida antes de insertar
+        def convertir(valor):
+            return int(valor) if valor != '' else None
+    elif 'BLOB' in tipo:
+        # Los BLOB se suben a la hoja en base64
+        def convertir(valor):
+            if valor == '':
+                return None
+            try:
+                return base64.b64decode(valor, validate=True)
+            except Exception:
+                return valor
+    elif any(t in tipo for t in ('INT', 'REAL', 'FLOA', 'DOUB')):
+        def convertir(valor):
+            return valor if valor != '' else None
+    else:
+        def convertir(valor):
+            return valor
+    return convertir
+
+def cargar_filas_en_bloque(conn_local, tabla_nombre, encabezados, filas, conservar_si=None):
+    """Reemplazar el contenido de una tabla con las filas de la hoja en una sola transacción.
+    
+    Las filas se validan y se insertan con executemany en una tabla temporal (staging);
+    luego se hace el intercambio DELETE + INSERT ... SELECT de forma atómica.
+    conservar_si(cursor) se evalúa ya con el bloqueo de escritura tomado: si devuelve un
+    motivo, la tabla local no se toca (hay cambios locales que la hoja todavía no tiene).
+    Las tablas de TABLAS_HIDRATACION_FUSION no se vacían: las filas de la hoja se agregan
+    a las locales (contenido inmutable por clave).
+    Devuelve {'cargadas': n, 'fallidas': [números de fila en la hoja], 'conservada': motivo o None}.
+    """
+    c = conn_local.cursor()
+    c.execute(f"PRAGMA table_info({tabla_nombre})")
+    info = {col[1]: col for col in c.fetchall()}
+    
+    # Solo columnas que existen localmente (la hoja puede tener columnas antiguas)
+    indices = [i for i, nombre in enumerate(encabezados) if nombre in info]
+    columnas = [encabezados[i] for i in indices]
+    ignoradas = [nombre for nombre in encabezados if nombre not in info]
+    if ignoradas:
+        print(f"⚠️ Columnas de la hoja {tabla_nombre} ignoradas: {ignoradas}")
+    if not columnas:
+        return {'cargadas': 0, 'fallidas': list(range(2, len(filas) + 2))}
+    
+    convertidores = [
+        _convertidor_columna(info[col][2], info[col][5] == 1 and 'INT' in (info[col][2] or '').upper())
+        for col in columnas
+    ]
+    clave = next((col for col in columnas if info[col][5] == 1), None)
+    
+    fallidas = []
+    
+    def filas_convertidas():
+        """Generador de tuplas (_fila, valores...) para executemany"""
+        for n, fila in enumerate(filas, start=2):
+            try:
+                yield (n,) + tuple(
+                    conv(fila[i] if i < len(fila) else '')
+                    for i, conv in zip(indices, convertidores)
+                )
+            except (ValueError, TypeError):
+                fallidas.append(n)
+    
+    # Tabla temporal con los mismos tipos declarados (misma afinidad) pero sin restricciones
+    staging = f"_carga_{tabla_nombre}"
+    lista_columnas = ', '.join(columnas)
+    c.execute(f"DROP TABLE IF EXISTS temp.{staging}")
+    c.execute(f"CREATE TEMP TABLE {staging} (_fila INTEGER, " +
+              ', '.join(f"{col} {info[col][2]}" for col in columnas) + ")")
+    c.executemany(
+        f"INSERT INTO temp.{staging} (_fila, {lista_columnas}) VALUES ({', '.join(['?'] * (len(columnas) + 1))})",
+        filas_convertidas()
+    )
+    preparadas = len(filas) - len(fallidas)
+    conn_local.commit()
     
     try:
-        # Obtener hoja principal
-        spreadsheet = get_spreadsheet()
-        if not spreadsheet:
-            return True  # No es error si no hay hoja
+        # Intercambio atómico: si algo falla, la tabla local queda como estaba. BEGIN IMMEDIATE
+        # toma el bloqueo de escritura antes de revisar si hay cambios locales sin subir, así
+        # ningún formulario puede escribir entre la revisión y el DELETE.
+        c.execute("BEGIN IMMEDIATE")
+        motivo = conservar_si(c) if conservar_si else None
+        if motivo:
+            conn_local.rollback()
+            return {'cargadas': 0, 'fallidas': [], 'conservada': motivo}
+        
+        fusion = tabla_nombre in TABLAS_HIDRATACION_FUSION
+        if not fusion:
+            c.execute(f"DELETE FROM {tabla_nombre}")
+        c.execute(f'''
+            INSERT OR IGNORE INTO {tabla_nombre} ({lista_columnas})
+            SELECT {lista_columnas} FROM temp.{staging} ORDER BY _fila
+        ''')
+        cargadas = c.rowcount
+        if fusion and clave:
+            # Cargadas = filas de la hoja presentes localmente (nuevas o ya existentes)
+            c.execute(f'''
+                SELECT COUNT(*) FROM temp.{staging} s
+                WHERE EXISTS (SELECT 1 FROM {tabla_nombre} t WHERE t.{clave} = s.{clave})
+            ''')
+            cargadas = c.fetchone()[0]
+        
+        if cargadas < preparadas:
+            # Filas descartadas por restricciones (duplicados, NOT NULL, CHECK)
+            if clave:
+                # En la fusión una clave que ya existía localmente tiene el mismo contenido
+                condicion = '1' if fusion else ' AND '.join(f"t.{col} IS s.{col}" for col in columnas)
+                # Una clave entera vacía en la hoja recibe un id autoincremental al insertar:
+                # esas filas se buscan por el resto de las columnas
+                sin_clave = ' AND '.join(f"t.{col} IS s.{col}" for col in columnas if col != clave) or '1'
+                c.execute(f'''
+                    SELECT s._fila FROM temp.{staging} s
+                    WHERE (s.{clave} IS NOT NULL AND NOT EXISTS (
+                        SELECT 1 FROM {tabla_nombre} t WHERE t.{clave} = s.{clave} AND {condicion}
+                    )) OR (s.{clave} IS NULL AND NOT EXISTS (
+                        SELECT 1 FROM {tabla_nombre} t WHERE {sin_clave}
+                    ))
+                ''')
+                fallidas.extend(fila[0] for fila in c.fetchall())
+            else:
+                print(f"⚠️ {preparadas - cargadas} filas de {tabla_nombre} descartadas por restricciones")
+        
+        # Los códigos creados en otras instancias llegan con la hoja: las secuencias no deben quedar atrás
+        if _existe_tabla(c, 'secuencias'):
+            sembrar_secuencias(c)
+        # Hojas antiguas todavía traen las imágenes en base64
+        if _existe_tabla(c, 'adjuntos'):
+            externalizar_adjuntos(c, [tabla_nombre])
+            if tabla_nombre in ('equipos', 'equipo_informes'):
+                desempacar_informes_json(c)
         
+        conn_local.commit()
+    except Exception:
+        conn_local.rollback()
+        raise
+    finally:
+        c.execute(f"DROP TABLE IF EXISTS temp.{staging}")
+    
+    return {'cargadas': cargadas, 'fallidas': sorted(fallidas), 'conservada': None}
+
+def cargar_desde_google_sheets(tabla_nombre, conn_local, recursos=None, conservar_si=None):
+    """Cargar datos desde worksheet específica (recursos explícitos para hilos sin session_state).
+    
+    Devuelve True si la tabla quedó cargada (o no había hoja), False si hubo error y
+    'conservada' si conservar_si encontró cambios locales y la tabla no se reemplazó.
+    """
+    if recursos is None:
+        if not st.session_state.use_google_sheets:
+            return True  # Devuelve True para continuar sin error
+        recursos = obtener_recursos_gs()
+    
+    try:
         # Intentar obtener worksheet
         try:
-            worksheet = spreadsheet.worksheet(tabla_nombre)
-        except:
+            worksheet = worksheet_gs(recursos, tabla_nombre, crear=False)
+        except gspread.exceptions.WorksheetNotFound:
             print(f"ℹ️ Worksheet {tabla_nombre} no existe aún")
             return True  # No es error si no existe
         
+        if not worksheet:
+            return True  # No es error si no hay hoja
+        
         # Leer datos
         datos = worksheet.get_all_values()
         
@@ -268,101 +791,1604 @@ def cargar_desde_google_sheets(tabla_nombre, conn_local):
             print(f"ℹ️ Worksheet {tabla_nombre} vacía o solo tiene encabezados")
             return True
         
-        # Convertir a DataFrame
+        # Separar encabezados y filas
         encabezados = datos[0]
         filas = datos[1:]
         
         if not filas:
             return True
         
-        df = pd.DataFrame(filas, columns=encabezados)
+        resultado = cargar_filas_en_bloque(conn_local, tabla_nombre, encabezados, filas, conservar_si)
+        if resultado['conservada']:
+            print(f"ℹ️ {tabla_nombre}: {resultado['conservada']}, se conserva la copia local")
+            return 'conservada'
+        if resultado['fallidas']:
+            print(f"⚠️ Filas de la hoja {tabla_nombre} no cargadas: {resultado['fallidas'][:50]}")
+        print(f"✅ {resultado['cargadas']}/{len(filas)} registros cargados desde {tabla_nombre}")
+        
+        # Sembrar manifiesto: la hoja y la tabla local quedan idénticas
+        columnas_locales, columna_clave = _columnas_tabla(conn_local, tabla_nombre)
+        locales = conn_local.execute(f"SELECT COUNT(*) FROM {tabla_nombre}").fetchone()[0]
+        if (resultado['cargadas'] == len(filas) == locales and encabezados == columnas_locales
+                and columna_clave in encabezados):
+            idx_clave = encabezados.index(columna_clave)
+            registrar_manifiesto_desde_hoja(conn_local, tabla_nombre,
+                                            [fila[idx_clave] if idx_clave < len(fila) else '' for fila in filas])
+        else:
+            reiniciar_manifiesto(conn_local, tabla_nombre)
+        return True
+        
+    except Exception as e:
+        invalidar_recursos_gs(recursos, e, tabla_nombre)
+        print(f"⚠️ Error cargando {tabla_nombre}: {e}")
+        return False
+
+def sincronizar_tablas_en_paralelo(recursos, tareas, al_progresar=None):
+    """Sincronizar varias tablas a la vez en un pool pequeño de hilos.
+    
+    tareas: lista de (tabla, modo). Cada hilo abre su propia conexión SQLite y todos
+    comparten el limitador de la API. al_progresar(tabla, ok, segundos, hechas, total)
+    se llama en el hilo que invoca, a medida que termina cada tabla.
+    Devuelve {tabla: (ok, segundos, error)}.
+    """
+    def sincronizar_una(tabla, modo):
+        inicio = time.monotonic()
+        conn = nueva_conexion(TABLAS_SYNC[tabla])
+        try:
+            ok, error = sincronizar_tabla_en_hoja(recursos, tabla, conn, modo), None
+        except Exception as e:
+            ok, error = False, e
+        finally:
+            conn.close()
+        return ok, time.monotonic() - inicio, error
+    
+    inicio = time.monotonic()
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=SYNC_HILOS, thread_name_prefix="sync_tabla") as pool:
+        futuros = {pool.submit(sincronizar_una, tabla, modo): tabla for tabla, modo in tareas}
+        for hechas, futuro in enumerate(as_completed(futuros), start=1):
+            tabla = futuros[futuro]
+            ok, segundos, error = futuro.result()
+            resultados[tabla] = (ok, segundos, error)
+            print(f"{'✅' if ok else '❌'} [{hechas}/{len(tareas)}] {tabla} en {segundos:.1f}s"
+                  + (f": {error}" if error else ""))
+            if al_progresar:
+                al_progresar(tabla, ok, segundos, hechas, len(tareas))
+    
+    total = time.monotonic() - inicio
+    exitos = sum(1 for ok, _, _ in resultados.values() if ok)
+    recursos['resumen_sync'] = {
+        'fecha': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'total_segundos': total,
+        'exitos': exitos,
+        'tablas': {tabla: (ok, segundos) for tabla, (ok, segundos, _) in resultados.items()}
+    }
+    detalle = ', '.join(f"{tabla} {segundos:.1f}s" for tabla, (_, segundos, _) in resultados.items())
+    print(f"⏱️ Sincronización: {exitos}/{len(tareas)} tablas en {total:.1f}s ({detalle})")
+    return resultados
+
+# ===============================CONFIGURACIÓN DE RUTAS================================
+def get_database_path(db_name):
+    """Obtiene la ruta correcta para la base de datos"""
+    if EN_STREAMLIT_CLOUD:
+        # En Streamlit Cloud, usar /tmp para persistencia temporal
+        temp_dir = Path("/tmp")
+        temp_dir.mkdir(exist_ok=True)
+        return str(temp_dir / db_name)
+    else:
+        # Localmente, usar carpeta data/
+        data_dir = Path("data")
+        data_dir.mkdir(exist_ok=True)
+        return str(data_dir / db_name)
+
+# ===============================ALMACENAMIENTO: BASE ÚNICA + POOL DE CONEXIONES================================
+# Con USAR_BASE_UNICA todas las tablas viven en un solo archivo en modo WAL; los nombres
+# lógicos ('avisos.db', ...) se siguen usando y se resuelven al mismo archivo.
+USAR_BASE_UNICA = True
+NOMBRE_BASE_UNICA = 'mantenimiento.db'
+ARCHIVOS_LEGADOS = ['avisos.db', 'ot_unicas.db', 'ot_sufijos.db', 'equipos.db', 'colaboradores.db', 'sync_outbox.db']
+
+PRAGMAS_CONEXION = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-20000",      # ~20 MB de caché de páginas
+    "PRAGMA mmap_size=268435456",    # 256 MB mapeados en memoria
+    "PRAGMA temp_store=MEMORY"
+]
+
+def ruta_base(db_name):
+    """Ruta física de una base lógica según el modo de almacenamiento"""
+    return get_database_path(NOMBRE_BASE_UNICA if USAR_BASE_UNICA else db_name)
+
+def archivos_base():
+    """Rutas físicas distintas que usa el sistema"""
+    if USAR_BASE_UNICA:
+        return [get_database_path(NOMBRE_BASE_UNICA)]
+    return [get_database_path(db_name) for db_name in ARCHIVOS_LEGADOS]
+
+def nueva_conexion(db_name):
+    """Abrir una conexión con los PRAGMAs de rendimiento aplicados"""
+    conn = sqlite3.connect(ruta_base(db_name), check_same_thread=False, timeout=30)
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    return conn
+
+@st.cache_resource
+def obtener_pool_conexiones():
+    """Pool por proceso: una conexión por hilo y archivo; las de hilos terminados se reutilizan"""
+    return {
+        'lock': threading.Lock(),
+        'por_hilo': {},   # (ident_hilo, ruta) -> conexión
+        'libres': {}      # ruta -> [conexiones sin dueño]
+    }
+
+def conexion_base(db_name):
+    """Conexión del hilo actual para una base lógica (cada ejecución del script corre en su hilo)"""
+    pool = obtener_pool_conexiones()
+    ruta = ruta_base(db_name)
+    clave = (threading.get_ident(), ruta)
+    
+    with pool['lock']:
+        conn = pool['por_hilo'].get(clave)
+        if conn is not None:
+            return conn
+        
+        # Devolver al pool las conexiones de hilos que ya terminaron
+        vivos = {hilo.ident for hilo in threading.enumerate()}
+        for clave_hilo in [k for k in pool['por_hilo'] if k[0] not in vivos]:
+            pool['libres'].setdefault(clave_hilo[1], []).append(pool['por_hilo'].pop(clave_hilo))
+        
+        libres = pool['libres'].get(ruta)
+        conn = libres.pop() if libres else None
+    
+    if conn is not None:
+        # Una ejecución interrumpida pudo dejar una transacción abierta
+        conn.rollback()
+    else:
+        conn = nueva_conexion(db_name)
+    
+    with pool['lock']:
+        pool['por_hilo'][clave] = conn
+    return conn
+
+@contextmanager
+def unidad_de_trabajo(*db_names):
+    """Agrupar escrituras sobre varias tablas en una sola transacción (un commit, un fsync).
+    
+    Uso: with unidad_de_trabajo('ot_unicas.db', 'avisos.db') as c: c.execute(...)
+    Si ocurre un error se revierte todo. Con la base única basta una conexión; en el modo
+    de varios archivos se adjuntan (ATTACH) y los nombres de tabla sin prefijo se resuelven
+    solos. Nota: con WAL, SQLite solo garantiza atomicidad por archivo en ese modo.
+    """
+    rutas = []
+    for db_name in db_names:
+        ruta = ruta_base(db_name)
+        if ruta not in rutas:
+            rutas.append(ruta)
+    
+    if len(rutas) == 1:
+        conn = conexion_base(db_names[0])
+        propia = False
+    else:
+        conn = nueva_conexion(db_names[0])
+        for i, ruta in enumerate(rutas[1:], start=1):
+            conn.execute(f"ATTACH DATABASE ? AS uow_{i}", (ruta,))
+        propia = True
+    
+    if conn.in_transaction:
+        conn.commit()
+    
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        yield c
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if propia:
+            conn.close()
+
+@st.cache_resource
+def migrar_archivos_a_base_unica():
+    """Copiar (una sola vez) los datos de los cinco archivos anteriores a la base única"""
+    if not USAR_BASE_UNICA:
+        return False
+    
+    conn = nueva_conexion(NOMBRE_BASE_UNICA)
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            clave TEXT PRIMARY KEY,
+            valor TEXT
+        )
+    ''')
+    c.execute("SELECT valor FROM meta WHERE clave = 'migracion_base_unica'")
+    if c.fetchone():
+        conn.close()
+        return False
+    
+    migrados = []
+    for db_name in ARCHIVOS_LEGADOS:
+        ruta = get_database_path(db_name)
+        if not Path(ruta).exists():
+            continue
+        
+        try:
+            c.execute("ATTACH DATABASE ? AS legado", (ruta,))
+            c.execute("SELECT name FROM legado.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            tablas = [fila[0] for fila in c.fetchall()]
+            
+            for tabla in tablas:
+                c.execute(f"PRAGMA main.table_info({tabla})")
+                destino = [col[1] for col in c.fetchall()]
+                if not destino:
+                    continue
+                c.execute(f"PRAGMA legado.table_info({tabla})")
+                comunes = [col[1] for col in c.fetchall() if col[1] in destino]
+                if not comunes:
+                    continue
+                
+                # Los init_*_db ya sembraron filas por defecto (p. ej. el administrador con la
+                # contraseña inicial); la fila del archivo anterior es la vigente y las reemplaza
+                columnas = ', '.join(comunes)
+                c.execute(f"INSERT OR REPLACE INTO main.{tabla} ({columnas}) SELECT {columnas} FROM legado.{tabla}")
+                print(f"💾 Migrados {c.rowcount} registros de {db_name}:{tabla}")
+                if tabla == 'colaboradores':
+                    # Si el administrador por defecto se había eliminado, no reaparece
+                    c.execute('''
+                        DELETE FROM main.colaboradores
+                        WHERE codigo_id NOT IN (SELECT codigo_id FROM legado.colaboradores)
+                          AND EXISTS (SELECT 1 FROM legado.colaboradores)
+                    ''')
+            
+            conn.commit()
+            migrados.append(db_name)
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error migrando {db_name}: {e}")
+        finally:
+            c.execute("DETACH DATABASE legado")
+    
+    c.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('migracion_base_unica', ?)",
+              (json.dumps({'fecha': datetime.now().isoformat(), 'archivos': migrados}),))
+    conn.commit()
+    conn.close()
+    if migrados:
+        print(f"✅ Migración a {NOMBRE_BASE_UNICA} completada: {migrados}")
+    return True
+
+# ===============================ADJUNTOS (ALMACÉN POR CONTENIDO)================================
+# Imágenes y documentos se guardan una sola vez en disco, con el SHA-256 del contenido como
+# nombre (adjuntos/ab/abcdef...). Las filas solo guardan la referencia (columnas *_ref) y la
+# tabla adjuntos registra el tamaño; el mismo archivo subido dos veces ocupa un solo lugar.
+# Los archivos subidos tienen un tamaño máximo por tipo (LIMITES_ADJUNTOS_MB, cada valor se
+# puede cambiar con la variable de entorno LIMITE_ADJUNTO_<TIPO>_MB); server.maxUploadSize en
+# .streamlit/config.toml sigue siendo el tope global del navegador.
+#
+# En Streamlit Cloud el disco (/tmp) se pierde al reiniciar y Google Sheets es el único
+# almacenamiento durable: cada adjunto se copia en partes base64 a la tabla adjuntos_contenido
+# (hoja del mismo nombre; una celda admite 50.000 caracteres) y, si el archivo falta en disco,
+# se reconstruye desde ahí. Los *_datos e informes_json que llegan de hojas antiguas no se
+# vacían hasta que su contenido está en la hoja adjuntos_contenido (liberar_adjuntos_respaldados).
+TAMANO_BLOQUE_ADJUNTO = 1024 * 1024
+BYTES_POR_PARTE_ADJUNTO = 33750   # 45.000 caracteres en base64
+BASE_ADJUNTOS_CONTENIDO = 'avisos.db'
+
+LIMITES_ADJUNTOS_MB = {'pdf': 50, 'imagen': 15, 'otro': 20}
+TIPOS_POR_EXTENSION = {'.pdf': 'pdf', '.png': 'imagen', '.jpg': 'imagen', '.jpeg': 'imagen', '.webp': 'imagen'}
+
+# (tabla, columna BLOB anterior, columna de referencia)
+COLUMNAS_ADJUNTOS = [
+    ('avisos', 'imagen_aviso_datos', 'imagen_aviso_ref'),
+    ('avisos', 'imagen_final_datos', 'imagen_final_ref'),
+    ('ot_unicas', 'imagen_final_datos', 'imagen_final_ref'),
+    ('ot_sufijos', 'imagen_final_datos', 'imagen_final_ref'),
+    ('equipos', 'especificaciones_tecnica_datos', 'especificaciones_tecnica_ref')
+]
+
+def directorio_adjuntos():
+    """Carpeta raíz del almacén de adjuntos (junto a las bases de datos)"""
+    directorio = Path(get_database_path('adjuntos'))
+    directorio.mkdir(exist_ok=True)
+    return directorio
+
+def ruta_adjunto(ref):
+    """Ruta en disco de un adjunto (se reconstruye desde adjuntos_contenido si falta), o None"""
+    if not ref or not re.fullmatch(r'[0-9a-f]{64}', str(ref)):
+        return None
+    ruta = directorio_adjuntos() / ref[:2] / ref
+    if ruta.exists() or restaurar_adjunto(ref):
+        return ruta
+    return None
+
+def tipo_adjunto(archivo):
+    """Tipo de un archivo subido para sus límites: 'pdf', 'imagen' u 'otro'"""
+    extension = Path(getattr(archivo, 'name', '') or '').suffix.lower()
+    if extension in TIPOS_POR_EXTENSION:
+        return TIPOS_POR_EXTENSION[extension]
+    mime = getattr(archivo, 'type', '') or ''
+    if mime == 'application/pdf':
+        return 'pdf'
+    return 'imagen' if mime.startswith('image/') else 'otro'
+
+def limite_adjunto(tipo):
+    """Tamaño máximo en bytes para un tipo de adjunto (la variable de entorno tiene prioridad)"""
+    megas = os.environ.get(f"LIMITE_ADJUNTO_{tipo.upper()}_MB") or LIMITES_ADJUNTOS_MB.get(tipo, LIMITES_ADJUNTOS_MB['otro'])
+    try:
+        return int(float(megas) * 1024 * 1024)
+    except ValueError:
+        print(f"⚠️ Límite inválido para adjuntos de tipo {tipo}: {megas}")
+        return LIMITES_ADJUNTOS_MB['otro'] * 1024 * 1024
+
+def validar_adjuntos(*archivos):
+    """Mensajes de error para los archivos subidos que superan su límite (lista vacía si todo bien)"""
+    errores = []
+    for archivo in archivos:
+        if archivo is None or getattr(archivo, 'size', None) is None:
+            continue
+        tipo = tipo_adjunto(archivo)
+        limite = limite_adjunto(tipo)
+        if archivo.size > limite:
+            errores.append(f"El archivo '{archivo.name}' pesa {archivo.size / 1024 / 1024:.1f} MB; "
+                           f"el máximo para {tipo} es {limite / 1024 / 1024:.0f} MB")
+    return errores
+
+def escribir_adjunto(archivo, limite=None):
+    """Escribir un adjunto (bytes o archivo subido) en el almacén y devolver (ref SHA-256, tamaño).
+    
+    El contenido se copia por bloques a un temporal mientras se calcula el hash y luego se
+    mueve a su ruta definitiva (os.replace es atómico); si ya existía, no se duplica.
+    Los archivos subidos (con nombre) se cortan al superar el límite de su tipo con ValueError;
+    los bytes generados por la aplicación solo se limitan si se pasa limite.
+    """
+    if isinstance(archivo, (bytes, bytearray, memoryview)):
+        archivo = BytesIO(bytes(archivo))
+    elif limite is None and getattr(archivo, 'name', None):
+        limite = limite_adjunto(tipo_adjunto(archivo))
+    archivo.seek(0)
+    
+    directorio = directorio_adjuntos()
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix='.subida-')
+    sha = hashlib.sha256()
+    tamano = 0
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE_ADJUNTO), b''):
+                tamano += len(bloque)
+                if limite is not None and tamano > limite:
+                    raise ValueError(f"El adjunto supera el máximo de {limite / 1024 / 1024:.0f} MB")
+                sha.update(bloque)
+                destino.write(bloque)
+        ref = sha.hexdigest()
+        ruta = directorio / ref[:2] / ref
+        if ruta.exists():
+            os.remove(temporal)
+        else:
+            ruta.parent.mkdir(exist_ok=True)
+            os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return ref, tamano
+
+def registrar_adjunto(c, ref, tamano):
+    """Registrar en la base un adjunto ya escrito con escribir_adjunto (y su respaldo para la hoja)"""
+    c.execute("INSERT OR IGNORE INTO adjuntos (sha256, tamano) VALUES (?, ?)", (ref, tamano))
+    respaldar_adjunto(c, ref)
+    return ref
+
+def crear_adjuntos_contenido(c):
+    """Tabla con el contenido de los adjuntos en partes base64 (se sincroniza con su hoja)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS adjuntos_contenido (
+            id TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            parte INTEGER NOT NULL,
+            partes INTEGER NOT NULL,
+            datos_base64 TEXT NOT NULL,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_adjuntos_contenido_sha ON adjuntos_contenido(sha256, parte)")
+
+def respaldar_adjunto(c, ref):
+    """Copiar un adjunto del disco a adjuntos_contenido si aún no está; True si se copió.
+    
+    Con varios archivos la tabla vive junto a avisos: si no es visible en la transacción
+    de c se escribe con una conexión propia (una copia huérfana no hace daño).
+    """
+    ruta = directorio_adjuntos() / ref[:2] / ref
+    conn_propia = None
+    try:
+        c.execute("SELECT 1 FROM adjuntos_contenido LIMIT 0")
+    except sqlite3.OperationalError:
+        conn_propia = nueva_conexion(BASE_ADJUNTOS_CONTENIDO)
+        crear_adjuntos_contenido(conn_propia.cursor())
+        c = conn_propia.cursor()
+    try:
+        c.execute("SELECT 1 FROM adjuntos_contenido WHERE id = ?", (f"{ref}:0",))
+        if c.fetchone() or not ruta.exists():
+            return False
+        partes = max(1, -(-ruta.stat().st_size // BYTES_POR_PARTE_ADJUNTO))
+        with open(ruta, 'rb') as archivo:
+            for parte in range(partes):
+                c.execute('''
+                    INSERT OR IGNORE INTO adjuntos_contenido (id, sha256, parte, partes, datos_base64)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (f"{ref}:{parte}", ref, parte, partes,
+                      base64.b64encode(archivo.read(BYTES_POR_PARTE_ADJUNTO)).decode('ascii')))
+        if conn_propia:
+            conn_propia.commit()
+        return True
+    finally:
+        if conn_propia:
+            conn_propia.close()
+
+def restaurar_adjunto(ref):
+    """Reconstruir en disco un adjunto desde adjuntos_contenido; True si quedó disponible"""
+    try:
+        c = conexion_base(BASE_ADJUNTOS_CONTENIDO).cursor()
+        c.execute('''
+            SELECT parte, partes, datos_base64 FROM adjuntos_contenido
+            WHERE sha256 = ? ORDER BY parte
+        ''', (ref,))
+        filas = c.fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo leer el respaldo del adjunto {ref[:12]}: {e}")
+        return False
+    if not filas or len(filas) != filas[0][1] or any(parte != i for i, (parte, _, _) in enumerate(filas)):
+        return False
+    try:
+        restaurado, _ = escribir_adjunto(b''.join(base64.b64decode(datos) for _, _, datos in filas))
+    except (ValueError, OSError) as e:
+        print(f"⚠️ No se pudo restaurar el adjunto {ref[:12]}: {e}")
+        return False
+    if restaurado != ref:
+        print(f"⚠️ El respaldo del adjunto {ref[:12]} no coincide con su SHA-256")
+        return False
+    print(f"💾 Adjunto {ref[:12]} restaurado desde adjuntos_contenido")
+    return True
+
+def respaldar_almacen_adjuntos(c):
+    """Copiar a adjuntos_contenido los adjuntos registrados que todavía no tienen respaldo"""
+    if _existe_tabla(c, 'avisos'):
+        crear_adjuntos_contenido(c)
+    init_adjuntos(c)
+    c.execute("SELECT sha256 FROM adjuntos")
+    respaldados = sum(1 for (ref,) in c.fetchall() if respaldar_adjunto(c, ref))
+    if respaldados:
+        print(f"💾 {respaldados} adjuntos copiados a adjuntos_contenido")
+    return respaldados
+
+def guardar_adjunto(c, archivo, limite=None):
+    """Guardar un adjunto (bytes o archivo subido) y devolver su referencia SHA-256"""
+    if archivo is None:
+        return None
+    return registrar_adjunto(c, *escribir_adjunto(archivo, limite))
+
+def init_adjuntos(c):
+    """Tabla de adjuntos y columnas de referencia en las tablas que existan en la conexión"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS adjuntos (
+            sha256 TEXT PRIMARY KEY,
+            tamano INTEGER NOT NULL,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    for tabla, _, columna_ref in COLUMNAS_ADJUNTOS:
+        if _existe_tabla(c, tabla):
+            _agregar_columna_si_falta(c, tabla, columna_ref, 'TEXT')
+
+def externalizar_adjuntos(c, tablas=None):
+    """Pasar al almacén los BLOB que aún estén dentro de las filas y completar su referencia.
+    
+    La columna *_datos no se vacía aquí: si la fila vino de la hoja, esa es la única copia
+    durable hasta que el respaldo suba a adjuntos_contenido (ver liberar_adjuntos_respaldados).
+    Se procesa por lotes pequeños para no cargar todas las imágenes en memoria a la vez.
+    Devuelve la cantidad de referencias nuevas o corregidas.
+    """
+    init_adjuntos(c)
+    movidos = 0
+    for tabla, columna_datos, columna_ref in COLUMNAS_ADJUNTOS:
+        if (tablas and tabla not in tablas) or not _existe_tabla(c, tabla):
+            continue
+        c.execute(f"PRAGMA table_info({tabla})")
+        if columna_datos not in [col[1] for col in c.fetchall()]:
+            continue
+        ultimo_rowid = 0
+        while True:
+            c.execute(f'''
+                SELECT rowid, {columna_datos}, {columna_ref} FROM {tabla}
+                WHERE rowid > ? AND {columna_datos} IS NOT NULL
+                ORDER BY rowid LIMIT 50
+            ''', (ultimo_rowid,))
+            lote = c.fetchall()
+            if not lote:
+                break
+            for rowid, datos, ref_actual in lote:
+                ultimo_rowid = rowid
+                if isinstance(datos, str):
+                    datos = datos.encode('utf-8')
+                ref = guardar_adjunto(c, datos)
+                if ref != ref_actual:
+                    c.execute(f"UPDATE {tabla} SET {columna_ref} = ? WHERE rowid = ?", (ref, rowid))
+                    movidos += 1
+    if movidos:
+        print(f"💾 {movidos} adjuntos pasados al almacén")
+    return movidos
+
+def desempacar_informes_json(c):
+    """Pasar los informes guardados en equipos.informes_json (base64) a equipo_informes.
+    
+    Se recorre un equipo a la vez y el contenido va al almacén de adjuntos. informes_json
+    se conserva hasta que equipo_informes y el respaldo estén en la hoja
+    (ver liberar_adjuntos_respaldados). Devuelve la cantidad de informes pasados.
+    """
+    if not (_existe_tabla(c, 'equipos') and _existe_tabla(c, 'equipo_informes')):
+        return 0
+    init_adjuntos(c)
+    movidos = 0
+    ultimo_rowid = 0
+    while True:
+        c.execute('''
+            SELECT rowid, codigo_equipo, informes_json FROM equipos
+            WHERE rowid > ? AND informes_json IS NOT NULL AND informes_json NOT IN ('', '[]')
+            ORDER BY rowid LIMIT 1
+        ''', (ultimo_rowid,))
+        fila = c.fetchone()
+        if not fila:
+            break
+        ultimo_rowid, codigo_equipo, informes_json = fila
+        for informe in _informes_de_json(informes_json, codigo_equipo):
+            datos = base64.b64decode(informe['datos_base64']) if informe.get('datos_base64') else None
+            ref = guardar_adjunto(c, datos)
+            c.execute('''
+                INSERT OR IGNORE INTO equipo_informes
+                (codigo_equipo, nombre, tipo, tamano, adjunto_ref, fecha_agregado)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (codigo_equipo, informe['nombre'], informe.get('tipo', 'application/octet-stream'),
+                  len(datos) if datos is not None else None, ref, informe.get('fecha_agregado')))
+            movidos += c.rowcount
+    if movidos:
+        print(f"💾 {movidos} informes de equipos pasados a equipo_informes")
+    return movidos
+
+def _informes_de_json(informes_json, codigo_equipo):
+    """Informes válidos (con nombre) de un informes_json; lista vacía si no se puede leer"""
+    try:
+        informes = json.loads(informes_json)
+    except json.JSONDecodeError:
+        print(f"⚠️ informes_json inválido en el equipo {codigo_equipo}; se deja sin cambios")
+        return []
+    return [informe for informe in (informes if isinstance(informes, list) else [])
+            if isinstance(informe, dict) and informe.get('nombre')]
+
+def liberar_adjuntos_respaldados():
+    """Vaciar *_datos e informes_json cuyo contenido ya está en la hoja adjuntos_contenido.
+    
+    Un adjunto está respaldado cuando todas sus partes figuran en el manifiesto de
+    sincronización de adjuntos_contenido. Devuelve las tablas que hay que encolar: las
+    modificadas y equipo_informes si tiene informes desempacados que la hoja aún no tiene.
+    """
+    conn = nueva_conexion(BASE_ADJUNTOS_CONTENIDO)
+    try:
+        respaldados = {ref for (ref,) in conn.execute('''
+            SELECT a.sha256 FROM adjuntos_contenido a
+            LEFT JOIN sync_manifiesto m ON m.tabla = 'adjuntos_contenido' AND m.clave = a.id
+            GROUP BY a.sha256
+            HAVING COUNT(*) = MAX(a.partes) AND COUNT(m.clave) = COUNT(*)
+        ''')}
+    finally:
+        conn.close()
+    modificadas = set()
+    for tabla, columna_datos, columna_ref in COLUMNAS_ADJUNTOS:
+        with unidad_de_trabajo(TABLAS_SYNC[tabla]) as c:
+            if not _existe_tabla(c, tabla):
+                continue
+            c.execute(f"PRAGMA table_info({tabla})")
+            if columna_datos not in [col[1] for col in c.fetchall()]:
+                continue
+            c.execute(f"SELECT rowid, {columna_ref} FROM {tabla} WHERE {columna_datos} IS NOT NULL")
+            filas = [(rowid,) for rowid, ref in c.fetchall() if ref and ref in respaldados]
+            c.executemany(f"UPDATE {tabla} SET {columna_datos} = NULL WHERE rowid = ?", filas)
+            if filas:
+                modificadas.add(tabla)
+    
+    with unidad_de_trabajo('equipos.db') as c:
+        if _existe_tabla(c, 'equipo_informes'):
+            c.execute("SELECT clave FROM sync_manifiesto WHERE tabla = 'equipo_informes'")
+            subidos = {clave for (clave,) in c.fetchall()}
+            c.execute('''
+                SELECT rowid, codigo_equipo, informes_json FROM equipos
+                WHERE informes_json IS NOT NULL AND informes_json NOT IN ('', '[]')
+            ''')
+            for rowid, codigo_equipo, informes_json in c.fetchall():
+                c.execute("SELECT nombre, id, adjunto_ref FROM equipo_informes WHERE codigo_equipo = ?",
+                          (codigo_equipo,))
+                registrados = {nombre: (str(id_informe), ref) for nombre, id_informe, ref in c.fetchall()}
+                informes = [registrados.get(informe['nombre'])
+                            for informe in _informes_de_json(informes_json, codigo_equipo)]
+                if any(informe and informe[0] not in subidos for informe in informes):
+                    modificadas.add('equipo_informes')
+                elif informes and all(informe and informe[1] in respaldados | {None} for informe in informes):
+                    c.execute("UPDATE equipos SET informes_json = '[]' WHERE rowid = ?", (rowid,))
+                    modificadas.add('equipos')
+    
+    if modificadas - {'equipo_informes'}:
+        print(f"💾 Contenido ya respaldado en la hoja liberado de: {', '.join(sorted(modificadas))}")
+    return modificadas
+
+# ===============================IMÁGENES (MINIATURAS Y VERSIÓN LIMITADA)================================
+# Las fotos de avisos y culminaciones se guardan en dos versiones dentro del almacén de adjuntos:
+# una limitada a LADO_MAXIMO_IMAGEN (la "completa", orientada según EXIF) y una miniatura JPEG
+# pequeña para las galerías. Las listas solo muestran miniaturas; la versión completa se lee
+# de disco cuando el usuario la pide. Sin Pillow, o si la imagen no se puede decodificar, se
+# guarda el archivo original tal cual y la miniatura queda vacía.
+try:
+    from PIL import Image, ImageOps
+    PIL_DISPONIBLE = True
+except ImportError:
+    PIL_DISPONIBLE = False
+    print("⚠️ Pillow no está instalado: las imágenes se guardarán sin miniatura ni redimensión")
+
+LADO_MAXIMO_IMAGEN = 1920
+CALIDAD_IMAGEN = 85
+LADO_MINIATURA = 320
+CALIDAD_MINIATURA = 70
+ANCHO_GALERIA = 160  # ancho en pantalla de cada miniatura
+
+# (tabla, columna de referencia de la imagen, columna de referencia de la miniatura)
+COLUMNAS_MINIATURAS = [
+    ('avisos', 'imagen_aviso_ref', 'imagen_aviso_miniatura_ref'),
+    ('avisos', 'imagen_final_ref', 'imagen_final_miniatura_ref'),
+    ('ot_unicas', 'imagen_final_ref', 'imagen_final_miniatura_ref'),
+    ('ot_sufijos', 'imagen_final_ref', 'imagen_final_miniatura_ref')
+]
+
+def _codificar_jpeg(imagen, lado, calidad):
+    """Reducir la imagen para que quepa en lado x lado y devolverla como bytes JPEG"""
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado), Image.LANCZOS)
+    if copia.mode in ('RGBA', 'LA', 'P'):
+        copia = copia.convert('RGBA')
+        fondo = Image.new('RGB', copia.size, (255, 255, 255))
+        fondo.paste(copia, mask=copia.getchannel('A'))
+        copia = fondo
+    elif copia.mode != 'RGB':
+        copia = copia.convert('RGB')
+    salida = BytesIO()
+    copia.save(salida, format='JPEG', quality=calidad, optimize=True, progressive=True)
+    return salida.getvalue()
+
+def procesar_imagen(archivo):
+    """Devolver (versión limitada, miniatura) en bytes, o None si no se puede procesar.
+    
+    Un JPEG que ya cabe en LADO_MAXIMO_IMAGEN y no necesita rotarse se conserva sin recomprimir.
+    """
+    if not PIL_DISPONIBLE or archivo is None:
+        return None
+    if isinstance(archivo, (bytes, bytearray, memoryview)):
+        archivo = BytesIO(bytes(archivo))
+    try:
+        archivo.seek(0)
+        with Image.open(archivo) as original:
+            formato = original.format
+            rotada = original.getexif().get(0x0112, 1) != 1  # etiqueta EXIF Orientation
+            imagen = ImageOps.exif_transpose(original)
+            if formato == 'JPEG' and not rotada and max(imagen.size) <= LADO_MAXIMO_IMAGEN:
+                archivo.seek(0)
+                limitada = archivo.read()
+            else:
+                limitada = _codificar_jpeg(imagen, LADO_MAXIMO_IMAGEN, CALIDAD_IMAGEN)
+            miniatura = _codificar_jpeg(imagen, LADO_MINIATURA, CALIDAD_MINIATURA)
+        return limitada, miniatura
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"⚠️ No se pudo procesar la imagen, se guarda el original: {e}")
+        return None
+    finally:
+        archivo.seek(0)
+
+def preparar_imagen(archivo):
+    """Procesar una imagen subida y escribir sus archivos antes de abrir la transacción.
+    
+    Devuelve ((ref, tamaño) de la versión limitada, (ref, tamaño) de la miniatura o None),
+    o None si no hay imagen. Lanza ValueError si supera el límite de su tipo.
+    """
+    if archivo is None:
+        return None
+    errores = validar_adjuntos(archivo)
+    if errores:
+        raise ValueError(errores[0])
+    versiones = procesar_imagen(archivo)
+    if versiones is None:
+        return escribir_adjunto(archivo), None
+    limitada, miniatura = versiones
+    return escribir_adjunto(limitada), escribir_adjunto(miniatura)
+
+def registrar_imagen(c, imagen):
+    """Registrar (dentro de la transacción) una imagen de preparar_imagen y devolver (ref, ref_miniatura)"""
+    if imagen is None:
+        return None, None
+    return tuple(registrar_adjunto(c, *archivo) if archivo else None for archivo in imagen)
+
+def generar_miniaturas_faltantes(c):
+    """Columnas de miniatura y miniaturas de las imágenes ya guardadas que no la tengan.
+    
+    Se recorre por rowid en lotes; la imagen original no se modifica. Las imágenes que no están
+    en este servidor se dejan sin miniatura. Devuelve la cantidad de miniaturas generadas.
+    """
+    init_adjuntos(c)
+    generadas = 0
+    for tabla, columna_ref, columna_miniatura in COLUMNAS_MINIATURAS:
+        if not _existe_tabla(c, tabla):
+            continue
+        _agregar_columna_si_falta(c, tabla, columna_miniatura, 'TEXT')
+        if not PIL_DISPONIBLE:
+            continue
+        ultimo_rowid = 0
+        while True:
+            c.execute(f'''
+                SELECT rowid, {columna_ref} FROM {tabla}
+                WHERE rowid > ? AND {columna_ref} IS NOT NULL AND {columna_miniatura} IS NULL
+                ORDER BY rowid LIMIT 50
+            ''', (ultimo_rowid,))
+            lote = c.fetchall()
+            if not lote:
+                break
+            for rowid, ref in lote:
+                ultimo_rowid = rowid
+                ruta = ruta_adjunto(ref)
+                if not ruta:
+                    continue
+                with open(ruta, 'rb') as archivo:
+                    versiones = procesar_imagen(archivo)
+                if versiones is None:
+                    continue
+                c.execute(f"UPDATE {tabla} SET {columna_miniatura} = ? WHERE rowid = ?",
+                          (guardar_adjunto(c, versiones[1]), rowid))
+                generadas += 1
+    if generadas:
+        print(f"🖼️ {generadas} miniaturas generadas para imágenes existentes")
+    return generadas
+
+def mostrar_galeria_imagenes(df, columna_codigo, columna_nombre, columna_ref, columna_miniatura, clave, etiqueta):
+    """Miniaturas de las imágenes de la página; la versión completa se carga solo si se pide"""
+    con_miniatura = [(fila, ruta_adjunto(fila[columna_miniatura])) for _, fila in df.iterrows()]
+    con_miniatura = [(fila, ruta) for fila, ruta in con_miniatura if ruta]
+    if con_miniatura:
+        st.image([str(ruta) for _, ruta in con_miniatura],
+                 caption=[fila[columna_codigo] for fila, _ in con_miniatura], width=ANCHO_GALERIA)
+    
+    seleccion = st.selectbox(
+        f"Seleccionar {etiqueta} para ver imagen:",
+        [f"{fila[columna_codigo]} - {fila[columna_nombre]}" for _, fila in df.iterrows()],
+        key=clave
+    )
+    if not seleccion:
+        return
+    fila = df[df[columna_codigo] == seleccion.split(' - ')[0]].iloc[0]
+    if not st.toggle("🔍 Ver imagen completa", key=f"{clave}_completa"):
+        return
+    ruta_imagen = ruta_adjunto(fila[columna_ref])
+    if ruta_imagen:
+        st.image(str(ruta_imagen), caption=f"Imagen: {fila[columna_nombre]}", use_column_width=True)
+    else:
+        st.warning("⚠️ El archivo de la imagen no está disponible en este servidor")
+
+# ===============================BÚSQUEDA DE TEXTO COMPLETO (FTS5)================================
+# Índices FTS5 de contenido externo sobre códigos, equipo y descripciones. Los triggers los
+# mantienen al día; el tokenizador unicode61 con remove_diacritics 2 ignora mayúsculas y tildes
+# ("valvula" encuentra "Válvula"). Si SQLite no trae FTS5, las búsquedas siguen con LIKE.
+TOKENIZADOR_FTS = "unicode61 remove_diacritics 2"
+
+INDICES_TEXTO = {
+    'avisos': ['codigo_padre', 'codigo_mantto', 'codigo_ot_base', 'equipo', 'codigo_equipo',
+               'descripcion_problema', 'descripcion_trabajo', 'descripcion_trabajo_realizado',
+               'observaciones_cierre'],
+    'ot_unicas': ['codigo_ot_base', 'codigo_padre', 'codigo_mantto', 'equipo', 'codigo_equipo',
+                  'descripcion_problema', 'descripcion_trabajo', 'descripcion_trabajo_realizado',
+                  'observaciones_cierre'],
+    'ot_sufijos': ['codigo_ot_sufijo', 'codigo_ot_base', 'codigo_mantto', 'equipo', 'codigo_equipo',
+                   'descripcion_trabajo_realizado', 'observaciones_cierre']
+}
+
+def crear_indices_texto(c):
+    """Crear (o reconstruir) los índices FTS5 y sus triggers en las tablas de la conexión"""
+    for tabla, columnas in INDICES_TEXTO.items():
+        if not _existe_tabla(c, tabla):
+            continue
+        fts = f"{tabla}_fts"
+        lista = ', '.join(columnas)
+        nuevos = ', '.join(f"new.{col}" for col in columnas)
+        viejos = ', '.join(f"old.{col}" for col in columnas)
+        try:
+            c.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {lista}, content='{tabla}', content_rowid='id', tokenize='{TOKENIZADOR_FTS}'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ FTS5 no disponible, la búsqueda de {tabla} seguirá con LIKE: {e}")
+            return
         
-        # Guardar en SQLite local
-        # Primero limpiar tabla
-        c = conn_local.cursor()
-        c.execute(f"DELETE FROM {tabla_nombre}")
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {tabla} BEGIN
+                INSERT INTO {fts} (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {tabla} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            END
+        ''')
+        # Solo cuando cambia una columna indexada (no en cada cambio de estado o actualizado_en)
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {lista} ON {tabla} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+                INSERT INTO {fts} (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        ''')
+        c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def consulta_fts(busqueda):
+    """Convertir el texto del usuario en una consulta FTS5 segura (cada término como prefijo).
+    
+    Los códigos con guiones (AM-00000012, OT-0000003-01) se buscan como frase para que
+    sus partes coincidan seguidas y no sueltas en cualquier columna.
+    """
+    terminos = re.findall(r'\w+(?:[-./]\w+)*', busqueda or '')
+    return ' '.join('"' + ' '.join(re.findall(r'\w+', termino)) + '"*' for termino in terminos)
+
+def fuente_busqueda(conn, tabla, busqueda, orden):
+    """Origen de la consulta de un listado según la caja de búsqueda.
+    
+    Con índice FTS5 y texto buscado devuelve el JOIN con las coincidencias, ordenadas por
+    relevancia (bm25) y con un fragmento resaltado en la columna 'coincidencia'. Si no,
+    devuelve la tabla tal cual y el texto queda para el LIKE de filtro_sql.
+    """
+    fuente = {'origen': tabla, 'params': [], 'orden': orden, 'columnas': '', 'busqueda_like': busqueda}
+    expresion = consulta_fts(busqueda)
+    if not expresion or tabla not in INDICES_TEXTO or not _existe_tabla(conn.cursor(), f"{tabla}_fts"):
+        return fuente
+    
+    fts = f"{tabla}_fts"
+    fuente.update({
+        'origen': f'''{tabla} JOIN (
+            SELECT rowid AS fts_id, rank AS fts_rango,
+                   snippet({fts}, -1, '«', '»', '…', 12) AS coincidencia
+            FROM {fts} WHERE {fts} MATCH ?
+        ) AS fts ON fts.fts_id = {tabla}.id''',
+        'params': [expresion],
+        'orden': f"fts.fts_rango, {orden}",
+        'columnas': ', coincidencia',
+        'busqueda_like': ''
+    })
+    return fuente
+
+# ===============================CONTADORES PRECALCULADOS (ESTADÍSTICAS)================================
+# La tabla estadisticas guarda cuántas filas hay por tabla y por estado; los triggers la
+# ajustan en cada INSERT/DELETE/UPDATE de estado, así los totales del inicio se leen sin
+# recorrer las tablas. Las tablas sin estado usan la fila con estado ''.
+TABLAS_ESTADISTICAS = {
+    'avisos': 'estado',
+    'ot_unicas': 'estado',
+    'ot_sufijos': 'estado',
+    'equipos': None,
+    'colaboradores': None
+}
+
+def crear_estadisticas(c):
+    """Crear la tabla de contadores, sus triggers y recalcularla desde los datos actuales"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas (
+            tabla TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT '',
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tabla, estado)
+        ) WITHOUT ROWID
+    ''')
+    
+    for tabla, columna in TABLAS_ESTADISTICAS.items():
+        if not _existe_tabla(c, tabla):
+            continue
+        nuevo = f"COALESCE(new.{columna}, '')" if columna else "''"
+        viejo = f"COALESCE(old.{columna}, '')" if columna else "''"
+        sumar = f'''
+            INSERT INTO estadisticas (tabla, estado, total) VALUES ('{tabla}', {nuevo}, 1)
+            ON CONFLICT(tabla, estado) DO UPDATE SET total = total + 1;'''
+        restar = f"UPDATE estadisticas SET total = total - 1 WHERE tabla = '{tabla}' AND estado = {viejo};"
+        
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{tabla}_estadisticas_insert AFTER INSERT ON {tabla} BEGIN {sumar} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{tabla}_estadisticas_delete AFTER DELETE ON {tabla} BEGIN {restar} END")
+        if columna:
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{tabla}_estadisticas_update
+                AFTER UPDATE OF {columna} ON {tabla}
+                WHEN {viejo} IS NOT {nuevo}
+                BEGIN {restar} {sumar} END
+            ''')
+    
+    recalcular_estadisticas(c)
+
+def recalcular_estadisticas(c):
+    """Rehacer los contadores con COUNT(*) (tras migraciones o si se sospecha desvío)"""
+    c.execute("DELETE FROM estadisticas")
+    for tabla, columna in TABLAS_ESTADISTICAS.items():
+        if not _existe_tabla(c, tabla):
+            continue
+        estado = f"COALESCE({columna}, '')" if columna else "''"
+        c.execute(f'''
+            INSERT INTO estadisticas (tabla, estado, total)
+            SELECT '{tabla}', {estado}, COUNT(*) FROM {tabla} GROUP BY 2
+        ''')
+
+def contar_registros(conn, tabla, estados=None):
+    """Total de filas de una tabla (opcionalmente solo de ciertos estados) desde los contadores"""
+    c = conn.cursor()
+    if estados:
+        marcadores = ', '.join('?' * len(estados))
+        c.execute(f"SELECT COALESCE(SUM(total), 0) FROM estadisticas WHERE tabla = ? AND estado IN ({marcadores})",
+                  (tabla, *estados))
+    else:
+        c.execute("SELECT COALESCE(SUM(total), 0) FROM estadisticas WHERE tabla = ?", (tabla,))
+    return c.fetchone()[0]
+
+# ===============================RESUMEN DE OT PARA GRÁFICOS================================
+# resumen_ot guarda cuántas OT hay por día de finalización, área, estado y prioridad. Los
+# triggers de ot_unicas la ajustan en cada escritura (como estadisticas), así los gráficos por
+# estado, prioridad y mes se leen de unas pocas filas sin cargar las OT ni sus textos.
+# Se guarda por día y no por mes para que el filtro "Fecha desde" sea exacto; el mes se arma en
+# la consulta. Las OT abiertas tienen fecha_finalizacion ''.
+DIMENSIONES_RESUMEN_OT = {
+    'fecha_finalizacion': "COALESCE(date({fila}.fecha_finalizacion), '')",
+    'area': "COALESCE({fila}.area, '')",
+    'estado': "COALESCE({fila}.estado, '')",
+    'prioridad': "COALESCE({fila}.prioridad_nueva, '')"
+}
+
+def crear_resumen_ot(c):
+    """Crear la tabla resumen_ot, sus triggers sobre ot_unicas y llenarla con los datos actuales"""
+    if not _existe_tabla(c, 'ot_unicas'):
+        return
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS resumen_ot (
+            fecha_finalizacion TEXT NOT NULL,
+            area TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            prioridad TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (estado, fecha_finalizacion, area, prioridad)
+        ) WITHOUT ROWID
+    ''')
+    columnas = ', '.join(DIMENSIONES_RESUMEN_OT)
+    nuevos = ', '.join(expr.format(fila='new') for expr in DIMENSIONES_RESUMEN_OT.values())
+    condicion_vieja = ' AND '.join(f"{col} = {expr.format(fila='old')}" for col, expr in DIMENSIONES_RESUMEN_OT.items())
+    sumar = f'''
+        INSERT INTO resumen_ot ({columnas}, total) VALUES ({nuevos}, 1)
+        ON CONFLICT(estado, fecha_finalizacion, area, prioridad) DO UPDATE SET total = total + 1;'''
+    restar = f'''
+        UPDATE resumen_ot SET total = total - 1 WHERE {condicion_vieja};
+        DELETE FROM resumen_ot WHERE total <= 0 AND {condicion_vieja};'''
+    cambio = ' OR '.join(f"{expr.format(fila='old')} IS NOT {expr.format(fila='new')}"
+                         for expr in DIMENSIONES_RESUMEN_OT.values())
+    
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_ot_unicas_resumen_insert AFTER INSERT ON ot_unicas BEGIN {sumar} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_ot_unicas_resumen_delete AFTER DELETE ON ot_unicas BEGIN {restar} END")
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ot_unicas_resumen_update
+        AFTER UPDATE OF fecha_finalizacion, area, estado, prioridad_nueva ON ot_unicas
+        WHEN {cambio}
+        BEGIN {restar} {sumar} END
+    ''')
+    recalcular_resumen_ot(c)
+
+def recalcular_resumen_ot(c):
+    """Rehacer resumen_ot con GROUP BY sobre ot_unicas"""
+    columnas = ', '.join(DIMENSIONES_RESUMEN_OT)
+    expresiones = ', '.join(expr.format(fila='ot_unicas') for expr in DIMENSIONES_RESUMEN_OT.values())
+    c.execute("DELETE FROM resumen_ot")
+    c.execute(f'''
+        INSERT INTO resumen_ot ({columnas}, total)
+        SELECT {expresiones}, COUNT(*) FROM ot_unicas GROUP BY 1, 2, 3, 4
+    ''')
+
+def resumen_ot(conn, dimension, estados, area=None, prioridad=None, desde=None):
+    """Total de OT por 'estado', 'prioridad' o 'mes' entre los estados indicados (Serie para gráficos)"""
+    columna = {'estado': 'estado', 'prioridad': 'prioridad', 'mes': 'substr(fecha_finalizacion, 1, 7)'}[dimension]
+    condiciones = [f"estado IN ({', '.join('?' * len(estados))})"]
+    params = list(estados)
+    for filtro, valor in (('area', area), ('prioridad', prioridad)):
+        if valor is not None:
+            condiciones.append(f"{filtro} = ?")
+            params.append(valor)
+    if desde is not None:
+        condiciones.append("fecha_finalizacion >= ?")
+        params.append(pd.Timestamp(desde).strftime('%Y-%m-%d'))
+    df = pd.read_sql(f'''
+        SELECT {columna} AS {dimension}, SUM(total) AS total FROM resumen_ot
+        WHERE {' AND '.join(condiciones)}
+        GROUP BY 1 HAVING SUM(total) > 0 ORDER BY 1
+    ''', conn, params=params)
+    return df.set_index(dimension)['total']
+
+# ===============================ANTIGÜEDAD CALCULADA================================
+# La columna antiguedad se guardaba al insertar y quedaba congelada. Ahora se calcula al leer:
+# días desde la fecha base hasta la fecha de finalización (o hoy si sigue abierta). La columna
+# guardada solo se usa si la fecha base no se puede interpretar. Las vistas antiguedad_<tabla>
+# añaden el tramo de antigüedad, y el índice (estado, fecha base) resuelve los tramos sin leer filas.
+FECHA_BASE_ANTIGUEDAD = {
+    'avisos': "date(COALESCE(ingresado_el, creado_en))",
+    'ot_unicas': "date(COALESCE(ot_base_creado_en, ingresado_el))",
+    'ot_sufijos': "date(COALESCE(ingresado_el, ot_sufijo_creado_en))"
+}
+TRAMOS_ANTIGUEDAD = [(7, '0-7 días'), (30, '8-30 días'), (90, '31-90 días')]
+TRAMO_ANTIGUEDAD_MAYOR = '> 90 días'
+TRAMO_SIN_FECHA = 'Sin fecha'
+
+def antiguedad_sql(tabla):
+    """Expresión SQL de la antigüedad en días de cada fila de la tabla"""
+    fecha = FECHA_BASE_ANTIGUEDAD[tabla]
+    return (f"COALESCE(MAX(0, CAST(julianday(COALESCE(date(fecha_finalizacion), date('now', 'localtime'))) "
+            f"- julianday({fecha}) AS INTEGER)), antiguedad)")
+
+def tramo_antiguedad_sql(tabla):
+    """Expresión SQL del tramo de antigüedad (comparando solo la fecha base, apta para índice)"""
+    fecha = FECHA_BASE_ANTIGUEDAD[tabla]
+    casos = ' '.join(f"WHEN {fecha} >= date('now', 'localtime', '-{dias} days') THEN '{etiqueta}'"
+                     for dias, etiqueta in TRAMOS_ANTIGUEDAD)
+    return f"CASE WHEN {fecha} IS NULL THEN '{TRAMO_SIN_FECHA}' {casos} ELSE '{TRAMO_ANTIGUEDAD_MAYOR}' END"
+
+def crear_vistas_antiguedad(c):
+    """Vistas antiguedad_<tabla> e índices (estado, fecha base) para los tramos de antigüedad"""
+    for tabla, fecha in FECHA_BASE_ANTIGUEDAD.items():
+        if not _existe_tabla(c, tabla):
+            continue
+        c.execute(f"DROP VIEW IF EXISTS antiguedad_{tabla}")
+        c.execute(f'''
+            CREATE VIEW antiguedad_{tabla} AS
+            SELECT id, estado, {antiguedad_sql(tabla)} AS antiguedad,
+                   {tramo_antiguedad_sql(tabla)} AS tramo_antiguedad
+            FROM {tabla}
+        ''')
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_estado_fecha_base ON {tabla} (estado, {fecha})")
+
+def resumen_tramos_antiguedad(conn, tabla, estados):
+    """Cantidad de filas por tramo de antigüedad entre los estados indicados (Serie para gráficos)"""
+    marcadores = ', '.join('?' * len(estados))
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT tramo_antiguedad, COUNT(*) FROM antiguedad_{tabla}
+        WHERE estado IN ({marcadores}) GROUP BY tramo_antiguedad
+    ''', list(estados))
+    conteos = dict(c.fetchall())
+    orden = [etiqueta for _, etiqueta in TRAMOS_ANTIGUEDAD] + [TRAMO_ANTIGUEDAD_MAYOR, TRAMO_SIN_FECHA]
+    return pd.Series({tramo: conteos[tramo] for tramo in orden if tramo in conteos}, name='total')
+
+# ===============================CACHÉ DE CONSULTAS POR VERSIÓN DE TABLA================================
+# versiones_tablas lleva un contador por tabla que los triggers incrementan en cada
+# INSERT/UPDATE/DELETE, venga de un formulario, de la hidratación o del worker. Las funciones
+# obtener_* decoradas con cache_por_tablas se sirven desde st.cache_data (compartido entre
+# sesiones) mientras no cambie la versión de sus tablas ni el día (la antigüedad depende de hoy).
+TABLAS_VERSIONADAS = ['avisos', 'ot_unicas', 'ot_sufijos', 'equipos', 'equipo_informes', 'colaboradores']
+FUNCIONES_CACHEADAS = {}
+
+def crear_versiones_tablas(c):
+    """Crear la tabla de versiones y los triggers que la incrementan en cada escritura"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS versiones_tablas (
+            tabla TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for tabla in TABLAS_VERSIONADAS:
+        if not _existe_tabla(c, tabla):
+            continue
+        c.execute("INSERT OR IGNORE INTO versiones_tablas (tabla, version) VALUES (?, 0)", (tabla,))
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{tabla}_version_{evento.lower()}
+                AFTER {evento} ON {tabla} BEGIN
+                    UPDATE versiones_tablas SET version = version + 1 WHERE tabla = '{tabla}';
+                END
+            ''')
+
+def versiones_tablas(tablas):
+    """Clave de vigencia de una consulta: el día actual y la versión de cada tabla"""
+    versiones = [date.today().isoformat()]
+    for tabla in tablas:
+        c = conexion_base(TABLAS_SYNC[tabla]).cursor()
+        c.execute("SELECT version FROM versiones_tablas WHERE tabla = ?", (tabla,))
+        fila = c.fetchone()
+        versiones.append(fila[0] if fila else None)
+    return tuple(versiones)
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def _resultado_cacheado(nombre, versiones, args, kwargs):
+    """Ejecutar la función real; st.cache_data guarda el resultado por (nombre, versiones, argumentos)"""
+    return FUNCIONES_CACHEADAS[nombre](*args, **kwargs)
+
+def cache_por_tablas(*tablas):
+    """Decorador: cachear el resultado de una consulta hasta que cambie alguna de sus tablas"""
+    def decorador(funcion):
+        FUNCIONES_CACHEADAS[funcion.__name__] = funcion
         
-        # Insertar datos fila por fila
-        success_count = 0
-        for _, row in df.iterrows():
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
             try:
-                # Construir query dinámica
-                columnas = ', '.join(df.columns)
-                placeholders = ', '.join(['?' for _ in df.columns])
-                valores = tuple(row)
-                
-                # Insertar fila
-                c.execute(f"INSERT INTO {tabla_nombre} ({columnas}) VALUES ({placeholders})", valores)
-                success_count += 1
-            except Exception as e:
-                print(f"⚠️ Error insertando fila en {tabla_nombre}: {e}")
-                continue
-        
-        conn_local.commit()
-        print(f"✅ {success_count}/{len(df)} registros cargados desde {tabla_nombre}")
-        return True
-        
-    except Exception as e:
-        print(f"⚠️ Error cargando {tabla_nombre}: {e}")
-        return True  # Devuelve True para continuar sin error
+                versiones = versiones_tablas(tablas)
+            except sqlite3.Error:
+                # Sin contadores (p. ej. migración pendiente) se consulta directamente
+                return funcion(*args, **kwargs)
+            return _resultado_cacheado(funcion.__name__, versiones, args, kwargs)
+        return envoltura
+    return decorador
 
-def sincronizar_todas_tablas():
-    """Sincronizar todas las tablas a Google Sheets"""
-    if not st.session_state.use_google_sheets:
-        print("⚠️ Google Sheets no está habilitado")
+# ===============================MIGRACIONES DE ESQUEMA (VERSIONADAS)================================
+# Cada migración se aplica una sola vez por archivo y queda registrada en schema_migraciones.
+# Las funciones solo tocan las tablas que existen en ese archivo (modo de varios archivos).
+
+def _existe_tabla(c, tabla):
+    """Verificar si una tabla existe en la conexión"""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+    return c.fetchone() is not None
+
+def _agregar_columna_si_falta(c, tabla, columna, tipo):
+    """ALTER TABLE ADD COLUMN solo si la columna no existe"""
+    c.execute(f"PRAGMA table_info({tabla})")
+    if columna not in [col[1] for col in c.fetchall()]:
+        c.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+
+def _migracion_columnas_faltantes(c):
+    """Columnas que los formularios ya usan pero que no estaban en los CREATE TABLE"""
+    columnas_ot = [
+        ('cantidad_mecanicos', 'INTEGER'),
+        ('cantidad_electricos', 'INTEGER'),
+        ('cantidad_soldadores', 'INTEGER'),
+        ('cantidad_op_vahos', 'INTEGER'),
+        ('cantidad_calderistas', 'INTEGER'),
+        ('materiales', 'TEXT'),
+        ('alimentador_proveedor', 'TEXT')
+    ]
+    if _existe_tabla(c, 'avisos'):
+        for columna, tipo in [('imagen_aviso_nombre', 'TEXT'), ('imagen_aviso_datos', 'BLOB')] + columnas_ot:
+            _agregar_columna_si_falta(c, 'avisos', columna, tipo)
+    if _existe_tabla(c, 'ot_unicas'):
+        for columna, tipo in columnas_ot:
+            _agregar_columna_si_falta(c, 'ot_unicas', columna, tipo)
+
+# Índices para las rutas de acceso más usadas (tabla, nombre, columnas)
+INDICES_CONSULTAS = [
+    ('avisos', 'idx_avisos_estado_creado', 'estado, creado_en'),
+    ('avisos', 'idx_avisos_area_equipo_estado', 'area, equipo, estado, creado_en'),
+    ('avisos', 'idx_avisos_codigo_padre', 'codigo_padre'),
+    ('avisos', 'idx_avisos_codigo_mantto', 'codigo_mantto'),
+    ('ot_unicas', 'idx_ot_unicas_estado_fecha', 'estado, fecha_estimada_inicio'),
+    ('ot_sufijos', 'idx_ot_sufijos_codigo_ot_base', 'codigo_ot_base')
+]
+
+def _migracion_indices_consultas(c):
+    """Índices compuestos sobre estado, área/equipo y códigos de enlace"""
+    for tabla, nombre, columnas in INDICES_CONSULTAS:
+        if _existe_tabla(c, tabla):
+            c.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columnas})")
+
+# ===============================HISTORIAL DE OT (EVENTOS DE SOLO INSERCIÓN)================================
+# Cada inicio, continuación y culminación de una OT se registra como una fila de ot_eventos;
+# las filas nunca se modifican (un trigger rechaza los UPDATE). ot_unicas solo guarda el texto
+# del último evento en descripcion_trabajo_realizado, así los listados leen un valor corto y
+# cada registro escribe lo mismo sin importar cuántos eventos tenga la OT. El historial completo
+# se arma solo al mostrar una OT. Los textos acumulados de versiones anteriores
+# ("--- CONTINUACIÓN: fecha ---") se separan en eventos la primera vez que se necesitan.
+TIPOS_EVENTO_OT = {
+    'INICIO': ('🛠️', 'Inicio'),
+    'CONTINUACION': ('🔄', 'Continuación'),
+    'CULMINACION': ('🏁', 'Culminación')
+}
+
+ENCABEZADO_HISTORIAL_RE = re.compile(
+    r'^--- (INICIO|CONTINUACIÓN|CULMINACIÓN): (\d{4}-\d{2}-\d{2} \d{2}:\d{2}) ---$', re.MULTILINE)
+
+def init_ot_eventos(c):
+    """Tabla de eventos de OT, su índice y el trigger que impide modificarlos"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ot_eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo_ot_base TEXT NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('INICIO', 'CONTINUACION', 'CULMINACION')),
+            registrado_en TIMESTAMP,
+            responsables TEXT,
+            descripcion TEXT,
+            observaciones TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ot_eventos_ot ON ot_eventos(codigo_ot_base, id)")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_ot_eventos_solo_insercion
+        BEFORE UPDATE ON ot_eventos BEGIN
+            SELECT RAISE(ABORT, 'ot_eventos es de solo inserción');
+        END
+    ''')
+
+def _eventos_desde_texto(descripcion, observaciones, culminada):
+    """Separar los textos acumulados de versiones anteriores en eventos (tipo, fecha, descripción, observaciones)"""
+    def bloques(texto):
+        if not texto or pd.isna(texto):
+            return []
+        partes = ENCABEZADO_HISTORIAL_RE.split(str(texto))
+        resultado = [(None, None, partes[0].strip())] if partes[0].strip() else []
+        for i in range(1, len(partes), 3):
+            tipo = partes[i].replace('Ó', 'O')
+            resultado.append((tipo, partes[i + 1], partes[i + 2].strip()))
+        return resultado
+    
+    eventos = [{'tipo': tipo or 'INICIO', 'fecha': fecha, 'descripcion': texto, 'observaciones': None}
+               for tipo, fecha, texto in bloques(descripcion)]
+    if not eventos:
+        return []
+    for tipo, fecha, texto in bloques(observaciones):
+        if not texto:
+            continue
+        if tipo is None:
+            # Sin encabezado: en OT culminadas es la observación de cierre, si no la del inicio
+            destino = eventos[-1] if culminada else eventos[0]
+        else:
+            destino = next((e for e in eventos if (e['tipo'], e['fecha']) == (tipo, fecha)), eventos[-1])
+        destino['observaciones'] = '\n\n'.join(filter(None, [destino['observaciones'], texto]))
+    return eventos
+
+def importar_historial_ot(c, codigo_ot_base):
+    """Pasar a ot_eventos el texto acumulado de una OT que todavía no tiene eventos; devuelve cuántos"""
+    c.execute("SELECT 1 FROM ot_eventos WHERE codigo_ot_base = ? LIMIT 1", (codigo_ot_base,))
+    if c.fetchone():
         return 0
-    
-    print("🔄 Iniciando sincronización completa con Google Sheets...")
-    
-    # Obtener hoja principal primero
-    spreadsheet = get_spreadsheet()
-    if not spreadsheet:
-        print("❌ No se pudo obtener la hoja principal")
+    c.execute('''
+        SELECT descripcion_trabajo_realizado, observaciones_cierre, responsables_comienzo,
+               responsables_finalizacion, estado
+        FROM ot_unicas WHERE codigo_ot_base = ?
+    ''', (codigo_ot_base,))
+    fila = c.fetchone()
+    if not fila:
+        return 0
+    descripcion, observaciones, responsables_comienzo, responsables_finalizacion, estado = fila
+    eventos = _eventos_desde_texto(descripcion, observaciones, estado in ('CULMINADO', 'CERRADO'))
+    for evento in eventos:
+        responsables = responsables_finalizacion if evento['tipo'] == 'CULMINACION' else responsables_comienzo
+        c.execute('''
+            INSERT INTO ot_eventos (codigo_ot_base, tipo, registrado_en, responsables, descripcion, observaciones)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (codigo_ot_base, evento['tipo'], evento['fecha'], responsables,
+              evento['descripcion'], evento['observaciones']))
+    return len(eventos)
+
+def migrar_historial_ot(c):
+    """Separar en eventos el historial acumulado de todas las OT (por lotes de rowid)"""
+    if not _existe_tabla(c, 'ot_unicas'):
         return 0
+    init_ot_eventos(c)
+    importados = 0
+    ultimo_rowid = 0
+    while True:
+        c.execute('''
+            SELECT rowid, codigo_ot_base FROM ot_unicas
+            WHERE rowid > ? AND descripcion_trabajo_realizado IS NOT NULL AND codigo_ot_base IS NOT NULL
+            ORDER BY rowid LIMIT 200
+        ''', (ultimo_rowid,))
+        lote = c.fetchall()
+        if not lote:
+            break
+        for ultimo_rowid, codigo_ot_base in lote:
+            importados += importar_historial_ot(c, codigo_ot_base)
+    if importados:
+        print(f"📜 {importados} eventos de OT separados del historial acumulado")
+    return importados
+
+def registrar_evento_ot(c, codigo_ot_base, tipo, responsables, descripcion, observaciones=None):
+    """Agregar un evento al historial de la OT (dentro de la transacción del formulario)"""
+    importar_historial_ot(c, codigo_ot_base)
+    c.execute('''
+        INSERT INTO ot_eventos (codigo_ot_base, tipo, registrado_en, responsables, descripcion, observaciones)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (codigo_ot_base, tipo, datetime.now().strftime('%Y-%m-%d %H:%M'), responsables,
+          descripcion, observaciones or None))
+
+def crear_indicadores_kpi(c):
+    """Tabla kpi_equipo_diario calculada con todas las OT culminadas.
     
-    print(f"✅ Usando hoja: {spreadsheet.title}")
+    Con varios archivos, ot_sufijos no está en la conexión de la migración: la tabla se crea y
+    calcula después, en preparar_esquema, con recalcular_indicadores_kpi.
+    """
+    if not (_existe_tabla(c, 'ot_unicas') and _existe_tabla(c, 'ot_sufijos')):
+        return 0
+    filas = reconstruir_kpi_equipo_diario(c)
+    print(f"📈 Indicadores de mantenimiento calculados: {filas} filas por equipo y día")
+    return filas
+
+def recalcular_indicadores_kpi():
+    """Reconstruir kpi_equipo_diario en el archivo de ot_unicas, adjuntando ot_sufijos si está aparte"""
+    conn = nueva_conexion('ot_unicas.db')
+    try:
+        if ruta_base('ot_sufijos.db') != ruta_base('ot_unicas.db'):
+            conn.execute("ATTACH DATABASE ? AS sufijos", (ruta_base('ot_sufijos.db'),))
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        filas = reconstruir_kpi_equipo_diario(c)
+        conn.commit()
+        print(f"📈 Indicadores de mantenimiento calculados: {filas} filas por equipo y día")
+        return filas
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ No se pudieron recalcular los indicadores de mantenimiento: {e}")
+        return None
+    finally:
+        conn.close()
+
+def obtener_historial_ot(codigo_ot_base):
+    """Eventos de una OT en orden de registro (lista de diccionarios)"""
+    c = conexion_base('ot_unicas.db').cursor()
+    c.execute('''
+        SELECT tipo, registrado_en, responsables, descripcion, observaciones
+        FROM ot_eventos WHERE codigo_ot_base = ? ORDER BY id
+    ''', (codigo_ot_base,))
+    columnas = [col[0] for col in c.description]
+    return [dict(zip(columnas, fila)) for fila in c.fetchall()]
+
+def mostrar_historial_ot(codigo_ot_base, texto_anterior=None):
+    """Historial de trabajo de una OT; sin eventos muestra el texto acumulado anterior, si lo hay"""
+    eventos = obtener_historial_ot(codigo_ot_base)
+    if not eventos:
+        if texto_anterior is not None and pd.notna(texto_anterior):
+            st.info(f"**Trabajo acumulado:**\n\n{texto_anterior}")
+        else:
+            st.info("ℹ️ La OT aún no tiene trabajo registrado")
+        return
+    for evento in eventos:
+        icono, etiqueta = TIPOS_EVENTO_OT.get(evento['tipo'], ('📝', evento['tipo']))
+        detalle = ' · '.join(filter(None, [evento['registrado_en'], evento['responsables']]))
+        st.markdown(f"**{icono} {etiqueta}**" + (f" — {detalle}" if detalle else ""))
+        if evento['descripcion']:
+            st.info(evento['descripcion'])
+        if evento['observaciones']:
+            st.caption(f"Observaciones: {evento['observaciones']}")
+
+# ===============================SECUENCIAS DE CÓDIGOS================================
+# Los códigos (CODP, AM, OT y los sufijos por OT base) salen de la tabla secuencias:
+# el siguiente valor se asigna dentro de la misma transacción del INSERT (BEGIN IMMEDIATE),
+# así dos usuarios nunca reciben el mismo código y no hay que leer la última fila ni contar.
+# En el modo de varios archivos cada archivo tiene su propia tabla, sembrada con sus tablas.
+
+FORMATOS_SECUENCIA = {
+    'CODP': 'CODP-{:08d}',
+    'AM': 'AM-{:08d}',
+    'OT': 'OT-{:07d}'
+}
+
+# Valor máximo ya usado por cada secuencia (nombre, tabla, SQL que devuelve filas (nombre, valor))
+SEMILLAS_SECUENCIA = [
+    ('avisos', """
+        SELECT 'CODP', MAX(CAST(SUBSTR(codigo_padre, 6) AS INTEGER)) FROM avisos
+        WHERE codigo_padre LIKE 'CODP-%' AND codigo_padre NOT LIKE 'CODP-OT-%'
+    """),
+    ('avisos', """
+        SELECT 'AM', MAX(CAST(SUBSTR(codigo_mantto, 4) AS INTEGER)) FROM avisos
+        WHERE codigo_mantto LIKE 'AM-%'
+    """),
+    ('ot_unicas', """
+        SELECT 'CODP', MAX(CAST(SUBSTR(codigo_padre, 6) AS INTEGER)) FROM ot_unicas
+        WHERE codigo_padre LIKE 'CODP-%' AND codigo_padre NOT LIKE 'CODP-OT-%'
+    """),
+    ('ot_unicas', """
+        SELECT 'OT', MAX(CAST(SUBSTR(codigo_ot_base, 4) AS INTEGER)) FROM ot_unicas
+        WHERE codigo_ot_base LIKE 'OT-%'
+    """),
+    ('ot_sufijos', """
+        SELECT 'sufijo:' || codigo_ot_base,
+               MAX(CAST(SUBSTR(codigo_ot_sufijo, LENGTH(codigo_ot_base) + 2) AS INTEGER))
+        FROM ot_sufijos
+        WHERE codigo_ot_base IS NOT NULL AND codigo_ot_sufijo LIKE codigo_ot_base || '-%'
+        GROUP BY codigo_ot_base
+    """)
+]
+
+def sembrar_secuencias(c):
+    """Subir cada secuencia al máximo ya usado en las tablas (nunca la baja)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS secuencias (
+            nombre TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for tabla, sql in SEMILLAS_SECUENCIA:
+        if not _existe_tabla(c, tabla):
+            continue
+        c.execute(sql)
+        semillas = [(nombre, valor) for nombre, valor in c.fetchall() if nombre and valor]
+        c.executemany('''
+            INSERT INTO secuencias (nombre, valor) VALUES (?, ?)
+            ON CONFLICT(nombre) DO UPDATE SET valor = MAX(valor, excluded.valor)
+        ''', semillas)
+
+def _formatear_codigo(nombre, valor):
+    """Código con el formato de su secuencia ('sufijo:OT-0000001' -> 'OT-0000001-01')"""
+    if nombre.startswith('sufijo:'):
+        return f"{nombre[len('sufijo:'):]}-{valor:02d}"
+    return FORMATOS_SECUENCIA[nombre].format(valor)
+
+def siguiente_codigo(c, nombre):
+    """Asignar el siguiente código de una secuencia.
+    
+    Debe llamarse con el cursor de una unidad_de_trabajo, dentro de la misma transacción
+    que el INSERT que usa el código; si la transacción se revierte, el número se libera.
+    """
+    c.execute("INSERT OR IGNORE INTO secuencias (nombre, valor) VALUES (?, 0)", (nombre,))
+    c.execute("UPDATE secuencias SET valor = valor + 1 WHERE nombre = ?", (nombre,))
+    c.execute("SELECT valor FROM secuencias WHERE nombre = ?", (nombre,))
+    return _formatear_codigo(nombre, c.fetchone()[0])
+
+def vista_previa_codigo(db_name, nombre):
+    """Próximo código de una secuencia sin reservarlo (solo para mostrar en formularios)"""
+    try:
+        c = conexion_base(db_name).cursor()
+        c.execute("SELECT valor FROM secuencias WHERE nombre = ?", (nombre,))
+        fila = c.fetchone()
+        return _formatear_codigo(nombre, (fila[0] if fila else 0) + 1)
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo leer la secuencia {nombre}: {e}")
+        return _formatear_codigo(nombre, 1)
+
+MIGRACIONES = [
+    (1, 'Columnas faltantes en avisos y ot_unicas', _migracion_columnas_faltantes),
+    (2, 'Índices de consultas frecuentes', _migracion_indices_consultas),
+    (3, 'Secuencias de códigos sembradas con los datos existentes', sembrar_secuencias),
+    (4, 'Adjuntos fuera de las filas (almacén por SHA-256)', externalizar_adjuntos),
+    (5, 'Informes de equipos de informes_json a equipo_informes', desempacar_informes_json),
+    (6, 'Índices de texto completo (FTS5) para las búsquedas', crear_indices_texto),
+    (7, 'Contadores por tabla y estado mantenidos por triggers', crear_estadisticas),
+    (8, 'Vistas de antigüedad calculada y tramos de antigüedad', crear_vistas_antiguedad),
+    (9, 'Versiones por tabla para invalidar la caché de consultas', crear_versiones_tablas),
+    (10, 'Miniaturas de las imágenes de avisos y culminaciones', generar_miniaturas_faltantes),
+    (11, 'Historial de OT en eventos (ot_eventos) desde los textos acumulados', migrar_historial_ot),
+    (12, 'Indicadores diarios por equipo (MTTR, MTBF, disponibilidad)', crear_indicadores_kpi),
+    (13, 'Resumen de OT por fecha, área, estado y prioridad para los gráficos', crear_resumen_ot),
+    (14, 'Respaldo del contenido de los adjuntos para Google Sheets', respaldar_almacen_adjuntos)
+]
+
+def aplicar_migraciones(conn):
+    """Aplicar las migraciones pendientes en un archivo; devuelve las versiones aplicadas"""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
     
-    tablas = [
-        ('avisos', conn_avisos),
-        ('equipos', conn_equipos),
-        ('ot_unicas', conn_ot_unicas),
-        ('ot_sufijos', conn_ot_sufijos),
-        ('colaboradores', conn_colaboradores)
-    ]
+    c.execute("SELECT version FROM schema_migraciones")
+    aplicadas = {fila[0] for fila in c.fetchall()}
     
-    exitos = 0
-    for nombre, conn in tablas:
-        print(f"📤 Sincronizando {nombre}...")
-        if guardar_en_google_sheets(nombre, conn):
-            exitos += 1
-            print(f"✅ {nombre} sincronizado exitosamente")
-        else:
-            print(f"❌ Error sincronizando {nombre}")
-        
-        time.sleep(2)  # Esperar más entre tablas para evitar límites de API
+    nuevas = []
+    for version, descripcion, migracion in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            migracion(c)
+            c.execute("INSERT INTO schema_migraciones (version, descripcion) VALUES (?, ?)",
+                      (version, descripcion))
+            conn.commit()
+            nuevas.append(version)
+            print(f"✅ Migración {version} aplicada: {descripcion}")
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error en migración {version} ({descripcion}): {e}")
+            break
     
-    print(f"✅ Sincronización completada: {exitos}/{len(tablas)} tablas exitosas")
-    return exitos
+    # Estadísticas para el planificador
+    if nuevas:
+        c.execute("ANALYZE")
+    else:
+        c.execute("PRAGMA optimize")
+    conn.commit()
+    return nuevas
 
-# ===============================CONFIGURACIÓN DE RUTAS================================
-def get_database_path(db_name):
-    """Obtiene la ruta correcta para la base de datos"""
-    if EN_STREAMLIT_CLOUD:
-        # En Streamlit Cloud, usar /tmp para persistencia temporal
-        temp_dir = Path("/tmp")
-        temp_dir.mkdir(exist_ok=True)
-        return str(temp_dir / db_name)
+# Con VERIFICAR_PLANES_ESTRICTO=1 (CI: `VERIFICAR_PLANES_ESTRICTO=1 python app.py`) el arranque
+# falla si alguna consulta crítica hace SCAN sobre el esquema ya migrado
+VERIFICAR_PLANES_ESTRICTO = os.environ.get('VERIFICAR_PLANES_ESTRICTO', '') == '1'
+
+# Consultas frecuentes que deben resolverse con índice (nombre, SQL, parámetros)
+CONSULTAS_CRITICAS = [
+    ('obtener_avisos_ingresados',
+     "SELECT id FROM avisos WHERE estado = 'INGRESADO' ORDER BY creado_en DESC", ()),
+    ('obtener_avisos_compatibles',
+     "SELECT id FROM avisos WHERE estado = 'INGRESADO' AND area = ? AND equipo = ? ORDER BY creado_en DESC",
+     ('A', 'E')),
+    ('culminacion_avisos_por_codigo_padre',
+     "UPDATE avisos SET estado = 'CULMINADO' WHERE codigo_padre = ?", ('X',)),
+    ('asociar_avisos_por_codigo_mantto',
+     "UPDATE avisos SET estado = 'PROGRAMADO' WHERE codigo_mantto = ? AND estado = 'INGRESADO'", ('X',)),
+    ('obtener_ot_para_inicio',
+     "SELECT id FROM ot_unicas WHERE estado IN ('PROGRAMADO', 'PENDIENTE') ORDER BY fecha_estimada_inicio", ()),
+    ('obtener_ot_programadas',
+     "SELECT id FROM ot_unicas WHERE estado = 'PROGRAMADO' ORDER BY ot_base_creado_en DESC", ()),
+    ('siguiente_codigo',
+     "SELECT valor FROM secuencias WHERE nombre = ?", ('sufijo:OT-0000001',))
+]
+
+def verificar_planes_consulta(conexiones, estricto=False):
+    """Revisar con EXPLAIN QUERY PLAN que ninguna consulta crítica haga un SCAN completo.
+    
+    Se evalúa sobre una copia vacía del esquema en memoria para que el resultado dependa
+    solo de los índices y no del volumen de datos. Con estricto=True lanza RuntimeError.
+    """
+    esquema = sqlite3.connect(':memory:')
+    for conn in conexiones:
+        c = conn.cursor()
+        c.execute('''
+            SELECT sql FROM sqlite_master
+            WHERE type IN ('table', 'index') AND sql IS NOT NULL
+              AND name NOT LIKE 'sqlite_%'
+            ORDER BY type = 'index'
+        ''')
+        for (sql,) in c.fetchall():
+            try:
+                esquema.execute(sql)
+            except sqlite3.OperationalError:
+                pass  # ya existe (varias conexiones al mismo archivo) o es una tabla virtual
+    
+    problemas = []
+    for nombre, sql, params in CONSULTAS_CRITICAS:
+        try:
+            plan = esquema.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.OperationalError as e:
+            problemas.append(f"{nombre}: {e}")
+            continue
+        for fila in plan:
+            detalle = fila[-1]
+            if detalle.startswith('SCAN') and 'USING' not in detalle:
+                problemas.append(f"{nombre}: {detalle}")
+    esquema.close()
+    
+    if problemas:
+        for problema in problemas:
+            print(f"❌ Consulta sin índice -> {problema}")
+        if estricto:
+            raise RuntimeError("Consultas críticas sin índice: " + "; ".join(problemas))
     else:
-        # Localmente, usar carpeta data/
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        return str(data_dir / db_name)
+        print(f"✅ {len(CONSULTAS_CRITICAS)} consultas críticas usan índices")
+    return problemas
+
+@st.cache_resource
+def preparar_esquema():
+    """Migraciones y verificación de planes (una vez por proceso)"""
+    conexiones = []
+    for ruta in dict.fromkeys(ruta_base(db_name) for db_name in ARCHIVOS_LEGADOS):
+        conn = sqlite3.connect(ruta, timeout=30)
+        aplicar_migraciones(conn)
+        conexiones.append(conn)
+    try:
+        problemas = verificar_planes_consulta(conexiones, estricto=VERIFICAR_PLANES_ESTRICTO)
+    finally:
+        for conn in conexiones:
+            conn.close()
+    
+    # Con varios archivos la migración no puede calcular los indicadores (ot_sufijos está aparte)
+    if not USAR_BASE_UNICA:
+        c = conexion_base('ot_unicas.db').cursor()
+        if not _existe_tabla(c, 'kpi_equipo_diario'):
+            recalcular_indicadores_kpi()
+    return problemas
 
 # ===============================INICIALIZACIÓN DE BASES DE DATOS================================
 def init_avisos_db():
     """Base de datos para avisos de mantenimiento"""
-    db_path = get_database_path('avisos.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn = conexion_base('avisos.db')
     c = conn.cursor()
     
     c.execute('''
@@ -411,18 +2437,20 @@ def init_avisos_db():
         )
     ''')
     
-    # CARGAR DESDE GOOGLE SHEETS SI ESTÁ HABILITADO
-    if st.session_state.use_google_sheets:
-        print(f"🔄 Cargando avisos desde Google Sheets...")
-        cargar_desde_google_sheets('avisos', conn)
+    # Control de sincronización incremental
+    init_manifiesto_sync(conn, 'avisos')
+    
+    # Respaldo de los adjuntos en la hoja adjuntos_contenido (vive con avisos)
+    crear_adjuntos_contenido(c)
+    init_manifiesto_sync(conn, 'adjuntos_contenido')
+
     
     conn.commit()
     return conn
 
 def init_equipos_db():
     """Base de datos para información técnica de equipos"""
-    db_path = get_database_path('equipos.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn = conexion_base('equipos.db')
     c = conn.cursor()
     
     c.execute('''
@@ -440,18 +2468,32 @@ def init_equipos_db():
         )
     ''')
     
-    # CARGAR DESDE GOOGLE SHEETS SI ESTÁ HABILITADO
-    if st.session_state.use_google_sheets:
-        print(f"🔄 Cargando equipos desde Google Sheets...")
-        cargar_desde_google_sheets('equipos', conn)
+    # Informes técnicos: una fila por archivo (metadatos + referencia al almacén de adjuntos)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS equipo_informes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo_equipo TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            tipo TEXT,
+            tamano INTEGER,
+            adjunto_ref TEXT,
+            fecha_agregado TEXT,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (codigo_equipo, nombre)
+        )
+    ''')
+    
+    # Control de sincronización incremental
+    init_manifiesto_sync(conn, 'equipos')
+    init_manifiesto_sync(conn, 'equipo_informes')
     
     conn.commit()
     return conn
 
 def init_ot_unicas_db():
     """Base de datos para códigos OT únicos"""
-    db_path = get_database_path('ot_unicas.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn = conexion_base('ot_unicas.db')
     c = conn.cursor()
     
     c.execute('''
@@ -500,18 +2542,19 @@ def init_ot_unicas_db():
         )
     ''')
     
-    # CARGAR DESDE GOOGLE SHEETS SI ESTÁ HABILITADO
-    if st.session_state.use_google_sheets:
-        print(f"🔄 Cargando ot_unicas desde Google Sheets...")
-        cargar_desde_google_sheets('ot_unicas', conn)
+    # Historial de trabajo: un evento por inicio, continuación o culminación
+    init_ot_eventos(c)
+    
+    # Control de sincronización incremental
+    init_manifiesto_sync(conn, 'ot_unicas')
+    init_manifiesto_sync(conn, 'ot_eventos')
     
     conn.commit()
     return conn
 
 def init_ot_sufijos_db():
     """Base de datos para códigos OT con sufijos"""
-    db_path = get_database_path('ot_sufijos.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn = conexion_base('ot_sufijos.db')
     c = conn.cursor()
     
     c.execute('''
@@ -561,18 +2604,16 @@ def init_ot_sufijos_db():
         )
     ''')
     
-    # CARGAR DESDE GOOGLE SHEETS SI ESTÁ HABILITADO
-    if st.session_state.use_google_sheets:
-        print(f"🔄 Cargando ot_sufijos desde Google Sheets...")
-        cargar_desde_google_sheets('ot_sufijos', conn)
+    # Control de sincronización incremental
+    init_manifiesto_sync(conn, 'ot_sufijos')
+
     
     conn.commit()
     return conn
 
 def init_colaboradores_db():
     """Base de datos para colaboradores"""
-    db_path = get_database_path('colaboradores.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn = conexion_base('colaboradores.db')
     c = conn.cursor()
     
     c.execute('''
@@ -591,7 +2632,7 @@ def init_colaboradores_db():
     c.execute('SELECT COUNT(*) FROM colaboradores')
     if c.fetchone()[0] == 0:
         try:
-            contraseña_hash = hashlib.sha256('deseandote1+'.encode()).hexdigest()
+            contraseña_hash = hash_contraseña('deseandote1+')
             c.execute('''
                 INSERT INTO colaboradores 
                 (codigo_id, nombre_colaborador, personal, cargo, contraseña)
@@ -601,10 +2642,9 @@ def init_colaboradores_db():
         except Exception as e:
             print(f"⚠️ Error creando admin: {e}")
     
-    # CARGAR DESDE GOOGLE SHEETS SI ESTÁ HABILITADO
-    if st.session_state.use_google_sheets:
-        print(f"🔄 Cargando colaboradores desde Google Sheets...")
-        cargar_desde_google_sheets('colaboradores', conn)
+    # Control de sincronización incremental
+    init_manifiesto_sync(conn, 'colaboradores')
+
     
     conn.commit()
     return conn
@@ -616,12 +2656,467 @@ conn_ot_unicas = init_ot_unicas_db()
 conn_ot_sufijos = init_ot_sufijos_db()
 conn_equipos = init_equipos_db()
 conn_colaboradores = init_colaboradores_db()
+migrar_archivos_a_base_unica()
+preparar_esquema()
 print("✅ Bases de datos inicializadas")
 
+# ===============================COLA DE SINCRONIZACIÓN EN SEGUNDO PLANO================================
+# Las escrituras solo encolan la tabla modificada; un único hilo por proceso
+# vacía la cola y sube los cambios a Google Sheets sin bloquear la interfaz.
+TABLAS_SYNC = {
+    'avisos': 'avisos.db',
+    'ot_unicas': 'ot_unicas.db',
+    'ot_sufijos': 'ot_sufijos.db',
+    'ot_eventos': 'ot_unicas.db',
+    'equipos': 'equipos.db',
+    'equipo_informes': 'equipos.db',
+    'colaboradores': 'colaboradores.db',
+    'adjuntos_contenido': BASE_ADJUNTOS_CONTENIDO
+}
+# Tablas con adjuntos: al encolarlas también se sube su respaldo (adjuntos_contenido)
+TABLAS_CON_ADJUNTOS = {tabla for tabla, _, _ in COLUMNAS_ADJUNTOS} | {'equipo_informes'}
+SYNC_ESPERA_BASE = 10      # segundos antes del primer reintento
+SYNC_ESPERA_CUOTA = 60     # segundos antes del primer reintento por límite de API
+SYNC_ESPERA_MAXIMA = 900   # tope del backoff exponencial
+SYNC_INTERVALO_REVISION = 15
+
+def init_outbox_db():
+    """Base de datos de la cola de sincronización (outbox)"""
+    conn = conexion_base('sync_outbox.db')
+    c = conn.cursor()
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            modo TEXT DEFAULT 'incremental',
+            encolado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            intentos INTEGER DEFAULT 0,
+            proximo_intento REAL DEFAULT 0,
+            ultimo_error TEXT
+        )
+    ''')
+    
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_resultados (
+            tabla TEXT PRIMARY KEY,
+            ultimo_exito TIMESTAMP,
+            ultimo_error TEXT,
+            ultimo_error_en TIMESTAMP
+        )
+    ''')
+    
+    conn.commit()
+    return conn
+
+conn_outbox = init_outbox_db()
+
+@st.cache_resource
+def obtener_worker_sync():
+    """Crear (una sola vez por proceso) el hilo que vacía la cola de sincronización"""
+    estado = {
+        'evento': threading.Event(),
+        'recursos': None
+    }
+    hilo = threading.Thread(target=_bucle_worker_sync, args=(estado,),
+                            name="worker_sync_sheets", daemon=True)
+    estado['hilo'] = hilo
+    hilo.start()
+    print("✅ Worker de sincronización iniciado")
+    return estado
+
+def _insertar_en_outbox(c, tabla_nombre, modo=MODO_SYNC_INCREMENTAL):
+    """Agregar una petición a la cola; hereda el backoff de las pendientes de la tabla (no lo reinicia)"""
+    c.execute('''
+        INSERT INTO sync_outbox (tabla, modo, intentos, proximo_intento)
+        SELECT ?, ?, COALESCE(MAX(intentos), 0), COALESCE(MAX(proximo_intento), 0)
+        FROM sync_outbox WHERE tabla = ?
+    ''', (tabla_nombre, modo, tabla_nombre))
+
+def encolar_sincronizacion(tabla_nombre, modo=MODO_SYNC_INCREMENTAL):
+    """Encolar la subida de una tabla a Google Sheets (no bloquea)"""
+    if not st.session_state.use_google_sheets:
+        return False
+    
+    try:
+        c = conn_outbox.cursor()
+        if tabla_nombre in TABLAS_CON_ADJUNTOS:
+            _insertar_en_outbox(c, 'adjuntos_contenido')
+        _insertar_en_outbox(c, tabla_nombre, modo)
+        conn_outbox.commit()
+        
+        # Despertar al worker (el hilo no tiene acceso a session_state)
+        estado = obtener_worker_sync()
+        estado['recursos'] = obtener_recursos_gs()
+        estado['evento'].set()
+        return True
+    except Exception as e:
+        print(f"❌ Error encolando sincronización de {tabla_nombre}: {e}")
+        return False
+
+def encolar_todas_tablas(modo=MODO_SYNC_INCREMENTAL):
+    """Encolar todas las tablas del sistema"""
+    return sum(1 for tabla in TABLAS_SYNC if encolar_sincronizacion(tabla, modo))
+
+def obtener_estado_sync():
+    """Profundidad de la cola, último éxito y último error para mostrar en el sidebar"""
+    try:
+        c = conn_outbox.cursor()
+        c.execute('SELECT COUNT(*), COUNT(DISTINCT tabla) FROM sync_outbox')
+        pendientes, tablas_pendientes = c.fetchone()
+        c.execute('SELECT MAX(ultimo_exito) FROM sync_resultados')
+        ultimo_exito = c.fetchone()[0]
+        c.execute('''
+            SELECT tabla, ultimo_error FROM sync_outbox
+            WHERE ultimo_error IS NOT NULL
+            ORDER BY id DESC LIMIT 1
+        ''')
+        error = c.fetchone()
+        return {
+            'pendientes': pendientes,
+            'tablas_pendientes': tablas_pendientes,
+            'ultimo_exito': ultimo_exito,
+            'ultimo_error': f"{error[0]}: {error[1]}" if error else None
+        }
+    except Exception as e:
+        print(f"⚠️ Error leyendo estado de sincronización: {e}")
+        return {'pendientes': 0, 'tablas_pendientes': 0, 'ultimo_exito': None, 'ultimo_error': None}
+
+def _bucle_worker_sync(estado):
+    """Bucle del hilo de sincronización: espera avisos y procesa la cola"""
+    # Conexión propia del hilo
+    conn_cola = nueva_conexion('sync_outbox.db')
+    
+    while True:
+        estado['evento'].wait(timeout=SYNC_INTERVALO_REVISION)
+        estado['evento'].clear()
+        try:
+            _procesar_outbox(estado, conn_cola)
+        except Exception as e:
+            print(f"❌ Error en worker de sincronización: {e}")
+
+def _procesar_outbox(estado, conn_cola):
+    """Procesar las tablas pendientes, una subida por tabla (se agrupan peticiones repetidas)"""
+    if not estado['recursos']:
+        return
+    
+    c = conn_cola.cursor()
+    # El backoff es por tabla: se mira el último reintento programado entre todas sus peticiones
+    c.execute('''
+        SELECT tabla, MAX(id), MAX(CASE WHEN modo = ? THEN 1 ELSE 0 END), MAX(intentos)
+        FROM sync_outbox
+        GROUP BY tabla
+        HAVING MAX(proximo_intento) <= ?
+        ORDER BY MIN(id)
+    ''', (MODO_SYNC_RECONSTRUIR, time.time()))
+    
+    lote = {}
+    for tabla, max_id, reconstruir, intentos in c.fetchall():
+        if tabla not in TABLAS_SYNC:
+            c.execute('DELETE FROM sync_outbox WHERE tabla = ?', (tabla,))
+            conn_cola.commit()
+            continue
+        
+        # No subir una tabla que todavía se está cargando desde la hoja o cuya carga falló:
+        # sin manifiesto se reconstruiría la hoja desde una copia local incompleta
+        hidratacion = estado.get('hidratacion')
+        if hidratacion:
+            with hidratacion['lock']:
+                if hidratacion['tablas'][tabla] != 'listo':
+                    continue
+        
+        modo = MODO_SYNC_RECONSTRUIR if reconstruir else MODO_SYNC_INCREMENTAL
+        lote[tabla] = (modo, max_id, intentos or 0)
+    
+    if not lote:
+        return
+    
+    print(f"📤 Worker sincronizando: {', '.join(f'{t} ({m})' for t, (m, _, _) in lote.items())}")
+    resultados = sincronizar_tablas_en_paralelo(
+        estado['recursos'], [(tabla, modo) for tabla, (modo, _, _) in lote.items()]
+    )
+    
+    exitosas = set()
+    for tabla, (ok, _, error) in resultados.items():
+        _, max_id, intentos = lote[tabla]
+        
+        if not ok:
+            error = error or Exception(f"No se pudo sincronizar {tabla}")
+            cuota = es_error_cuota(error)
+            espera = min((SYNC_ESPERA_CUOTA if cuota else SYNC_ESPERA_BASE) * 2 ** intentos,
+                         SYNC_ESPERA_MAXIMA)
+            # Incluye las peticiones encoladas durante la subida: esperan el mismo backoff
+            c.execute('''
+                UPDATE sync_outbox
+                SET intentos = ?, proximo_intento = ?, ultimo_error = ?
+                WHERE tabla = ?
+            ''', (intentos + 1, time.time() + espera, str(error)[:500], tabla))
+            c.execute('''
+                INSERT INTO sync_resultados (tabla, ultimo_error, ultimo_error_en)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(tabla) DO UPDATE SET
+                    ultimo_error = excluded.ultimo_error,
+                    ultimo_error_en = excluded.ultimo_error_en
+            ''', (tabla, str(error)[:500]))
+            conn_cola.commit()
+            print(f"⚠️ Error sincronizando {tabla}, reintento en {espera}s: {error}")
+            continue
+        
+        # Todas las peticiones hasta max_id quedaron cubiertas por esta subida
+        c.execute('DELETE FROM sync_outbox WHERE tabla = ? AND id <= ?', (tabla, max_id))
+        exitosas.add(tabla)
+        # Las encoladas durante la subida heredaron el backoff anterior: quedan listas
+        c.execute('''
+            UPDATE sync_outbox SET intentos = 0, proximo_intento = 0, ultimo_error = NULL
+            WHERE tabla = ?
+        ''', (tabla,))
+        c.execute('''
+            INSERT INTO sync_resultados (tabla, ultimo_exito)
+            VALUES (?, CURRENT_TIMESTAMP)
+            ON CONFLICT(tabla) DO UPDATE SET ultimo_exito = excluded.ultimo_exito
+        ''', (tabla,))
+        conn_cola.commit()
+    
+    # Con el respaldo ya en la hoja, el base64 de las filas antiguas se puede vaciar (solo
+    # con todas las tablas cargadas, para no tocar una copia local que todavía se reemplaza)
+    hidratacion = estado.get('hidratacion')
+    if exitosas:
+        if hidratacion:
+            with hidratacion['lock']:
+                if any(valor != 'listo' for valor in hidratacion['tablas'].values()):
+                    return
+        for tabla in liberar_adjuntos_respaldados():
+            _insertar_en_outbox(c, tabla)
+            conn_cola.commit()
+            estado['evento'].set()
+
+# ===============================HIDRATACIÓN DIFERIDA DESDE GOOGLE SHEETS================================
+# El login se muestra de inmediato con SQLite local; las tablas se cargan desde la hoja
+# en un hilo en segundo plano (una sola vez por proceso). Colaboradores va primero (login).
+TABLAS_HIDRATACION = ['colaboradores', 'equipos', 'equipo_informes', 'avisos', 'ot_unicas', 'ot_sufijos', 'ot_eventos',
+                      'adjuntos_contenido']
+# Contenido inmutable por clave: la carga se agrega a las filas locales en vez de reemplazarlas
+TABLAS_HIDRATACION_FUSION = {'adjuntos_contenido'}
+HIDRATACION_ESPERA_MAXIMA = 120  # segundos máximos de espera en pantalla
+HIDRATACION_REINTENTO = 60       # segundos antes de reintentar las tablas con error
+
+ICONOS_HIDRATACION = {
+    'pendiente': '⏳',
+    'cargando': '🔄',
+    'listo': '✅',
+    'error': '❌'
+}
+
+@st.cache_resource
+def obtener_hidratacion(_recursos):
+    """Crear (una sola vez por proceso) el hilo que carga las tablas desde Google Sheets"""
+    estado = {
+        'tablas': {tabla: 'pendiente' for tabla in TABLAS_HIDRATACION},
+        'eventos': {tabla: threading.Event() for tabla in TABLAS_HIDRATACION},
+        'orden': list(TABLAS_HIDRATACION),
+        'reintentar': threading.Event(),
+        'lock': threading.Lock()
+    }
+    hilo = threading.Thread(target=_hidratar_tablas, args=(estado, _recursos),
+                            name="hidratacion_sheets", daemon=True)
+    estado['hilo'] = hilo
+    hilo.start()
+    print("🔄 Hidratación desde Google Sheets iniciada en segundo plano")
+    return estado
+
+def obtener_estado_hidratacion():
+    """Estado de la hidratación, o None si Google Sheets no está habilitado"""
+    if not st.session_state.use_google_sheets:
+        return None
+    return obtener_hidratacion(obtener_recursos_gs())
+
+def _version_tabla(c, tabla):
+    """Contador de escrituras de la tabla (None si la tabla no está versionada)"""
+    if tabla not in TABLAS_VERSIONADAS or not _existe_tabla(c, 'versiones_tablas'):
+        return None
+    c.execute("SELECT version FROM versiones_tablas WHERE tabla = ?", (tabla,))
+    fila = c.fetchone()
+    return fila[0] if fila else None
+
+def _cambios_locales_pendientes(c, conn_cola, tabla, version_inicial):
+    """Motivo para no reemplazar la tabla con la hoja, o None si no hay cambios locales.
+    
+    Con base única la cola vive en el mismo archivo y se lee dentro de la transacción de c.
+    """
+    cola = c if _existe_tabla(c, 'sync_outbox') else conn_cola.cursor()
+    cola.execute('SELECT 1 FROM sync_outbox WHERE tabla = ? LIMIT 1', (tabla,))
+    if cola.fetchone():
+        return "tiene cambios locales pendientes de subir"
+    if version_inicial is not None and _version_tabla(c, tabla) != version_inicial:
+        return "se modificó localmente durante la carga"
+    return None
+
+def _tiene_manifiesto(conn, tabla):
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM sync_marcas WHERE tabla = ?', (tabla,))
+    return c.fetchone() is not None
+
+def _hidratar_tabla(tabla, recursos, conn_cola):
+    """Cargar una tabla desde la hoja sin pisar cambios locales; True si quedó lista"""
+    conn = nueva_conexion(TABLAS_SYNC[tabla])
+    try:
+        if tabla in TABLAS_HIDRATACION_FUSION:
+            # Se agrega a las filas locales: los cambios locales nunca se pisan
+            print(f"🔄 Cargando {tabla} desde Google Sheets...")
+            return bool(cargar_desde_google_sheets(tabla, conn, recursos))
+        
+        version = _version_tabla(conn.cursor(), tabla)
+        
+        def conservar_si(c):
+            return _cambios_locales_pendientes(c, conn_cola, tabla, version)
+        
+        # Si quedaron cambios locales sin subir sobre una copia ya sincronizada, la copia local
+        # es la más reciente. Sin manifiesto se descarga igual: una hoja vacía no bloquea la tabla.
+        manifiesto = _tiene_manifiesto(conn, tabla)
+        motivo = conservar_si(conn.cursor()) if manifiesto else None
+        if motivo:
+            print(f"ℹ️ {tabla} {motivo}, se conserva la copia local")
+            resultado = 'conservada'
+        else:
+            print(f"🔄 Cargando {tabla} desde Google Sheets...")
+            resultado = cargar_desde_google_sheets(tabla, conn, recursos, conservar_si)
+        
+        if resultado == 'conservada' and not manifiesto:
+            # Copia local que nunca se sincronizó frente a una hoja con datos: subirla
+            # reconstruiría la hoja solo con los cambios locales. Queda en error (sin subidas).
+            print(f"⚠️ {tabla} nunca se sincronizó con la hoja, no se sube la copia local")
+            return False
+        if resultado and tabla in TABLAS_CON_ADJUNTOS:
+            # El base64 de hojas antiguas pasó al almacén: su respaldo tiene que subir
+            _insertar_en_outbox(conn_cola.cursor(), 'adjuntos_contenido')
+            conn_cola.commit()
+        return bool(resultado)
+    finally:
+        conn.close()
+
+def _hidratar_tablas(estado, recursos):
+    """Hilo de hidratación: carga cada tabla en orden de prioridad y reintenta las que fallan"""
+    conn_cola = nueva_conexion('sync_outbox.db')
+    espera = HIDRATACION_REINTENTO
+    
+    while True:
+        cargadas = set()
+        while True:
+            with estado['lock']:
+                pendientes = [t for t in estado['orden'] if estado['tablas'][t] == 'pendiente']
+                if not pendientes:
+                    break
+                tabla = pendientes[0]
+                estado['tablas'][tabla] = 'cargando'
+            
+            try:
+                resultado = _hidratar_tabla(tabla, recursos, conn_cola)
+            except Exception as e:
+                print(f"❌ Error hidratando {tabla}: {e}")
+                resultado = False
+            
+            with estado['lock']:
+                estado['tablas'][tabla] = 'listo' if resultado else 'error'
+            if resultado:
+                cargadas.add(tabla)
+            # Con error también se libera la espera: requerir_tablas bloquea la sección y el
+            # worker no sube la tabla mientras no quede 'listo'
+            estado['eventos'][tabla].set()
+        
+        # Los indicadores dependen de las OT recién cargadas: se recalculan una vez por pasada
+        if cargadas & {'ot_unicas', 'ot_sufijos'}:
+            recalcular_indicadores_kpi()
+        
+        with estado['lock']:
+            errores = [t for t in estado['orden'] if estado['tablas'][t] == 'error']
+        if not errores:
+            break
+        print(f"⚠️ Hidratación con errores en {', '.join(errores)}, reintento en {espera}s")
+        # "Reintentar ahora" (requerir_tablas) adelanta el reintento
+        if estado['reintentar'].wait(timeout=espera):
+            estado['reintentar'].clear()
+        else:
+            espera = min(espera * 2, SYNC_ESPERA_MAXIMA)
+        _reintentar_hidratacion(estado)
+    
+    conn_cola.close()
+    print("✅ Hidratación desde Google Sheets finalizada")
+
+def _reintentar_hidratacion(estado):
+    """Devolver a 'pendiente' las tablas en error para que el hilo vuelva a cargarlas"""
+    with estado['lock']:
+        for tabla in estado['orden']:
+            if estado['tablas'][tabla] == 'error':
+                estado['tablas'][tabla] = 'pendiente'
+                estado['eventos'][tabla].clear()
+
+def requerir_tablas(*tablas):
+    """Esperar (con spinner) a que las tablas indicadas estén cargadas; las prioriza en la cola.
+    Si alguna no quedó lista, detiene la sección: escribir sobre una copia sin hidratar dejaría
+    cambios locales que impedirían cargarla después."""
+    estado = obtener_estado_hidratacion()
+    if estado is None:
+        return
+    
+    tablas = [t for t in tablas if t in estado['eventos']]
+    pendientes = [t for t in tablas if not estado['eventos'][t].is_set()]
+    if pendientes:
+        # Pasar al frente las tablas que se necesitan ahora
+        with estado['lock']:
+            estado['orden'] = pendientes + [t for t in estado['orden'] if t not in pendientes]
+        
+        with st.spinner(f"☁️ Cargando datos desde Google Sheets: {', '.join(pendientes)}..."):
+            for tabla in pendientes:
+                estado['eventos'][tabla].wait(timeout=HIDRATACION_ESPERA_MAXIMA)
+    
+    with estado['lock']:
+        no_listas = [t for t in tablas if estado['tablas'][t] != 'listo']
+        con_error = [t for t in no_listas if estado['tablas'][t] == 'error']
+    if not no_listas:
+        return
+    
+    if con_error:
+        st.error(f"❌ No se pudieron cargar desde Google Sheets: {', '.join(con_error)}. "
+                 "La sección queda bloqueada para no perder cambios; se reintenta automáticamente.")
+        if st.button("🔄 Reintentar ahora", key=f"reintentar_hidratacion_{'_'.join(tablas)}"):
+            _reintentar_hidratacion(estado)
+            estado['reintentar'].set()
+            st.rerun()
+    else:
+        st.warning(f"⏳ Todavía se están cargando desde Google Sheets: {', '.join(no_listas)}. "
+                   "Vuelva a intentar en unos momentos.")
+    st.stop()
+
+def mostrar_estado_hidratacion(contenedor=st):
+    """Indicador de las tablas que aún se están cargando desde Google Sheets"""
+    estado = obtener_estado_hidratacion()
+    if estado is None:
+        return
+    
+    with estado['lock']:
+        tablas = dict(estado['tablas'])
+    if all(valor == 'listo' for valor in tablas.values()):
+        return
+    
+    contenedor.caption("☁️ Carga desde Google Sheets: " + "  ".join(
+        f"{ICONOS_HIDRATACION[valor]} {tabla}" for tabla, valor in tablas.items()
+    ))
+
+# Retomar la cola pendiente de ejecuciones anteriores e iniciar la hidratación
+if st.session_state.use_google_sheets:
+    estado_worker = obtener_worker_sync()
+    estado_worker['recursos'] = obtener_recursos_gs()
+    estado_worker['hidratacion'] = obtener_estado_hidratacion()
+
 # ===============================SISTEMA DE LOGIN================================
 
 def verificar_login(codigo_id, contraseña):
     """Verifica las credenciales del usuario"""
+    espera = segundos_bloqueo(codigo_id)
+    if espera:
+        return {'autenticado': False, 'error': f'Demasiados intentos fallidos, espere {espera} s'}
+    
+    requerir_tablas('colaboradores')
     try:
         c = conn_colaboradores.cursor()
         c.execute('''
@@ -632,22 +3127,40 @@ def verificar_login(codigo_id, contraseña):
         
         usuario = c.fetchone()
         
-        if usuario:
-            # Verificar contraseña hasheada
-            contraseña_hash = hashlib.sha256(contraseña.encode()).hexdigest()
-            if usuario[3] == contraseña_hash:
-                return {
-                    'codigo_id': usuario[0],
-                    'nombre': usuario[1],
-                    'cargo': usuario[2],
-                    'autenticado': True
-                }
-        
-        return {'autenticado': False, 'error': 'Credenciales inválidas'}
+        # Si el usuario no existe se verifica igual (contra un hash de relleno): mismo tiempo de respuesta
+        if not verificar_en_segundo_plano(contraseña, usuario[3] if usuario else None):
+            registrar_fallo(codigo_id)
+            return {'autenticado': False, 'error': 'Credenciales inválidas'}
+        
+        registrar_exito(codigo_id)
+        if necesita_rehash(usuario[3]):
+            actualizar_hash_contraseña(codigo_id, usuario[3], contraseña)
+        return {
+            'codigo_id': usuario[0],
+            'nombre': usuario[1],
+            'cargo': usuario[2],
+            'autenticado': True
+        }
     
     except Exception as e:
         return {'autenticado': False, 'error': f'Error del sistema: {str(e)}'}
 
+def actualizar_hash_contraseña(codigo_id, hash_anterior, contraseña):
+    """Reemplazar un hash legado (o con parámetros viejos) tras un login correcto"""
+    try:
+        c = conn_colaboradores.cursor()
+        # Solo si nadie cambió la contraseña mientras tanto
+        c.execute('''
+            UPDATE colaboradores SET contraseña = ?
+            WHERE codigo_id = ? AND contraseña = ?
+        ''', (hash_contraseña(contraseña), codigo_id, hash_anterior))
+        conn_colaboradores.commit()
+        if c.rowcount:
+            print(f"🔐 Hash de contraseña actualizado para {codigo_id}")
+            encolar_sincronizacion('colaboradores')
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el hash de {codigo_id}: {e}")
+
 def inicializar_sesion():
     """Inicializa la sesión del usuario si no existe"""
     if 'usuario' not in st.session_state:
@@ -802,6 +3315,7 @@ def obtener_permisos_por_cargo(cargo):
 def mostrar_login():
     """Muestra el formulario de login"""
     st.title("🔐 Sistema de Mantenimiento - Login")
+    mostrar_estado_hidratacion()
     
     st.markdown("---")
     
@@ -922,56 +3436,236 @@ def verificar_acceso_seccion(seccion_requerida):
         st.info(f"Su cargo ({st.session_state.usuario['cargo']}) no tiene acceso a esta funcionalidad.")
         st.stop()
     
-    return True
+    return True
+
+# ===============================CONSULTAS PAGINADAS (FILTROS EN SQL)================================
+# Las pantallas de listados traducen sus filtros a un WHERE parametrizado y piden a SQLite
+# solo la página visible (LIMIT/OFFSET); los totales y métricas se calculan con agregados.
+TAMANOS_PAGINA = [25, 50, 100, 200]
+VALORES_SIN_FILTRO = (None, '', 'Todos', 'Todas')
+
+def filtro_sql(igualdades=None, busqueda='', columnas_busqueda=()):
+    """Traducir los filtros de pantalla a (where, parámetros).
+    
+    igualdades: {columna: valor}; 'Todos'/'Todas'/None no filtran.
+    busqueda: subcadena buscada con LIKE en cualquiera de columnas_busqueda.
+    """
+    condiciones = []
+    params = []
+    for columna, valor in (igualdades or {}).items():
+        if valor in VALORES_SIN_FILTRO:
+            continue
+        condiciones.append(f"{columna} = ?")
+        params.append(valor)
+    
+    busqueda = (busqueda or '').strip()
+    if busqueda and columnas_busqueda:
+        patron = '%' + re.sub(r'([\\%_])', r'\\\1', busqueda) + '%'
+        condiciones.append('(' + ' OR '.join(f"{col} LIKE ? ESCAPE '\\'" for col in columnas_busqueda) + ')')
+        params.extend([patron] * len(columnas_busqueda))
+    
+    where = (' WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    return where, params
+
+def valores_distintos(conn, tabla, columna):
+    """Valores distintos (no nulos) de una columna para llenar un selectbox"""
+    try:
+        c = conn.cursor()
+        c.execute(f"SELECT DISTINCT {columna} FROM {tabla} WHERE {columna} IS NOT NULL ORDER BY {columna}")
+        return [fila[0] for fila in c.fetchall()]
+    except sqlite3.Error:
+        return []
+
+def resumen_consulta(conn, tabla, expresiones, where='', params=()):
+    """Agregados sobre las filas filtradas: {'nombre': 'SQL'} -> {'nombre': valor}"""
+    c = conn.cursor()
+    c.execute(f"SELECT {', '.join(expresiones.values())} FROM {tabla}{where}", list(params))
+    fila = c.fetchone()
+    return {nombre: (valor or 0) for nombre, valor in zip(expresiones, fila)}
+
+def controles_paginacion(clave, total):
+    """Selector de tamaño y número de página; devuelve (pagina, tamano)"""
+    col_tam, col_pag, col_info = st.columns([1, 1, 2])
+    with col_tam:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, key=f"{clave}_tamano")
+    paginas = max(1, -(-total // tamano))
+    
+    # Si los filtros reducen el total, la página guardada puede quedar fuera de rango
+    clave_pagina = f"{clave}_pagina"
+    if st.session_state.get(clave_pagina, 1) > paginas:
+        st.session_state[clave_pagina] = paginas
+    with col_pag:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1, key=clave_pagina)
+    with col_info:
+        st.caption(f"{total} registros · página {pagina} de {paginas}")
+    return int(pagina), tamano
+
+def consultar_pagina(conn, tabla, columnas, where='', params=(), orden='id DESC', pagina=1, tamano=50):
+    """DataFrame con una sola página de resultados"""
+    return pd.read_sql(
+        f"SELECT {columnas} FROM {tabla}{where} ORDER BY {orden} LIMIT ? OFFSET ?",
+        conn, params=list(params) + [tamano, (pagina - 1) * tamano]
+    )
+
+def exportar_consulta_excel(conn, tabla, columnas, where, params, orden, hoja, prefijo, clave):
+    """Generar el Excel de todas las filas filtradas solo cuando el usuario lo pide"""
+    if st.button("📊 Preparar exportación a Excel", key=f"preparar_{clave}", use_container_width=True):
+        ruta, _ = escribir_excel_streaming([
+            (hoja, conn, f"SELECT {columnas} FROM {tabla}{where} ORDER BY {orden}", params)
+        ])
+        boton_descarga_excel(ruta, "📥 Exportar a Excel", prefijo, key=f"descargar_{clave}")
+
+# ===============================EXPORTACIÓN A EXCEL EN STREAMING================================
+# Las filas se leen por bloques con fetchmany y se escriben con el modo write_only de openpyxl
+# a un archivo temporal, así la memoria de la generación no crece con el tamaño de las tablas.
+# La descarga no es streaming: st.download_button lee el .xlsx terminado (comprimido) completo
+# en memoria para servirlo. Las columnas BLOB no se exportan: los adjuntos quedan
+# referenciados por su *_ref (SHA-256).
+FILAS_POR_BLOQUE_EXCEL = 2000
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def columnas_exportables(conn, tabla):
+    """Columnas de una tabla sin las BLOB, listas para un SELECT"""
+    c = conn.cursor()
+    c.execute(f"PRAGMA table_info({tabla})")
+    columnas = [fila[1] for fila in c.fetchall()
+                if (fila[2] or '').upper() != 'BLOB']
+    return ', '.join(columnas)
+
+def _valor_celda_excel(valor):
+    """Adaptar un valor de SQLite a una celda válida de Excel"""
+    if isinstance(valor, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', valor)
+    if isinstance(valor, (bytes, memoryview)):
+        return f"<{len(valor)} bytes>"
+    return valor
+
+def _escribir_hojas_excel(libro, hojas, totales):
+    """Volcar cada consulta por bloques en su hoja (libro en modo write_only)"""
+    for nombre_hoja, conn, sql, params in hojas:
+        hoja = libro.create_sheet(title=nombre_hoja)
+        c = conn.cursor()
+        c.execute(sql, list(params))
+        hoja.append([col[0] for col in c.description])
+        
+        filas = 0
+        while True:
+            bloque = c.fetchmany(FILAS_POR_BLOQUE_EXCEL)
+            if not bloque:
+                break
+            for fila in bloque:
+                hoja.append([_valor_celda_excel(valor) for valor in fila])
+            filas += len(bloque)
+        totales[nombre_hoja] = filas
+
+def escribir_excel_streaming(hojas, ruta=None, hoja_resumen=None):
+    """Escribir varias consultas como hojas de un .xlsx sin cargarlas en memoria.
+    
+    hojas: lista de (nombre_hoja, conexión, sql, parámetros).
+    hoja_resumen: nombre de una hoja final con el total de registros por hoja (opcional).
+    Devuelve (ruta del archivo, {hoja: filas escritas}).
+    """
+    if ruta is None:
+        descriptor, ruta = tempfile.mkstemp(prefix='exportacion_', suffix='.xlsx')
+        os.close(descriptor)
+    
+    libro = Workbook(write_only=True)
+    totales = {}
+    try:
+        _escribir_hojas_excel(libro, hojas, totales)
+    except Exception:
+        libro.close()
+        os.remove(ruta)
+        raise
+    
+    if hoja_resumen:
+        resumen = libro.create_sheet(title=hoja_resumen)
+        resumen.append(['Base de Datos', 'Total Registros', 'Fecha Exportación'])
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M")
+        for nombre_hoja, filas in totales.items():
+            resumen.append([nombre_hoja, filas, fecha])
+    
+    libro.save(ruta)
+    return ruta, totales
+
+def boton_descarga_excel(ruta, etiqueta, prefijo, key=None):
+    """Ofrecer un .xlsx temporal para descarga y eliminar el archivo del disco.
+    
+    st.download_button lee el archivo completo en memoria: solo la generación usa memoria acotada.
+    """
+    try:
+        with open(ruta, 'rb') as archivo:
+            st.download_button(
+                label=etiqueta,
+                data=archivo,
+                file_name=f"{prefijo}_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                mime=MIME_EXCEL,
+                use_container_width=True,
+                key=key
+            )
+    finally:
+        try:
+            os.remove(ruta)
+        except OSError as e:
+            print(f"⚠️ No se pudo eliminar el temporal {ruta}: {e}")
 
 # ===============================FUNCIONES PARA MANEJO DE INFORMES ACUMULATIVOS================================
 
 def obtener_informes_equipo(codigo_equipo):
-    """Obtener la lista de informes de un equipo"""
+    """Obtener la lista de informes de un equipo (solo metadatos, sin el contenido)"""
     c = conn_equipos.cursor()
-    c.execute('SELECT informes_json FROM equipos WHERE codigo_equipo = ?', (codigo_equipo,))
-    resultado = c.fetchone()
-    
-    if resultado and resultado[0]:
-        try:
-            return json.loads(resultado[0])
-        except json.JSONDecodeError:
-            return []
-    else:
-        return []
+    c.execute('''
+        SELECT id, nombre, tipo, tamano, adjunto_ref, fecha_agregado
+        FROM equipo_informes WHERE codigo_equipo = ? ORDER BY id
+    ''', (codigo_equipo,))
+    columnas = [col[0] for col in c.description]
+    return [dict(zip(columnas, fila)) for fila in c.fetchall()]
+
+def agregar_informe_equipo(c, codigo_equipo, archivo):
+    """Guardar un informe en el almacén y registrarlo; False si ya existe ese nombre"""
+    c.execute("SELECT 1 FROM equipo_informes WHERE codigo_equipo = ? AND nombre = ?",
+              (codigo_equipo, archivo.name))
+    if c.fetchone():
+        return False
+    c.execute('''
+        INSERT INTO equipo_informes (codigo_equipo, nombre, tipo, tamano, adjunto_ref, fecha_agregado)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (codigo_equipo, archivo.name,
+          archivo.type if hasattr(archivo, 'type') else 'application/octet-stream',
+          archivo.size if hasattr(archivo, 'size') else None,
+          guardar_adjunto(c, archivo), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    return True
 
 def eliminar_informe_especifico(codigo_equipo, nombre_informe):
     """Eliminar un informe específico de un equipo"""
     try:
-        informes = obtener_informes_equipo(codigo_equipo)
-        informes_actualizados = [inf for inf in informes if inf['nombre'] != nombre_informe]
-        
         c = conn_equipos.cursor()
-        c.execute('UPDATE equipos SET informes_json = ? WHERE codigo_equipo = ?', 
-                 (json.dumps(informes_actualizados), codigo_equipo))
+        c.execute('DELETE FROM equipo_informes WHERE codigo_equipo = ? AND nombre = ?',
+                 (codigo_equipo, nombre_informe))
         conn_equipos.commit()
+        encolar_sincronizacion('equipo_informes')
         
         return True
     except Exception as e:
         st.error(f"❌ Error al eliminar el informe: {str(e)}")
         return False
 
-def descargar_informe(informe_data):
-    """Crear un botón de descarga para un informe"""
-    if 'datos_base64' in informe_data:
-        # Decodificar de base64
-        datos_bytes = base64.b64decode(informe_data['datos_base64'])
-    else:
-        # Para compatibilidad con datos antiguos
-        datos_bytes = informe_data.get('datos', b'')
-    
-    st.download_button(
-        label=f"📥 Descargar {informe_data['nombre']}",
-        data=datos_bytes,
-        file_name=informe_data['nombre'],
-        mime=informe_data.get('tipo', 'application/octet-stream'),
-        key=f"download_{informe_data['nombre']}_{hash(informe_data['nombre'])}"
-    )
+def descargar_informe(informe_data, **kwargs):
+    """Crear un botón de descarga para un informe (lee el archivo del almacén de adjuntos)"""
+    ruta = ruta_adjunto(informe_data.get('adjunto_ref'))
+    if not ruta:
+        st.caption("⚠️ Archivo no disponible")
+        return
+    
+    with open(ruta, 'rb') as archivo:
+        st.download_button(
+            label=f"📥 Descargar {informe_data['nombre']}",
+            data=archivo,
+            file_name=informe_data['nombre'],
+            mime=informe_data.get('tipo') or 'application/octet-stream',
+            key=f"download_{informe_data['id']}",
+            **kwargs
+        )
 
 # ===============================FUNCIONES PARA GESTIÓN DE COLABORADORES================================
 
@@ -985,14 +3679,7 @@ def verificar_codigo_unico(codigo_id):
         st.error(f"Error al verificar código: {e}")
         return False
 
-def hash_contraseña(contraseña):
-    """Hashea la contraseña para almacenamiento seguro"""
-    return hashlib.sha256(contraseña.encode()).hexdigest()
-
-def verificar_contraseña(contraseña_plana, contraseña_hash):
-    """Verifica si la contraseña coincide con el hash"""
-    return hashlib.sha256(contraseña_plana.encode()).hexdigest() == contraseña_hash
-
+@cache_por_tablas('colaboradores')
 def obtener_colaboradores():
     """Obtener lista de todos los colaboradores"""
     try:
@@ -1025,6 +3712,7 @@ def obtener_colaborador_por_id(codigo_id):
         st.error(f"Error al obtener colaborador: {e}")
         return None
 
+@cache_por_tablas('colaboradores')
 def obtener_cargos_unicos():
     """Obtener lista de cargos únicos"""
     try:
@@ -1033,6 +3721,7 @@ def obtener_cargos_unicos():
     except:
         return []
 
+@cache_por_tablas('colaboradores')
 def obtener_personal_unico():
     """Obtener lista de tipos de personal únicos"""
     try:
@@ -1051,7 +3740,7 @@ def agregar_colaborador_con_sincronizacion(codigo_id, nombre_colaborador, person
             st.error("❌ Error: El código ID ya existe en la base de datos")
             return False
             
-        contraseña_hash = hashlib.sha256(contraseña.encode()).hexdigest()
+        contraseña_hash = hash_contraseña(contraseña)
         
         c.execute('''
             INSERT INTO colaboradores 
@@ -1061,13 +3750,9 @@ def agregar_colaborador_con_sincronizacion(codigo_id, nombre_colaborador, person
         
         conn_colaboradores.commit()
         
-        # SINCRONIZAR INMEDIATAMENTE CON GOOGLE SHEETS
-        if st.session_state.use_google_sheets:
-            with st.spinner("🔄 Guardando en la nube..."):
-                if guardar_en_google_sheets('colaboradores', conn_colaboradores):
-                    st.success("✅ Guardado en la nube exitosamente!")
-                else:
-                    st.warning("⚠️ Guardado solo localmente")
+        # ENCOLAR SINCRONIZACIÓN CON GOOGLE SHEETS (SEGUNDO PLANO)
+        if encolar_sincronizacion('colaboradores'):
+            st.info("☁️ Sincronización con la nube en cola")
         
         st.success(f"✅ Colaborador '{nombre_colaborador}' agregado exitosamente!")
         st.success(f"🔑 Código para login: **{codigo_id}**")
@@ -1486,37 +4171,25 @@ def mostrar_inicio_autenticado():
     try:
         # Avisos activos
         if permisos.get('acceso_avisos', False):
-            avisos_activos = pd.read_sql(
-                "SELECT COUNT(*) as total FROM avisos WHERE estado IN ('INGRESADO', 'PROGRAMADO')", 
-                conn_avisos
-            ).iloc[0]['total']
+            avisos_activos = contar_registros(conn_avisos, 'avisos', ('INGRESADO', 'PROGRAMADO'))
             with col_res1:
                 st.metric("Avisos Activos", avisos_activos)
         
         # OT pendientes
         if permisos.get('acceso_ot', False):
-            ot_pendientes = pd.read_sql(
-                "SELECT COUNT(*) as total FROM ot_unicas WHERE estado IN ('PROGRAMADO', 'PENDIENTE')", 
-                conn_ot_unicas
-            ).iloc[0]['total']
+            ot_pendientes = contar_registros(conn_ot_unicas, 'ot_unicas', ('PROGRAMADO', 'PENDIENTE'))
             with col_res2:
                 st.metric("OT Pendientes", ot_pendientes)
         
         # Total equipos
         if permisos.get('acceso_equipos', False):
-            total_equipos = pd.read_sql(
-                "SELECT COUNT(*) as total FROM equipos", 
-                conn_equipos
-            ).iloc[0]['total']
+            total_equipos = contar_registros(conn_equipos, 'equipos')
             with col_res3:
                 st.metric("Equipos Registrados", total_equipos)
         
         # Total colaboradores
         if permisos.get('acceso_colaboradores', False):
-            total_colaboradores = pd.read_sql(
-                "SELECT COUNT(*) as total FROM colaboradores", 
-                conn_colaboradores
-            ).iloc[0]['total']
+            total_colaboradores = contar_registros(conn_colaboradores, 'colaboradores')
             with col_res4:
                 st.metric("Colaboradores", total_colaboradores)
                 
@@ -1621,46 +4294,40 @@ def mostrar_formulario_equipos():
                 st.error("Por favor, complete todos los campos obligatorios (*)")
                 return
             
+            errores_adjuntos = validar_adjuntos(especificaciones_file, informe_file)
+            if errores_adjuntos:
+                for error in errores_adjuntos:
+                    st.error(f"❌ {error}")
+                return
+            
             try:
                 # Procesar archivos subidos
                 especificaciones_nombre = None
-                especificaciones_datos = None
-                informes_json = "[]"  # Inicialmente vacío
                 
                 if especificaciones_file is not None:
                     especificaciones_nombre = especificaciones_file.name
-                    especificaciones_datos = especificaciones_file.getvalue()
-                
-                # Procesar informe inicial si se subió
-                if informe_file is not None:
-                    informe_inicial = {
-                        'nombre': informe_file.name,
-                        'fecha_agregado': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        'tipo': informe_file.type if hasattr(informe_file, 'type') else 'application/octet-stream'
-                    }
-                    informes_json = json.dumps([informe_inicial])
-                
-                # Insertar en la base de datos local
-                c = conn_equipos.cursor()
-                c.execute('''
-                    INSERT INTO equipos 
-                    (codigo_equipo, equipo, area, descripcion_funcionalidad, 
-                     especificaciones_tecnica_nombre, especificaciones_tecnica_datos,
-                     informes_json, actualizado_en)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (codigo_equipo, equipo, area, descripcion_funcionalidad,
-                      especificaciones_nombre, especificaciones_datos,
-                      informes_json))
                 
-                conn_equipos.commit()
+                # Insertar en la base de datos local (el archivo va al almacén de adjuntos)
+                with unidad_de_trabajo('equipos.db') as c:
+                    especificaciones_ref = guardar_adjunto(c, especificaciones_file)
+                    c.execute('''
+                        INSERT INTO equipos 
+                        (codigo_equipo, equipo, area, descripcion_funcionalidad, 
+                         especificaciones_tecnica_nombre, especificaciones_tecnica_ref,
+                         actualizado_en)
+                        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ''', (codigo_equipo, equipo, area, descripcion_funcionalidad,
+                          especificaciones_nombre, especificaciones_ref))
+                    
+                    # Informe inicial si se subió
+                    if informe_file is not None:
+                        agregar_informe_equipo(c, codigo_equipo, informe_file)
                 
-                # GUARDAR EN GOOGLE SHEETS SI ESTÁ HABILITADO
-                if st.session_state.use_google_sheets:
-                    with st.spinner("🔄 Sincronizando con la nube..."):
-                        if guardar_en_google_sheets('equipos', conn_equipos):
-                            st.success("✅ Guardado en la nube exitosamente!")
-                        else:
-                            st.warning("⚠️ Guardado solo localmente")
+                # ENCOLAR SINCRONIZACIÓN CON GOOGLE SHEETS (SEGUNDO PLANO)
+                if informe_file is not None:
+                    encolar_sincronizacion('equipo_informes')
+                if encolar_sincronizacion('equipos'):
+                    st.info("☁️ Sincronización con la nube en cola")
 
                 st.success(f"✅ Equipo '{equipo}' guardado exitosamente!")
                 st.balloons()
@@ -1670,19 +4337,20 @@ def mostrar_formulario_equipos():
             except Exception as e:
                 st.error(f"❌ Error al guardar el equipo: {str(e)}")
 
+# Columnas de los listados de equipos (los informes se cuentan sin leer su contenido)
+COLUMNAS_LISTA_EQUIPOS = '''
+    id, codigo_equipo, equipo, area, descripcion_funcionalidad, especificaciones_tecnica_nombre,
+    (SELECT COUNT(*) FROM equipo_informes i
+     WHERE i.codigo_equipo = equipos.codigo_equipo) AS num_informes,
+    creado_en
+'''
+
+@cache_por_tablas('equipos', 'equipo_informes')
 def obtener_lista_equipos():
     """Obtener lista de todos los equipos"""
     try:
-        df = pd.read_sql('''
-            SELECT 
-                id,
-                codigo_equipo, 
-                equipo, 
-                area, 
-                descripcion_funcionalidad,
-                especificaciones_tecnica_nombre,
-                informes_json,
-                creado_en
+        df = pd.read_sql(f'''
+            SELECT {COLUMNAS_LISTA_EQUIPOS}
             FROM equipos 
             ORDER BY creado_en DESC
         ''', conn_equipos)
@@ -1691,6 +4359,7 @@ def obtener_lista_equipos():
         st.error(f"Error al cargar equipos: {e}")
         return pd.DataFrame()
 
+@cache_por_tablas('equipos')
 def obtener_areas_unicas():
     """Obtener lista de áreas únicas"""
     try:
@@ -1711,33 +4380,25 @@ def mostrar_lista_equipos():
         areas = obtener_areas_unicas()
         area_filtro = st.selectbox("Filtrar por área", ["Todas"] + areas)
     
-    # Obtener todos los equipos
-    df = obtener_lista_equipos()
-    
-    if df.empty:
-        st.info("No hay equipos registrados aún.")
+    # Filtros resueltos en SQL
+    where, params = filtro_sql(
+        {'area': area_filtro}, busqueda,
+        ('codigo_equipo', 'equipo', 'descripcion_funcionalidad')
+    )
+    resumen = resumen_consulta(conn_equipos, 'equipos', {
+        'total': 'COUNT(*)',
+        'areas': 'COUNT(DISTINCT area)',
+        'con_especificaciones': 'COUNT(especificaciones_tecnica_nombre)',
+        'con_informes': 'SUM(EXISTS (SELECT 1 FROM equipo_informes i WHERE i.codigo_equipo = equipos.codigo_equipo))'
+    }, where, params)
+    
+    if resumen['total'] == 0:
+        st.info("No hay equipos registrados aún." if not params else "No hay equipos que coincidan con los filtros.")
         return
     
-    # Aplicar filtros
-    if busqueda:
-        mask = (df['codigo_equipo'].str.contains(busqueda, case=False, na=False)) | \
-               (df['equipo'].str.contains(busqueda, case=False, na=False)) | \
-               (df['descripcion_funcionalidad'].str.contains(busqueda, case=False, na=False))
-        df = df[mask]
-    
-    if area_filtro != "Todas":
-        df = df[df['area'] == area_filtro]
-    
-    # Contar número de informes para cada equipo
-    def contar_informes(informes_json):
-        if informes_json and informes_json != "[]":
-            try:
-                return len(json.loads(informes_json))
-            except:
-                return 0
-        return 0
-    
-    df['num_informes'] = df['informes_json'].apply(contar_informes)
+    pagina, tamano = controles_paginacion("lista_equipos", resumen['total'])
+    df = consultar_pagina(conn_equipos, 'equipos', COLUMNAS_LISTA_EQUIPOS, where, params,
+                          'creado_en DESC, id DESC', pagina, tamano)
     
     # Mostrar tabla de equipos
     st.dataframe(
@@ -1753,19 +4414,17 @@ def mostrar_lista_equipos():
         }
     )
     
-    # Estadísticas rápidas
+    # Estadísticas rápidas (sobre todos los equipos filtrados, no solo la página)
     st.subheader("📈 Estadísticas")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Equipos", len(df))
+        st.metric("Total Equipos", resumen['total'])
     with col2:
-        st.metric("Áreas Únicas", df['area'].nunique())
+        st.metric("Áreas Únicas", resumen['areas'])
     with col3:
-        equipos_con_especificaciones = df['especificaciones_tecnica_nombre'].notna().sum()
-        st.metric("Con Especificaciones", equipos_con_especificaciones)
+        st.metric("Con Especificaciones", resumen['con_especificaciones'])
     with col4:
-        equipos_con_informes = (df['num_informes'] > 0).sum()
-        st.metric("Con Informes", equipos_con_informes)
+        st.metric("Con Informes", resumen['con_informes'])
     
     return df
 
@@ -1774,7 +4433,7 @@ def eliminar_archivo_equipo(codigo_equipo, tipo_archivo):
     try:
         c = conn_equipos.cursor()
         if tipo_archivo == "especificaciones":
-            c.execute('UPDATE equipos SET especificaciones_tecnica_nombre = NULL, especificaciones_tecnica_datos = NULL WHERE codigo_equipo = ?', (codigo_equipo,))
+            c.execute('UPDATE equipos SET especificaciones_tecnica_nombre = NULL, especificaciones_tecnica_ref = NULL WHERE codigo_equipo = ?', (codigo_equipo,))
             mensaje = "Especificaciones eliminadas correctamente"
             conn_equipos.commit()
             st.success(f"✅ {mensaje}!")
@@ -1785,29 +4444,27 @@ def eliminar_archivo_equipo(codigo_equipo, tipo_archivo):
 
 def agregar_equipo_con_sincronizacion(codigo_equipo, equipo, area, descripcion_funcionalidad,
                                      especificaciones_nombre=None, especificaciones_datos=None,
-                                     informes_json="[]"):
-    """Agregar nuevo equipo con sincronización automática"""
+                                     informes=None):
+    """Agregar nuevo equipo con sincronización automática (informes: archivos subidos)"""
     try:
-        c = conn_equipos.cursor()
-        c.execute('''
-            INSERT INTO equipos 
-            (codigo_equipo, equipo, area, descripcion_funcionalidad, 
-             especificaciones_tecnica_nombre, especificaciones_tecnica_datos,
-             informes_json, actualizado_en)
-            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (codigo_equipo, equipo, area, descripcion_funcionalidad,
-              especificaciones_nombre, especificaciones_datos,
-              informes_json))
-        
-        conn_equipos.commit()
-        
-        # SINCRONIZAR INMEDIATAMENTE
-        if st.session_state.use_google_sheets:
-            with st.spinner("🔄 Sincronizando con la nube..."):
-                if guardar_en_google_sheets('equipos', conn_equipos):
-                    st.success("✅ Guardado en la nube exitosamente!")
-                else:
-                    st.warning("⚠️ Guardado solo localmente")
+        with unidad_de_trabajo('equipos.db') as c:
+            especificaciones_ref = guardar_adjunto(c, especificaciones_datos)
+            c.execute('''
+                INSERT INTO equipos 
+                (codigo_equipo, equipo, area, descripcion_funcionalidad, 
+                 especificaciones_tecnica_nombre, especificaciones_tecnica_ref,
+                 actualizado_en)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (codigo_equipo, equipo, area, descripcion_funcionalidad,
+                  especificaciones_nombre, especificaciones_ref))
+            for informe in informes or []:
+                agregar_informe_equipo(c, codigo_equipo, informe)
+        
+        # ENCOLAR SINCRONIZACIÓN (SEGUNDO PLANO)
+        if informes:
+            encolar_sincronizacion('equipo_informes')
+        if encolar_sincronizacion('equipos'):
+            st.info("☁️ Sincronización con la nube en cola")
         
         return True
     except sqlite3.IntegrityError:
@@ -1949,50 +4606,46 @@ def editar_equipo():
                 st.error("Por favor, complete todos los campos obligatorios (*)")
                 return
             
+            errores_adjuntos = validar_adjuntos(nuevo_especificaciones, nuevo_informe)
+            if errores_adjuntos:
+                for error in errores_adjuntos:
+                    st.error(f"❌ {error}")
+                return
+            
             try:
                 # Procesar nuevos archivos si se subieron
                 especificaciones_nombre = equipo_actualizado[5]
-                especificaciones_datos = equipo_actualizado[6]
-                
                 if nuevo_especificaciones is not None:
                     especificaciones_nombre = nuevo_especificaciones.name
-                    especificaciones_datos = nuevo_especificaciones.getvalue()
                 
-                # Procesar nuevos informes (ACUMULATIVOS)
-                informes_final = informes_actualizados.copy() if informes_actualizados else []
+                # UNA SOLA TRANSACCIÓN: adjuntos, informe y equipo se guardan juntos o no se guardan
+                informe_agregado = False
+                with unidad_de_trabajo('equipos.db') as c:
+                    especificaciones_ref = guardar_adjunto(c, nuevo_especificaciones)  # None conserva la actual
+                    
+                    # Procesar nuevo informe (ACUMULATIVO: se agrega a los existentes)
+                    if nuevo_informe is not None:
+                        informe_agregado = agregar_informe_equipo(c, codigo_seleccionado, nuevo_informe)
+                    
+                    c.execute('''
+                        UPDATE equipos SET
+                            equipo = ?, area = ?, descripcion_funcionalidad = ?,
+                            especificaciones_tecnica_nombre = ?,
+                            especificaciones_tecnica_ref = COALESCE(?, especificaciones_tecnica_ref),
+                            actualizado_en = CURRENT_TIMESTAMP
+                        WHERE codigo_equipo = ?
+                    ''', (nuevo_equipo, nueva_area, nueva_descripcion,
+                          especificaciones_nombre, especificaciones_ref,
+                          codigo_seleccionado))
                 
+                # ENCOLAR SINCRONIZACIÓN CON GOOGLE SHEETS (después del commit)
                 if nuevo_informe is not None:
-                    # Verificar si ya existe un informe con el mismo nombre
-                    nombre_existe = any(inf['nombre'] == nuevo_informe.name for inf in informes_final)
-                    
-                    if nombre_existe:
-                        st.warning(f"⚠️ Ya existe un informe con el nombre '{nuevo_informe.name}'. No se agregará.")
-                    else:
-                        # Codificar a base64 para JSON
-                        datos_bytes = nuevo_informe.getvalue()
-                        datos_base64 = base64.b64encode(datos_bytes).decode('utf-8')
-                        
-                        nuevo_informe_data = {
-                            'nombre': nuevo_informe.name,
-                            'datos_base64': datos_base64,  # Usar base64 en lugar de bytes
-                            'fecha_agregado': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'tipo': nuevo_informe.type if hasattr(nuevo_informe, 'type') else 'application/octet-stream'
-                        }
-                        informes_final.append(nuevo_informe_data)
+                    if informe_agregado:
+                        encolar_sincronizacion('equipo_informes')
                         st.success(f"✅ Se agregó el informe: {nuevo_informe.name}")
-                
-                # Actualizar en la base de datos
-                c.execute('''
-                    UPDATE equipos SET
-                        equipo = ?, area = ?, descripcion_funcionalidad = ?,
-                        especificaciones_tecnica_nombre = ?, especificaciones_tecnica_datos = ?,
-                        informes_json = ?, actualizado_en = CURRENT_TIMESTAMP
-                    WHERE codigo_equipo = ?
-                ''', (nuevo_equipo, nueva_area, nueva_descripcion,
-                      especificaciones_nombre, especificaciones_datos,
-                      json.dumps(informes_final), codigo_seleccionado))
-                
-                conn_equipos.commit()
+                    else:
+                        st.warning(f"⚠️ Ya existe un informe con el nombre '{nuevo_informe.name}'. No se agregará.")
+                encolar_sincronizacion('equipos')
                 st.success(f"✅ Equipo '{nuevo_equipo}' actualizado exitosamente!")
                 
                 # En lugar de rerun, mostramos confirmación
@@ -2031,11 +4684,15 @@ def eliminar_equipo():
         with col2:
             if st.button("🗑️ Confirmar Eliminación", type="primary", use_container_width=True):
                 try:
-                    c = conn_equipos.cursor()
-                    c.execute('DELETE FROM equipos WHERE codigo_equipo = ?', (codigo_seleccionado,))
-                    conn_equipos.commit()
+                    with unidad_de_trabajo('equipos.db') as c:
+                        c.execute('DELETE FROM equipo_informes WHERE codigo_equipo = ?', (codigo_seleccionado,))
+                        c.execute('DELETE FROM equipos WHERE codigo_equipo = ?', (codigo_seleccionado,))
+                        eliminados = c.rowcount
                     
-                    if c.rowcount > 0:
+                    if eliminados > 0:
+                        # La eliminación tiene que llegar a la hoja o la próxima carga la revive
+                        encolar_sincronizacion('equipo_informes')
+                        encolar_sincronizacion('equipos')
                         st.success(f"✅ Equipo '{nombre_equipo}' eliminado exitosamente!")
                         st.balloons()
                     else:
@@ -2054,17 +4711,6 @@ def mostrar_dashboard_equipos():
         st.info("No hay equipos registrados para mostrar estadísticas.")
         return
     
-    # Contar número de informes para cada equipo
-    def contar_informes(informes_json):
-        if informes_json and informes_json != "[]":
-            try:
-                return len(json.loads(informes_json))
-            except:
-                return 0
-        return 0
-    
-    df['num_informes'] = df['informes_json'].apply(contar_informes)
-    
     # Métricas principales
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -2149,47 +4795,14 @@ def gestion_equipos():
 # ===============================FUNCIONES PARA AVISOS DE MANTENIMIENTO================================
 
 def generar_codigo_padre():
-    """Genera código padre automático con formato CODP-00000001"""
-    conn = conn_avisos
-    c = conn.cursor()
-    
-    # Obtener el último código padre
-    c.execute('SELECT codigo_padre FROM avisos ORDER BY id DESC LIMIT 1')
-    ultimo_codigo = c.fetchone()
-    
-    if ultimo_codigo and ultimo_codigo[0]:
-        # Extraer el número y incrementar
-        try:
-            numero = int(ultimo_codigo[0].split('-')[1])
-            nuevo_numero = numero + 1
-        except:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    return f"CODP-{nuevo_numero:08d}"
+    """Próximo código padre (CODP-00000001); el definitivo se asigna al guardar"""
+    return vista_previa_codigo('avisos.db', 'CODP')
 
 def generar_codigo_mantto():
-    """Genera código de aviso a mantenimiento con formato AM-00000001"""
-    conn = conn_avisos
-    c = conn.cursor()
-    
-    # Obtener el último código mantto
-    c.execute('SELECT codigo_mantto FROM avisos ORDER BY id DESC LIMIT 1')
-    ultimo_codigo = c.fetchone()
-    
-    if ultimo_codigo and ultimo_codigo[0]:
-        # Extraer el número y incrementar
-        try:
-            numero = int(ultimo_codigo[0].split('-')[1])
-            nuevo_numero = numero + 1
-        except:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    return f"AM-{nuevo_numero:08d}"
+    """Próximo código de aviso (AM-00000001); el definitivo se asigna al guardar"""
+    return vista_previa_codigo('avisos.db', 'AM')
 
+@cache_por_tablas('equipos')
 def obtener_areas_equipos():
     """Obtener lista de áreas únicas de la base de equipos"""
     try:
@@ -2199,6 +4812,7 @@ def obtener_areas_equipos():
         st.error(f"Error al cargar áreas: {e}")
         return []
 
+@cache_por_tablas('equipos')
 def obtener_equipos_por_area(area):
     """Obtener lista de equipos filtrados por área"""
     try:
@@ -2323,37 +4937,42 @@ def mostrar_formulario_avisos():
                 st.error("Por favor, complete todos los campos obligatorios (*)")
                 return
             
+            errores_adjuntos = validar_adjuntos(imagen_aviso)
+            if errores_adjuntos:
+                st.error(f"❌ {errores_adjuntos[0]}")
+                return
+            
             try:
                 # Procesar imagen si se subió
-                imagen_nombre = None
-                imagen_datos = None
-                
-                if imagen_aviso is not None:
-                    imagen_nombre = imagen_aviso.name
-                    imagen_datos = imagen_aviso.getvalue()
+                imagen_nombre = imagen_aviso.name if imagen_aviso is not None else None
                 
                 # Calcular antigüedad
                 antiguedad_dias = calcular_antiguedad(fecha_actual)
                 
-                # Insertar en la base de datos
-                c = conn_avisos.cursor()
-                c.execute('''
-                    INSERT INTO avisos 
-                    (codigo_padre, codigo_mantto, estado, antiguedad, area, equipo, 
-                     codigo_equipo, descripcion_problema, ingresado_por, ingresado_el,
-                     hay_riesgo, imagen_aviso_nombre, imagen_aviso_datos, tipo_mantenimiento)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    codigo_padre, codigo_mantto, estado, antiguedad_dias, area_seleccionada, 
-                    equipo_seleccionado, codigo_equipo, descripcion_problema, ingresado_por, 
-                    fecha_actual, hay_riesgo, imagen_nombre, imagen_datos, tipo_mantenimiento
-                ))
+                # La imagen se procesa y se escribe antes de tomar el bloqueo de escritura
+                imagen_guardada = preparar_imagen(imagen_aviso)
                 
-                conn_avisos.commit()
+                # Insertar en la base de datos (los códigos se asignan en la misma transacción)
+                with unidad_de_trabajo('avisos.db') as c:
+                    codigo_padre = siguiente_codigo(c, 'CODP')
+                    codigo_mantto = siguiente_codigo(c, 'AM')
+                    imagen_ref, miniatura_ref = registrar_imagen(c, imagen_guardada)
+                    c.execute('''
+                        INSERT INTO avisos 
+                        (codigo_padre, codigo_mantto, estado, antiguedad, area, equipo, 
+                         codigo_equipo, descripcion_problema, ingresado_por, ingresado_el,
+                         hay_riesgo, imagen_aviso_nombre, imagen_aviso_ref, imagen_aviso_miniatura_ref,
+                         tipo_mantenimiento)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        codigo_padre, codigo_mantto, estado, antiguedad_dias, area_seleccionada, 
+                        equipo_seleccionado, codigo_equipo, descripcion_problema, ingresado_por, 
+                        fecha_actual, hay_riesgo, imagen_nombre, imagen_ref, miniatura_ref,
+                        tipo_mantenimiento
+                    ))
                 
-                # Sincronizar con Google Sheets
-                if st.session_state.gs_client:
-                    sync_table_to_google_sheets('avisos', conn_avisos)
+                # Sincronizar con Google Sheets (segundo plano)
+                encolar_sincronizacion('avisos')
 
                 st.success(f"✅ Aviso de mantenimiento '{codigo_mantto}' creado exitosamente!")
                 st.balloons()
@@ -2389,30 +5008,20 @@ def mostrar_formulario_avisos():
             except Exception as e:
                 st.error(f"❌ Error al crear el aviso: {str(e)}")
 
-def obtener_lista_avisos():
-    """Obtener lista de todos los avisos"""
+# Columnas de los listados de avisos
+COLUMNAS_LISTA_AVISOS = f'''
+    id, codigo_padre, codigo_mantto, estado, {antiguedad_sql('avisos')} AS antiguedad, area, equipo, codigo_equipo,
+    descripcion_problema, ingresado_por, ingresado_el, hay_riesgo, imagen_aviso_nombre,
+    tipo_mantenimiento, creado_en
+'''
+
+@cache_por_tablas('avisos')
+def obtener_lista_avisos(where='', params=(), pagina=1, tamano=50, fuente=None):
+    """Obtener una página de avisos (filtros ya traducidos con filtro_sql y fuente_busqueda)"""
+    fuente = fuente or fuente_busqueda(conn_avisos, 'avisos', '', 'creado_en DESC, id DESC')
     try:
-        df = pd.read_sql('''
-            SELECT 
-                id,
-                codigo_padre,
-                codigo_mantto,
-                estado,
-                antiguedad,
-                area,
-                equipo,
-                codigo_equipo,
-                descripcion_problema,
-                ingresado_por,
-                ingresado_el,
-                hay_riesgo,
-                imagen_aviso_nombre,
-                tipo_mantenimiento,
-                creado_en
-            FROM avisos 
-            ORDER BY creado_en DESC
-        ''', conn_avisos)
-        return df
+        return consultar_pagina(conn_avisos, fuente['origen'], COLUMNAS_LISTA_AVISOS + fuente['columnas'],
+                                where, params, fuente['orden'], pagina, tamano)
     except Exception as e:
         st.error(f"Error al cargar avisos: {e}")
         return pd.DataFrame()
@@ -2432,33 +5041,37 @@ def mostrar_lista_avisos():
         areas = ["Todas"] + obtener_areas_equipos()
         area_filtro = st.selectbox("Filtrar por área", areas, key="area_filtro_avisos")
     
-    # Obtener todos los avisos
-    df = obtener_lista_avisos()
-    
-    if df.empty:
-        st.info("No hay avisos de mantenimiento registrados aún.")
+    # Filtros resueltos en SQL; el texto buscado va al índice FTS5 (ranking por relevancia)
+    fuente = fuente_busqueda(conn_avisos, 'avisos', busqueda, 'creado_en DESC, id DESC')
+    where, params = filtro_sql(
+        {'estado': estado_filtro, 'area': area_filtro}, fuente['busqueda_like'],
+        ('codigo_padre', 'codigo_mantto', 'equipo', 'descripcion_problema')
+    )
+    params = fuente['params'] + params
+    resumen = resumen_consulta(conn_avisos, fuente['origen'], {
+        'total': 'COUNT(*)',
+        'ingresados': "SUM(estado = 'INGRESADO')",
+        'con_riesgo': "SUM(hay_riesgo = 'SI')",
+        'antiguedad': f"AVG({antiguedad_sql('avisos')})"
+    }, where, params)
+    
+    if resumen['total'] == 0:
+        st.info("No hay avisos de mantenimiento registrados aún." if not params else "No hay avisos que coincidan con los filtros.")
         return
     
-    # Aplicar filtros
-    if busqueda:
-        mask = (df['codigo_padre'].str.contains(busqueda, case=False, na=False)) | \
-               (df['codigo_mantto'].str.contains(busqueda, case=False, na=False)) | \
-               (df['equipo'].str.contains(busqueda, case=False, na=False)) | \
-               (df['descripcion_problema'].str.contains(busqueda, case=False, na=False))
-        df = df[mask]
-    
-    if estado_filtro != "Todos":
-        df = df[df['estado'] == estado_filtro]
-    
-    if area_filtro != "Todas":
-        df = df[df['area'] == area_filtro]
+    pagina, tamano = controles_paginacion("lista_avisos", resumen['total'])
+    df = obtener_lista_avisos(where, params, pagina, tamano, fuente)
     
-    # Mostrar tabla de avisos
+    # Mostrar tabla de avisos (con el fragmento encontrado si se está buscando)
+    columnas = ['codigo_mantto', 'codigo_padre', 'estado', 'area', 'equipo', 'ingresado_por', 'ingresado_el', 'antiguedad', 'creado_en']
+    if 'coincidencia' in df.columns:
+        columnas.insert(1, 'coincidencia')
     st.dataframe(
-        df[['codigo_mantto', 'codigo_padre', 'estado', 'area', 'equipo', 'ingresado_por', 'ingresado_el', 'antiguedad', 'creado_en']],
+        df[columnas],
         use_container_width=True,
         column_config={
             "codigo_mantto": "Código Aviso",
+            "coincidencia": "Coincidencia",
             "codigo_padre": "Código Padre",
             "estado": "Estado",
             "area": "Área",
@@ -2470,18 +5083,17 @@ def mostrar_lista_avisos():
         }
     )
     
-    # Estadísticas rápidas
+    # Estadísticas rápidas (sobre todos los avisos filtrados, no solo la página)
     st.subheader("📈 Estadísticas de Avisos")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total Avisos", len(df))
+        st.metric("Total Avisos", resumen['total'])
     with col2:
-        st.metric("Avisos Ingresados", len(df[df['estado'] == 'INGRESADO']))
+        st.metric("Avisos Ingresados", resumen['ingresados'])
     with col3:
-        st.metric("Con Riesgo", len(df[df['hay_riesgo'] == 'SI']))
+        st.metric("Con Riesgo", resumen['con_riesgo'])
     with col4:
-        avg_antiguedad = df['antiguedad'].mean() if not df.empty else 0
-        st.metric("Antigüedad Promedio", f"{avg_antiguedad:.1f} días")
+        st.metric("Antigüedad Promedio", f"{resumen['antiguedad']:.1f} días")
     
     return df
 
@@ -2510,48 +5122,11 @@ def gestion_avisos():
 
 # ===============================FUNCIONES PARA ÓRDENES DE TRABAJO================================
 
-def generar_codigo_padre_ot_directa():
-    """Genera código padre automático para OT directa con formato CODP-OT-00000001"""
-    conn = conn_ot_unicas
-    c = conn.cursor()
-    
-    # Obtener el último código padre de OT directas (que empiecen con CODP-OT-)
-    c.execute("SELECT codigo_padre FROM ot_unicas WHERE codigo_padre LIKE 'CODP-OT-%' ORDER BY id DESC LIMIT 1")
-    ultimo_codigo = c.fetchone()
-    
-    if ultimo_codigo and ultimo_codigo[0]:
-        # Extraer el número y incrementar
-        try:
-            numero = int(ultimo_codigo[0].split('-')[2])
-            nuevo_numero = numero + 1
-        except:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    return f"CODP-OT-{nuevo_numero:08d}"
-
 def generar_codigo_ot_base():
-    """Genera código OT base automático con formato OT-0000001"""
-    conn = conn_ot_unicas
-    c = conn.cursor()
-    
-    # Obtener el último código OT base
-    c.execute('SELECT codigo_ot_base FROM ot_unicas ORDER BY id DESC LIMIT 1')
-    ultimo_codigo = c.fetchone()
-    
-    if ultimo_codigo and ultimo_codigo[0]:
-        # Extraer el número y incrementar
-        try:
-            numero = int(ultimo_codigo[0].split('-')[1])
-            nuevo_numero = numero + 1
-        except:
-            nuevo_numero = 1
-    else:
-        nuevo_numero = 1
-    
-    return f"OT-{nuevo_numero:07d}"
+    """Próximo código OT base (OT-0000001); el definitivo se asigna al guardar"""
+    return vista_previa_codigo('ot_unicas.db', 'OT')
 
+@cache_por_tablas('avisos')
 def obtener_avisos_ingresados():
     """Obtener lista de avisos con estado INGRESADO"""
     try:
@@ -2835,29 +5410,29 @@ def mostrar_formulario_ot_directa():
                 # Calcular antigüedad
                 antiguedad_dias = calcular_antiguedad_ot(fecha_actual.date())
                 
-                # INSERTAR EN OT_UNICAS (sin codigo_mantto ya que es OT directa)
-                c_ot = conn_ot_unicas.cursor()
-                c_ot.execute('''
-                    INSERT INTO ot_unicas 
-                    (codigo_padre, codigo_ot_base, ot_base_creado_en,
-                     estado, antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
-                     componentes, descripcion_problema, tipo_mantenimiento, tipo_preventivo,
-                     cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
-                     cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
-                     responsable, clasificacion, sistema, materiales, alimentador_proveedor,
-                     fecha_estimada_inicio, duracion_estimada, ingresado_por, ingresado_el, hay_riesgo)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    codigo_padre, codigo_ot_base, fecha_actual,
-                    estado_ot, antiguedad_dias, prioridad_nueva, area_seleccionada, equipo_seleccionado,
-                    codigo_equipo, componentes, descripcion_problema, tipo_mantenimiento, tipo_preventivo,
-                    cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
-                    cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
-                    responsable, clasificacion, sistema, materiales, alimentador_proveedor,
-                    fecha_estimada_inicio, duracion_estimada, ingresado_por, fecha_ingreso_auto, hay_riesgo
-                ))
-                
-                conn_ot_unicas.commit()
+                # INSERTAR EN OT_UNICAS (sin codigo_mantto ya que es OT directa); códigos asignados en la misma transacción
+                with unidad_de_trabajo('ot_unicas.db') as c:
+                    codigo_padre = siguiente_codigo(c, 'CODP')
+                    codigo_ot_base = siguiente_codigo(c, 'OT')
+                    c.execute('''
+                        INSERT INTO ot_unicas 
+                        (codigo_padre, codigo_ot_base, ot_base_creado_en,
+                         estado, antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
+                         componentes, descripcion_problema, tipo_mantenimiento, tipo_preventivo,
+                         cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
+                         cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
+                         responsable, clasificacion, sistema, materiales, alimentador_proveedor,
+                         fecha_estimada_inicio, duracion_estimada, ingresado_por, ingresado_el, hay_riesgo)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        codigo_padre, codigo_ot_base, fecha_actual,
+                        estado_ot, antiguedad_dias, prioridad_nueva, area_seleccionada, equipo_seleccionado,
+                        codigo_equipo, componentes, descripcion_problema, tipo_mantenimiento, tipo_preventivo,
+                        cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
+                        cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
+                        responsable, clasificacion, sistema, materiales, alimentador_proveedor,
+                        fecha_estimada_inicio, duracion_estimada, ingresado_por, fecha_ingreso_auto, hay_riesgo
+                    ))
                 
                 st.success(f"✅ Orden de Trabajo Directa '{codigo_ot_base}' creada exitosamente!")
                 st.balloons()
@@ -3136,60 +5711,59 @@ def mostrar_crear_nueva_ot_desde_aviso():
                 # Calcular antigüedad
                 antiguedad_dias = calcular_antiguedad_ot(fecha_actual.date())
                 
-                # ACTUALIZAR AVISO (cambiar estado de INGRESADO a PROGRAMADO)
-                c_avisos = conn_avisos.cursor()
-                c_avisos.execute('''
-                    UPDATE avisos 
-                    SET estado = 'PROGRAMADO', 
-                        codigo_ot_base = ?,
-                        componentes = ?,
-                        cantidad_mecanicos = ?,
-                        cantidad_electricos = ?,
-                        cantidad_soldadores = ?,
-                        cantidad_op_vahos = ?,
-                        cantidad_calderistas = ?,
-                        descripcion_trabajo = ?,
-                        responsable = ?,
-                        clasificacion = ?,
-                        sistema = ?,
-                        materiales = ?,
-                        alimentador_proveedor = ?,
-                        fecha_estimada_inicio = ?,
-                        duracion_estimada = ?,
-                        prioridad = ?
-                    WHERE codigo_mantto = ?
-                ''', (
-                    codigo_ot_base, componentes, cantidad_mecanicos, cantidad_electricos,
-                    cantidad_soldadores, cantidad_op_vahos, cantidad_calderistas,
-                    descripcion_trabajo, responsable, clasificacion, sistema,
-                    materiales, alimentador_proveedor, fecha_estimada_inicio,
-                    duracion_estimada, prioridad_nueva, codigo_mantto_seleccionado
-                ))
-                
-                # INSERTAR EN OT_UNICAS
-                c_ot = conn_ot_unicas.cursor()
-                c_ot.execute('''
-                    INSERT INTO ot_unicas 
-                    (codigo_padre, codigo_mantto, codigo_ot_base, ot_base_creado_en,
-                     estado, antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
-                     componentes, descripcion_problema, tipo_mantenimiento,
-                     cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
-                     cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
-                     responsable, clasificacion, sistema, materiales, alimentador_proveedor,
-                     fecha_estimada_inicio, duracion_estimada)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    aviso_data['codigo_padre'], aviso_data['codigo_mantto'], codigo_ot_base, fecha_actual,
-                    estado_ot, antiguedad_dias, prioridad_nueva, aviso_data['area'], aviso_data['equipo'],
-                    aviso_data['codigo_equipo'], componentes, aviso_data['descripcion_problema'],
-                    aviso_data['tipo_mantenimiento'], cantidad_mecanicos, cantidad_electricos,
-                    cantidad_soldadores, cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
-                    responsable, clasificacion, sistema, materiales, alimentador_proveedor,
-                    fecha_estimada_inicio, duracion_estimada
-                ))
-                
-                conn_avisos.commit()
-                conn_ot_unicas.commit()
+                # UNA SOLA TRANSACCIÓN: código OT, aviso actualizado y OT creada
+                with unidad_de_trabajo('ot_unicas.db', 'avisos.db') as c:
+                    codigo_ot_base = siguiente_codigo(c, 'OT')
+                    
+                    # ACTUALIZAR AVISO (cambiar estado de INGRESADO a PROGRAMADO)
+                    c.execute('''
+                        UPDATE avisos 
+                        SET estado = 'PROGRAMADO', 
+                            codigo_ot_base = ?,
+                            componentes = ?,
+                            cantidad_mecanicos = ?,
+                            cantidad_electricos = ?,
+                            cantidad_soldadores = ?,
+                            cantidad_op_vahos = ?,
+                            cantidad_calderistas = ?,
+                            descripcion_trabajo = ?,
+                            responsable = ?,
+                            clasificacion = ?,
+                            sistema = ?,
+                            materiales = ?,
+                            alimentador_proveedor = ?,
+                            fecha_estimada_inicio = ?,
+                            duracion_estimada = ?,
+                            prioridad = ?
+                        WHERE codigo_mantto = ?
+                    ''', (
+                        codigo_ot_base, componentes, cantidad_mecanicos, cantidad_electricos,
+                        cantidad_soldadores, cantidad_op_vahos, cantidad_calderistas,
+                        descripcion_trabajo, responsable, clasificacion, sistema,
+                        materiales, alimentador_proveedor, fecha_estimada_inicio,
+                        duracion_estimada, prioridad_nueva, codigo_mantto_seleccionado
+                    ))
+                    
+                    # INSERTAR EN OT_UNICAS
+                    c.execute('''
+                        INSERT INTO ot_unicas 
+                        (codigo_padre, codigo_mantto, codigo_ot_base, ot_base_creado_en,
+                         estado, antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
+                         componentes, descripcion_problema, tipo_mantenimiento,
+                         cantidad_mecanicos, cantidad_electricos, cantidad_soldadores,
+                         cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
+                         responsable, clasificacion, sistema, materiales, alimentador_proveedor,
+                         fecha_estimada_inicio, duracion_estimada)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        aviso_data['codigo_padre'], aviso_data['codigo_mantto'], codigo_ot_base, fecha_actual,
+                        estado_ot, antiguedad_dias, prioridad_nueva, aviso_data['area'], aviso_data['equipo'],
+                        aviso_data['codigo_equipo'], componentes, aviso_data['descripcion_problema'],
+                        aviso_data['tipo_mantenimiento'], cantidad_mecanicos, cantidad_electricos,
+                        cantidad_soldadores, cantidad_op_vahos, cantidad_calderistas, descripcion_trabajo,
+                        responsable, clasificacion, sistema, materiales, alimentador_proveedor,
+                        fecha_estimada_inicio, duracion_estimada
+                    ))
                 
                 st.success(f"✅ Orden de Trabajo '{codigo_ot_base}' creada exitosamente!")
                 st.success(f"✅ Aviso '{codigo_mantto_seleccionado}' actualizado a estado PROGRAMADO")
@@ -3352,6 +5926,7 @@ def mostrar_asociar_avisos_ot_existente():
         except Exception as e:
             st.error(f"❌ Error al asociar los avisos a la OT: {str(e)}")
 
+@cache_por_tablas('ot_unicas')
 def obtener_ot_programadas():
     """Obtener lista de OTs en estado PROGRAMADO"""
     try:
@@ -3377,6 +5952,7 @@ def obtener_ot_programadas():
         st.error(f"Error al cargar OTs programadas: {e}")
         return pd.DataFrame()
 
+@cache_por_tablas('avisos')
 def obtener_avisos_compatibles(area, equipo):
     """Obtener avisos en estado INGRESADO que coincidan con área y equipo específicos"""
     try:
@@ -3409,29 +5985,20 @@ def validar_formato_duracion(duracion):
     patron = r'^([0-9]{2}):([0-9]{2}):([0-9]{2})$'
     return bool(re.match(patron, duracion))
 
-def obtener_lista_ot():
-    """Obtener lista de todas las órdenes de trabajo"""
+# Columnas de los listados de OT
+COLUMNAS_LISTA_OT = f'''
+    codigo_ot_base, codigo_padre, codigo_mantto, estado, {antiguedad_sql('ot_unicas')} AS antiguedad, prioridad_nueva,
+    area, equipo, responsable, clasificacion, sistema, fecha_estimada_inicio,
+    duracion_estimada, ot_base_creado_en
+'''
+
+@cache_por_tablas('ot_unicas')
+def obtener_lista_ot(where='', params=(), pagina=1, tamano=50, fuente=None):
+    """Obtener una página de órdenes de trabajo (filtros ya traducidos con filtro_sql y fuente_busqueda)"""
+    fuente = fuente or fuente_busqueda(conn_ot_unicas, 'ot_unicas', '', 'ot_base_creado_en DESC, id DESC')
     try:
-        df = pd.read_sql('''
-            SELECT 
-                codigo_ot_base,
-                codigo_padre,
-                codigo_mantto,
-                estado,
-                antiguedad,
-                prioridad_nueva,
-                area,
-                equipo,
-                responsable,
-                clasificacion,
-                sistema,
-                fecha_estimada_inicio,
-                duracion_estimada,
-                ot_base_creado_en
-            FROM ot_unicas 
-            ORDER BY ot_base_creado_en DESC
-        ''', conn_ot_unicas)
-        return df
+        return consultar_pagina(conn_ot_unicas, fuente['origen'], COLUMNAS_LISTA_OT + fuente['columnas'],
+                                where, params, fuente['orden'], pagina, tamano)
     except Exception as e:
         st.error(f"Error al cargar órdenes de trabajo: {e}")
         return pd.DataFrame()
@@ -3451,33 +6018,37 @@ def mostrar_lista_ot():
         prioridades = ["Todas", "1. ALTO", "2. MEDIO", "3. BAJO"]
         prioridad_filtro = st.selectbox("Filtrar por prioridad", prioridades, key="prioridad_ot")
     
-    # Obtener todas las OT
-    df = obtener_lista_ot()
-    
-    if df.empty:
-        st.info("No hay órdenes de trabajo registradas aún.")
+    # Filtros resueltos en SQL; el texto buscado va al índice FTS5 (ranking por relevancia)
+    fuente = fuente_busqueda(conn_ot_unicas, 'ot_unicas', busqueda, 'ot_base_creado_en DESC, id DESC')
+    where, params = filtro_sql(
+        {'estado': estado_filtro, 'prioridad_nueva': prioridad_filtro}, fuente['busqueda_like'],
+        ('codigo_ot_base', 'codigo_padre', 'codigo_mantto', 'equipo')
+    )
+    params = fuente['params'] + params
+    resumen = resumen_consulta(conn_ot_unicas, fuente['origen'], {
+        'total': 'COUNT(*)',
+        'programadas': "SUM(estado = 'PROGRAMADO')",
+        'prioridad_alta': "SUM(prioridad_nueva = '1. ALTO')",
+        'antiguedad': f"AVG({antiguedad_sql('ot_unicas')})"
+    }, where, params)
+    
+    if resumen['total'] == 0:
+        st.info("No hay órdenes de trabajo registradas aún." if not params else "No hay órdenes de trabajo que coincidan con los filtros.")
         return
     
-    # Aplicar filtros
-    if busqueda:
-        mask = (df['codigo_ot_base'].str.contains(busqueda, case=False, na=False)) | \
-               (df['codigo_padre'].str.contains(busqueda, case=False, na=False)) | \
-               (df['codigo_mantto'].str.contains(busqueda, case=False, na=False)) | \
-               (df['equipo'].str.contains(busqueda, case=False, na=False))
-        df = df[mask]
-    
-    if estado_filtro != "Todos":
-        df = df[df['estado'] == estado_filtro]
-    
-    if prioridad_filtro != "Todas":
-        df = df[df['prioridad_nueva'] == prioridad_filtro]
+    pagina, tamano = controles_paginacion("lista_ot", resumen['total'])
+    df = obtener_lista_ot(where, params, pagina, tamano, fuente)
     
-    # Mostrar tabla de OT
+    # Mostrar tabla de OT (con el fragmento encontrado si se está buscando)
+    columnas = ['codigo_ot_base', 'codigo_mantto', 'estado', 'prioridad_nueva', 'area', 'equipo', 'responsable', 'fecha_estimada_inicio', 'ot_base_creado_en']
+    if 'coincidencia' in df.columns:
+        columnas.insert(1, 'coincidencia')
     st.dataframe(
-        df[['codigo_ot_base', 'codigo_mantto', 'estado', 'prioridad_nueva', 'area', 'equipo', 'responsable', 'fecha_estimada_inicio', 'ot_base_creado_en']],
+        df[columnas],
         use_container_width=True,
         column_config={
             "codigo_ot_base": "Código OT",
+            "coincidencia": "Coincidencia",
             "codigo_mantto": "Código Aviso",
             "estado": "Estado",
             "prioridad_nueva": "Prioridad",
@@ -3489,18 +6060,17 @@ def mostrar_lista_ot():
         }
     )
     
-    # Estadísticas rápidas
+    # Estadísticas rápidas (sobre todas las OT filtradas, no solo la página)
     st.subheader("📈 Estadísticas de OT")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Total OT", len(df))
+        st.metric("Total OT", resumen['total'])
     with col2:
-        st.metric("OT Programadas", len(df[df['estado'] == 'PROGRAMADO']))
+        st.metric("OT Programadas", resumen['programadas'])
     with col3:
-        st.metric("Prioridad Alta", len(df[df['prioridad_nueva'] == '1. ALTO']))
+        st.metric("Prioridad Alta", resumen['prioridad_alta'])
     with col4:
-        avg_antiguedad = df['antiguedad'].mean() if not df.empty else 0
-        st.metric("Antigüedad Promedio", f"{avg_antiguedad:.1f} días")
+        st.metric("Antigüedad Promedio", f"{resumen['antiguedad']:.1f} días")
     
     return df
 
@@ -3541,7 +6111,7 @@ def mostrar_reporte_ot_pendientes():
     """Muestra el reporte de OT pendientes"""
     # Obtener OT en estados pendientes (PROGRAMADO y PENDIENTE)
     try:
-        df = pd.read_sql('''
+        df = pd.read_sql(f'''
             SELECT 
                 codigo_ot_base,
                 codigo_mantto,
@@ -3556,7 +6126,7 @@ def mostrar_reporte_ot_pendientes():
                 sistema,
                 fecha_estimada_inicio,
                 duracion_estimada,
-                antiguedad,
+                {antiguedad_sql('ot_unicas')} AS antiguedad,
                 ot_base_creado_en
             FROM ot_unicas 
             WHERE estado IN ('PROGRAMADO', 'PENDIENTE')
@@ -3656,20 +6226,40 @@ def mostrar_reporte_ot_pendientes():
     # Gráficos
     col_chart1, col_chart2 = st.columns(2)
     
+    # Conteos desde resumen_ot; el responsable no está en el resumen y usa las filas cargadas
+    if responsable_filtro == "Todos":
+        filtros_resumen = {
+            'estados': ('PROGRAMADO', 'PENDIENTE') if estado_filtro == "Todos" else (estado_filtro,),
+            'area': None if area_filtro == "Todas" else area_filtro,
+            'prioridad': None if prioridad_filtro == "Todas" else prioridad_filtro
+        }
+        estado_counts = resumen_ot(conn_ot_unicas, 'estado', **filtros_resumen)
+        prioridad_counts = resumen_ot(conn_ot_unicas, 'prioridad', **filtros_resumen)
+    else:
+        estado_counts = df_filtrado['estado'].value_counts()
+        prioridad_counts = df_filtrado['prioridad_nueva'].value_counts()
+    
     with col_chart1:
         # Distribución por estado
         if not df_filtrado.empty:
             st.subheader("📊 Distribución por Estado")
-            estado_counts = df_filtrado['estado'].value_counts()
             st.bar_chart(estado_counts)
     
     with col_chart2:
         # Distribución por prioridad
         if not df_filtrado.empty:
             st.subheader("🎯 Distribución por Prioridad")
-            prioridad_counts = df_filtrado['prioridad_nueva'].value_counts()
             st.bar_chart(prioridad_counts)
     
+    # Envejecimiento de las OT abiertas (tramos calculados en SQL)
+    try:
+        tramos = resumen_tramos_antiguedad(conn_ot_unicas, 'ot_unicas', ('PROGRAMADO', 'PENDIENTE'))
+        if not tramos.empty:
+            st.subheader("⏳ OT Pendientes por Antigüedad")
+            st.bar_chart(tramos)
+    except Exception as e:
+        print(f"⚠️ No se pudieron calcular los tramos de antigüedad: {e}")
+    
     # Tabla detallada
     st.subheader("📋 Detalle de OT Pendientes")
     
@@ -3708,6 +6298,7 @@ def mostrar_reporte_ot_pendientes():
             use_container_width=True
         )
 
+@cache_por_tablas('ot_unicas')
 def obtener_ot_para_inicio():
     """Obtener OT en estado PROGRAMADO y PENDIENTE para iniciar/continuar mantenimiento"""
     try:
@@ -3720,8 +6311,7 @@ def obtener_ot_para_inicio():
                 codigo_equipo,
                 responsable,
                 descripcion_trabajo,
-                descripcion_trabajo_realizado,  -- AÑADIR para acumular
-                observaciones_cierre,           -- AÑADIR para acumular
+                descripcion_trabajo_realizado,  -- último evento (el historial está en ot_eventos)
                 fecha_estimada_inicio,
                 estado                         -- AÑADIR para saber el estado actual
             FROM ot_unicas 
@@ -3740,24 +6330,8 @@ def obtener_ot_para_inicio():
         return pd.DataFrame()
 
 def generar_codigo_ot_sufijo(codigo_ot_base):
-    """Genera código OT con sufijo basado en el código OT base"""
-    try:
-        c = conn_ot_sufijos.cursor()
-        
-        # Contar cuántos sufijos existen para esta OT base
-        c.execute('''
-            SELECT COUNT(*) FROM ot_sufijos 
-            WHERE codigo_ot_base = ?
-        ''', (codigo_ot_base,))
-        
-        count = c.fetchone()[0]
-        nuevo_sufijo = count + 1
-        
-        return f"{codigo_ot_base}-{nuevo_sufijo:02d}"
-        
-    except Exception as e:
-        st.error(f"Error al generar código OT con sufijo: {e}")
-        return f"{codigo_ot_base}-01"
+    """Próximo código OT con sufijo (OT-0000001-01); el definitivo se asigna al guardar"""
+    return vista_previa_codigo('ot_sufijos.db', f"sufijo:{codigo_ot_base}")
 
 def mostrar_formulario_inicio_mantenimiento():
     """Muestra formulario para iniciar/continuar mantenimiento de OT"""
@@ -3814,15 +6388,10 @@ def mostrar_formulario_inicio_mantenimiento():
     if ot_data['descripcion_trabajo']:
         st.info(f"**Descripción del Trabajo Planificado:** {ot_data['descripcion_trabajo']}")
     
-    # Mostrar descripción acumulada anterior si existe
-    if es_continuacion and pd.notna(ot_data['descripcion_trabajo_realizado']):
+    # Historial de trabajo anterior (eventos de la OT seleccionada)
+    if es_continuacion:
         with st.expander("📝 Ver trabajo realizado anteriormente", expanded=True):
-            st.info(f"**Trabajo acumulado:**\n\n{ot_data['descripcion_trabajo_realizado']}")
-    
-    # Mostrar observaciones acumuladas anteriores si existen
-    if es_continuacion and pd.notna(ot_data['observaciones_cierre']):
-        with st.expander("📋 Ver observaciones anteriores", expanded=False):
-            st.info(f"**Observaciones acumuladas:**\n\n{ot_data['observaciones_cierre']}")
+            mostrar_historial_ot(codigo_ot_base_seleccionado, ot_data['descripcion_trabajo_realizado'])
     
     st.markdown("---")
     
@@ -3891,18 +6460,13 @@ def mostrar_formulario_inicio_mantenimiento():
             help="Lista de responsables que participan en el mantenimiento"
         )
         
-        # Descripción del trabajo realizado (ACUMULATIVA)
+        # Descripción del trabajo realizado (nuevo evento en el historial)
         st.write("**Descripción del Trabajo Realizado **")
-        st.caption("💡 Esta descripción se acumulará con el trabajo anterior")
-        
-        # Mostrar descripción anterior como placeholder si existe
-        placeholder_text = ""
-        if es_continuacion and pd.notna(ot_data['descripcion_trabajo_realizado']):
-            placeholder_text = ot_data['descripcion_trabajo_realizado'] + "\n\n--- NUEVO TRABAJO ---\n"
+        st.caption("💡 Se agregará al historial de la OT junto al trabajo anterior")
         
         nueva_descripcion_trabajo = st.text_area(
             "Agregar nueva descripción del trabajo realizado:",
-            placeholder=placeholder_text + "Describa el trabajo adicional que se está realizando...",
+            placeholder="Describa el trabajo adicional que se está realizando...",
             height=120,
             help="Descripción completa de las actividades adicionales que se están ejecutando"
         )
@@ -3930,18 +6494,13 @@ def mostrar_formulario_inicio_mantenimiento():
             else:
                 duracion_paro = "NO APLICA"
         
-        # Observaciones de cierre (ACUMULATIVAS)
+        # Observaciones (se guardan con el evento)
         st.write("**Observaciones Adicionales**")
-        st.caption("💡 Estas observaciones se acumularán con las anteriores")
-        
-        # Mostrar observaciones anteriores como placeholder si existen
-        obs_placeholder = ""
-        if es_continuacion and pd.notna(ot_data['observaciones_cierre']):
-            obs_placeholder = ot_data['observaciones_cierre'] + "\n\n--- NUEVAS OBSERVACIONES ---\n"
+        st.caption("💡 Se guardarán en el historial junto a esta descripción")
         
         nuevas_observaciones = st.text_area(
             "Agregar nuevas observaciones:",
-            placeholder=obs_placeholder + "Ingrese cualquier observación adicional...",
+            placeholder="Ingrese cualquier observación adicional...",
             height=80,
             help="Observaciones adicionales sobre el mantenimiento"
         )
@@ -3970,65 +6529,66 @@ def mostrar_formulario_inicio_mantenimiento():
                 return
             
             try:
-                # CONSTRUIR DESCRIPCIÓN ACUMULADA
-                if es_continuacion and pd.notna(ot_data['descripcion_trabajo_realizado']):
-                    descripcion_acumulada = f"{ot_data['descripcion_trabajo_realizado']}\n\n--- CONTINUACIÓN: {datetime.now().strftime('%Y-%m-%d %H:%M')} ---\n{nueva_descripcion_trabajo}"
-                else:
-                    descripcion_acumulada = f"--- INICIO: {datetime.now().strftime('%Y-%m-%d %H:%M')} ---\n{nueva_descripcion_trabajo}"
-                
-                # CONSTRUIR OBSERVACIONES ACUMULADAS
-                if es_continuacion and pd.notna(ot_data['observaciones_cierre']):
-                    observaciones_acumuladas = f"{ot_data['observaciones_cierre']}\n\n--- CONTINUACIÓN: {datetime.now().strftime('%Y-%m-%d %H:%M')} ---\n{nuevas_observaciones}"
-                else:
-                    observaciones_acumuladas = nuevas_observaciones if nuevas_observaciones else None
-                
-                # 1. ACTUALIZAR OT_UNICAS (mantener estado PENDIENTE y acumular datos)
-                c_ot_unicas = conn_ot_unicas.cursor()
-                c_ot_unicas.execute('''
-                    UPDATE ot_unicas 
-                    SET estado = ?,
-                        fecha_inicio_mantenimiento = COALESCE(fecha_inicio_mantenimiento, ?),
-                        hora_inicio_mantenimiento = COALESCE(hora_inicio_mantenimiento, ?),
-                        hora_finalizacion_mantenimiento = ?,
-                        responsables_comienzo = ?,
-                        descripcion_trabajo_realizado = ?,
-                        observaciones_cierre = ?,
-                        paro_linea = ?
-                    WHERE codigo_ot_base = ?
-                ''', (
-                    estado_nuevo, 
-                    fecha_inicio_mantenimiento, 
-                    hora_inicio_mantenimiento.strftime('%H:%M:%S'),
-                    hora_finalizacion_mantenimiento.strftime('%H:%M:%S'), 
-                    responsables_comienzo,
-                    descripcion_acumulada,
-                    observaciones_acumuladas,
-                    paro_linea, 
-                    codigo_ot_base_seleccionado
-                ))
+                observaciones_evento = nuevas_observaciones if nuevas_observaciones else None
                 
-                # 2. INSERTAR EN OT_SUFIJOS (solo para nuevos inicios)
-                if not es_continuacion:
-                    c_ot_sufijos = conn_ot_sufijos.cursor()
-                    c_ot_sufijos.execute('''
-                        INSERT INTO ot_sufijos 
-                        (codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
-                         ot_sufijo_creado_en, estado, area, equipo, codigo_equipo,
-                         responsables_comienzo, fecha_inicio_mantenimiento, 
-                         hora_inicio_mantenimiento, hora_finalizacion_mantenimiento,
-                         descripcion_trabajo_realizado, paro_linea, observaciones_cierre)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                # UNA SOLA TRANSACCIÓN: si algo falla no queda ninguna tabla modificada
+                with unidad_de_trabajo('ot_sufijos.db', 'ot_unicas.db') as c:
+                    # El sufijo definitivo se asigna aquí, en la misma transacción que el INSERT
+                    if not es_continuacion:
+                        codigo_ot_sufijo = siguiente_codigo(c, f"sufijo:{codigo_ot_base_seleccionado}")
+                    
+                    # 1. HISTORIAL: el trabajo se agrega como evento (antes de pisar el último texto)
+                    registrar_evento_ot(c, codigo_ot_base_seleccionado,
+                                        'CONTINUACION' if es_continuacion else 'INICIO',
+                                        responsables_comienzo, nueva_descripcion_trabajo, observaciones_evento)
+                    
+                    # 2. ACTUALIZAR OT_UNICAS (estado PENDIENTE; solo el último trabajo y observación)
+                    c.execute('''
+                        UPDATE ot_unicas 
+                        SET estado = ?,
+                            fecha_inicio_mantenimiento = COALESCE(fecha_inicio_mantenimiento, ?),
+                            hora_inicio_mantenimiento = COALESCE(hora_inicio_mantenimiento, ?),
+                            hora_finalizacion_mantenimiento = ?,
+                            responsables_comienzo = ?,
+                            descripcion_trabajo_realizado = ?,
+                            observaciones_cierre = COALESCE(?, observaciones_cierre),
+                            paro_linea = ?
+                        WHERE codigo_ot_base = ?
                     ''', (
-                        ot_data['codigo_padre'], None, codigo_ot_base_seleccionado, codigo_ot_sufijo,
-                        datetime.now(), estado_nuevo, ot_data['area'], ot_data['equipo'], ot_data['codigo_equipo'],
-                        responsables_comienzo, fecha_inicio_mantenimiento,
-                        hora_inicio_mantenimiento.strftime('%H:%M:%S'), hora_finalizacion_mantenimiento.strftime('%H:%M:%S'),
-                        descripcion_acumulada, paro_linea, observaciones_acumuladas
+                        estado_nuevo, 
+                        fecha_inicio_mantenimiento, 
+                        hora_inicio_mantenimiento.strftime('%H:%M:%S'),
+                        hora_finalizacion_mantenimiento.strftime('%H:%M:%S'), 
+                        responsables_comienzo,
+                        nueva_descripcion_trabajo,
+                        observaciones_evento,
+                        paro_linea, 
+                        codigo_ot_base_seleccionado
                     ))
-                    conn_ot_sufijos.commit()
+                    
+                    # 3. INSERTAR EN OT_SUFIJOS (solo para nuevos inicios)
+                    if not es_continuacion:
+                        c.execute('''
+                            INSERT INTO ot_sufijos 
+                            (codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
+                             ot_sufijo_creado_en, estado, area, equipo, codigo_equipo,
+                             responsables_comienzo, fecha_inicio_mantenimiento, 
+                             hora_inicio_mantenimiento, hora_finalizacion_mantenimiento,
+                             descripcion_trabajo_realizado, paro_linea, observaciones_cierre)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', (
+                            ot_data['codigo_padre'], None, codigo_ot_base_seleccionado, codigo_ot_sufijo,
+                            datetime.now(), estado_nuevo, ot_data['area'], ot_data['equipo'], ot_data['codigo_equipo'],
+                            responsables_comienzo, fecha_inicio_mantenimiento,
+                            hora_inicio_mantenimiento.strftime('%H:%M:%S'), hora_finalizacion_mantenimiento.strftime('%H:%M:%S'),
+                            nueva_descripcion_trabajo, paro_linea, observaciones_evento
+                        ))
                 
-                # Confirmar transacciones
-                conn_ot_unicas.commit()
+                # Sincronizar con Google Sheets (segundo plano)
+                encolar_sincronizacion('ot_unicas')
+                encolar_sincronizacion('ot_eventos')
+                if not es_continuacion:
+                    encolar_sincronizacion('ot_sufijos')
                 
                 st.success(f"✅ {'Continuación' if es_continuacion else 'Inicio'} de mantenimiento exitoso para la OT '{codigo_ot_base_seleccionado}'!")
                 st.success(f"✅ Estado actualizado a 'PENDIENTE'")
@@ -4060,17 +6620,18 @@ def mostrar_formulario_inicio_mantenimiento():
                     st.write("**Responsables:**")
                     st.info(responsables_comienzo)
                     
-                    st.write("**Descripción del Trabajo (Acumulada):**")
-                    st.info(descripcion_acumulada)
+                    st.write("**Descripción del Trabajo Registrada:**")
+                    st.info(nueva_descripcion_trabajo)
                     
-                    if observaciones_acumuladas:
-                        st.write("**Observaciones (Acumuladas):**")
-                        st.info(observaciones_acumuladas)
+                    if observaciones_evento:
+                        st.write("**Observaciones:**")
+                        st.info(observaciones_evento)
                 
             except Exception as e:
                 st.error(f"❌ Error al {'continuar' if es_continuacion else 'iniciar'} el mantenimiento: {str(e)}")
 
 # ===============================OT CULMINADAS================================
+@cache_por_tablas('ot_unicas')
 def obtener_ot_para_culminacion():
     """Obtener OT en estado PROGRAMADO y PENDIENTE para culminar"""
     try:
@@ -4163,10 +6724,10 @@ def mostrar_formulario_culminacion_ot():
     if ot_data['descripcion_trabajo']:
         st.info(f"**Descripción del Trabajo Planificado:** {ot_data['descripcion_trabajo']}")
     
-    # Mostrar trabajo realizado anterior si existe
-    if pd.notna(ot_data['descripcion_trabajo_realizado']):
+    # Historial de trabajo anterior (eventos de la OT seleccionada)
+    if ot_data['estado'] == 'PENDIENTE':
         with st.expander("📝 Ver trabajo realizado anteriormente", expanded=True):
-            st.info(f"**Trabajo acumulado:**\n\n{ot_data['descripcion_trabajo_realizado']}")
+            mostrar_historial_ot(codigo_ot_base_seleccionado, ot_data['descripcion_trabajo_realizado'])
     
     st.markdown("---")
     
@@ -4227,17 +6788,13 @@ def mostrar_formulario_culminacion_ot():
             help="Lista de responsables que participaron en la culminación"
         )
         
-        # Descripción del trabajo realizado final (ACUMULATIVA)
+        # Descripción del trabajo realizado final (evento de culminación en el historial)
         st.write("**Descripción Final del Trabajo Realizado **")
-        st.caption("💡 Esta descripción se acumulará con el trabajo anterior")
-        
-        placeholder_text = ""
-        if pd.notna(ot_data['descripcion_trabajo_realizado']):
-            placeholder_text = ot_data['descripcion_trabajo_realizado'] + "\n\n--- CULMINACIÓN ---\n"
+        st.caption("💡 Se agregará al historial de la OT como culminación")
         
         descripcion_final_trabajo = st.text_area(
             "Agregar descripción final del trabajo realizado:",
-            placeholder=placeholder_text + "Describa el trabajo final realizado y los resultados...",
+            placeholder="Describa el trabajo final realizado y los resultados...",
             height=120,
             help="Descripción completa de las actividades finales realizadas y resultados obtenidos"
         )
@@ -4287,112 +6844,122 @@ def mostrar_formulario_culminacion_ot():
                 st.error("Por favor, complete todos los campos obligatorios (*)")
                 return
             
+            errores_adjuntos = validar_adjuntos(imagen_final)
+            if errores_adjuntos:
+                st.error(f"❌ {errores_adjuntos[0]}")
+                return
+            
             try:
                 # Procesar imagen final si se subió
-                imagen_final_nombre = None
-                imagen_final_datos = None
-                
-                if imagen_final is not None:
-                    imagen_final_nombre = imagen_final.name
-                    imagen_final_datos = imagen_final.getvalue()
+                imagen_final_nombre = imagen_final.name if imagen_final is not None else None
                 
-                # CONSTRUIR DESCRIPCIÓN ACUMULADA FINAL
-                if pd.notna(ot_data['descripcion_trabajo_realizado']):
-                    descripcion_acumulada_final = f"{ot_data['descripcion_trabajo_realizado']}\n\n--- CULMINACIÓN: {datetime.now().strftime('%Y-%m-%d %H:%M')} ---\n{descripcion_final_trabajo}"
-                else:
-                    descripcion_acumulada_final = f"--- CULMINACIÓN: {datetime.now().strftime('%Y-%m-%d %H:%M')} ---\n{descripcion_final_trabajo}"
-                
-                # 1. ACTUALIZAR OT_UNICAS (cambiar estado a CULMINADO y acumular descripción)
-                c_ot_unicas = conn_ot_unicas.cursor()
-                c_ot_unicas.execute('''
-                    UPDATE ot_unicas 
-                    SET estado = ?,
-                        fecha_finalizacion = ?,
-                        hora_final = ?,
-                        responsables_finalizacion = ?,
-                        descripcion_trabajo_realizado = ?,
-                        imagen_final_nombre = ?,
-                        imagen_final_datos = ?,
-                        observaciones_cierre = ?,
-                        comentario = ?
-                    WHERE codigo_ot_base = ?
-                ''', (
-                    estado_nuevo,
-                    fecha_finalizacion,
-                    hora_final.strftime('%H:%M:%S'),
-                    responsables_finalizacion,
-                    descripcion_acumulada_final,  # Solo se acumula este campo
-                    imagen_final_nombre,
-                    imagen_final_datos,
-                    observaciones_cierre,
-                    comentario,
-                    codigo_ot_base_seleccionado
-                ))
-                
-                # 2. ACTUALIZAR AVISOS (cambiar estado a CULMINADO)
-                c_avisos = conn_avisos.cursor()
-                c_avisos.execute('''
-                    UPDATE avisos 
-                    SET estado = ?,
-                        fecha_finalizacion = ?,
-                        hora_final = ?,
-                        responsables_finalizacion = ?,
-                        descripcion_trabajo_realizado = ?,
-                        imagen_final_nombre = ?,
-                        imagen_final_datos = ?,
-                        observaciones_cierre = ?,
-                        comentario = ?
-                    WHERE codigo_padre = ?
-                ''', (
-                    estado_nuevo,
-                    fecha_finalizacion,
-                    hora_final.strftime('%H:%M:%S'),
-                    responsables_finalizacion,
-                    descripcion_final_trabajo,  # No acumular en avisos
-                    imagen_final_nombre,
-                    imagen_final_datos,
-                    observaciones_cierre,
-                    comentario,
-                    ot_data['codigo_padre']
-                ))
+                # La imagen se procesa y se escribe antes de tomar el bloqueo de escritura
+                imagen_final_guardada = preparar_imagen(imagen_final)
                 
-                # 3. INSERTAR EN OT_SUFIJOS (registro completo de la culminación CON HORA INICIO)
-                c_ot_sufijos = conn_ot_sufijos.cursor()
-                c_ot_sufijos.execute('''
-                    INSERT INTO ot_sufijos 
-                    (codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
-                     ot_sufijo_creado_en, estado, area, equipo, codigo_equipo,
-                     fecha_inicio_mantenimiento, hora_inicio_mantenimiento,  -- SOLO en ot_sufijos
-                     fecha_finalizacion, hora_final, responsables_finalizacion,
-                     descripcion_trabajo_realizado, imagen_final_nombre, imagen_final_datos,
-                     observaciones_cierre, comentario)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    ot_data['codigo_padre'],
-                    ot_data['codigo_mantto'],
-                    codigo_ot_base_seleccionado,
-                    f"{codigo_ot_base_seleccionado}-CULM",
-                    datetime.now(),
-                    estado_nuevo,
-                    ot_data['area'],
-                    ot_data['equipo'],
-                    ot_data['codigo_equipo'],
-                    fecha_finalizacion,  # Usamos fecha_finalizacion también como fecha_inicio para el registro
-                    hora_inicio_mantenimiento.strftime('%H:%M:%S'),  # HORA INICIO SOLO EN OT_SUFIJOS
-                    fecha_finalizacion,
-                    hora_final.strftime('%H:%M:%S'),
-                    responsables_finalizacion,
-                    descripcion_final_trabajo,  # Descripción final sin acumular
-                    imagen_final_nombre,
-                    imagen_final_datos,
-                    observaciones_cierre,
-                    comentario
-                ))
+                # UNA SOLA TRANSACCIÓN: OT, aviso y registro de sufijo cambian juntos o no cambian
+                with unidad_de_trabajo('ot_unicas.db', 'avisos.db', 'ot_sufijos.db') as c:
+                    # La imagen se registra una vez; las tres tablas comparten la referencia
+                    imagen_final_ref, imagen_final_miniatura_ref = registrar_imagen(c, imagen_final_guardada)
+                    
+                    # Historial: la culminación es el último evento de la OT
+                    registrar_evento_ot(c, codigo_ot_base_seleccionado, 'CULMINACION',
+                                        responsables_finalizacion, descripcion_final_trabajo, observaciones_cierre)
+                    
+                    # 1. ACTUALIZAR OT_UNICAS (cambiar estado a CULMINADO; el último trabajo queda en la fila)
+                    c.execute('''
+                        UPDATE ot_unicas 
+                        SET estado = ?,
+                            fecha_finalizacion = ?,
+                            hora_final = ?,
+                            responsables_finalizacion = ?,
+                            descripcion_trabajo_realizado = ?,
+                            imagen_final_nombre = ?,
+                            imagen_final_ref = ?,
+                            imagen_final_miniatura_ref = ?,
+                            observaciones_cierre = ?,
+                            comentario = ?
+                        WHERE codigo_ot_base = ?
+                    ''', (
+                        estado_nuevo,
+                        fecha_finalizacion,
+                        hora_final.strftime('%H:%M:%S'),
+                        responsables_finalizacion,
+                        descripcion_final_trabajo,  # El historial completo está en ot_eventos
+                        imagen_final_nombre,
+                        imagen_final_ref,
+                        imagen_final_miniatura_ref,
+                        observaciones_cierre,
+                        comentario,
+                        codigo_ot_base_seleccionado
+                    ))
+                    
+                    # 2. ACTUALIZAR AVISOS (cambiar estado a CULMINADO)
+                    c.execute('''
+                        UPDATE avisos 
+                        SET estado = ?,
+                            fecha_finalizacion = ?,
+                            hora_final = ?,
+                            responsables_finalizacion = ?,
+                            descripcion_trabajo_realizado = ?,
+                            imagen_final_nombre = ?,
+                            imagen_final_ref = ?,
+                            imagen_final_miniatura_ref = ?,
+                            observaciones_cierre = ?,
+                            comentario = ?
+                        WHERE codigo_padre = ?
+                    ''', (
+                        estado_nuevo,
+                        fecha_finalizacion,
+                        hora_final.strftime('%H:%M:%S'),
+                        responsables_finalizacion,
+                        descripcion_final_trabajo,  # No acumular en avisos
+                        imagen_final_nombre,
+                        imagen_final_ref,
+                        imagen_final_miniatura_ref,
+                        observaciones_cierre,
+                        comentario,
+                        ot_data['codigo_padre']
+                    ))
+                    
+                    # 3. INSERTAR EN OT_SUFIJOS (registro completo de la culminación CON HORA INICIO)
+                    c.execute('''
+                        INSERT INTO ot_sufijos 
+                        (codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
+                         ot_sufijo_creado_en, estado, area, equipo, codigo_equipo,
+                         fecha_inicio_mantenimiento, hora_inicio_mantenimiento,  -- SOLO en ot_sufijos
+                         fecha_finalizacion, hora_final, responsables_finalizacion,
+                         descripcion_trabajo_realizado, imagen_final_nombre, imagen_final_ref,
+                         imagen_final_miniatura_ref, observaciones_cierre, comentario)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        ot_data['codigo_padre'],
+                        ot_data['codigo_mantto'],
+                        codigo_ot_base_seleccionado,
+                        f"{codigo_ot_base_seleccionado}-CULM",
+                        datetime.now(),
+                        estado_nuevo,
+                        ot_data['area'],
+                        ot_data['equipo'],
+                        ot_data['codigo_equipo'],
+                        fecha_finalizacion,  # Usamos fecha_finalizacion también como fecha_inicio para el registro
+                        hora_inicio_mantenimiento.strftime('%H:%M:%S'),  # HORA INICIO SOLO EN OT_SUFIJOS
+                        fecha_finalizacion,
+                        hora_final.strftime('%H:%M:%S'),
+                        responsables_finalizacion,
+                        descripcion_final_trabajo,  # Descripción final sin acumular
+                        imagen_final_nombre,
+                        imagen_final_ref,
+                        imagen_final_miniatura_ref,
+                        observaciones_cierre,
+                        comentario
+                    ))
+                    
+                    # 4. INDICADORES: solo la fila del equipo y el día de finalización
+                    actualizar_kpi_equipo_diario(c, ot_data['codigo_equipo'], fecha_finalizacion)
                 
-                # Confirmar todas las transacciones
-                conn_ot_unicas.commit()
-                conn_avisos.commit()
-                conn_ot_sufijos.commit()
+                # Sincronizar con Google Sheets (segundo plano)
+                for tabla in ('ot_unicas', 'ot_eventos', 'avisos', 'ot_sufijos'):
+                    encolar_sincronizacion(tabla)
                 
                 st.success(f"✅ Orden de Trabajo '{codigo_ot_base_seleccionado}' culminada exitosamente!")
                 st.success(f"✅ Estado actualizado a 'CULMINADO' en todas las bases de datos")
@@ -4445,11 +7012,63 @@ def mostrar_ot_culminadas():
     with tab2:
         mostrar_formulario_culminacion_ot()
 
+def mostrar_indicadores_mantenimiento(desde, area=None):
+    """MTTR, MTBF y disponibilidad desde la fecha indicada, leídos de kpi_equipo_diario"""
+    st.subheader("🛠️ Indicadores de Mantenimiento")
+    hasta = date.today()
+    dias_periodo = max(1, (hasta - desde).days + 1)
+    try:
+        diario = leer_kpi_periodo(conn_ot_unicas, desde, hasta, area)
+    except Exception as e:
+        st.error(f"Error al cargar los indicadores de mantenimiento: {e}")
+        return
+    
+    if diario.empty:
+        st.info("ℹ️ No hay OT culminadas con equipo asignado en el periodo seleccionado")
+        return
+    
+    por_equipo = indicadores(diario, dias_periodo)
+    total = indicadores(diario.assign(total='Total'), dias_periodo, por='total').iloc[0]
+    
+    col_kpi1, col_kpi2, col_kpi3, col_kpi4 = st.columns(4)
+    with col_kpi1:
+        st.metric("Fallas (correctivas)", int(total['fallas']))
+    with col_kpi2:
+        st.metric("MTTR", f"{total['mttr_horas']:.1f} h" if pd.notna(total['mttr_horas']) else "N/A")
+    with col_kpi3:
+        st.metric("MTBF", f"{total['mtbf_horas']:.1f} h" if pd.notna(total['mtbf_horas']) else "N/A")
+    with col_kpi4:
+        st.metric("Disponibilidad", f"{total['disponibilidad']:.2f} %")
+    st.caption(f"Periodo de {dias_periodo} días; MTTR y MTBF solo con OT de mantenimiento correctivo")
+    
+    columnas_kpi = {
+        "equipos": "Equipos",
+        "intervenciones": "OT Culminadas",
+        "fallas": "Fallas",
+        "mttr_horas": st.column_config.NumberColumn("MTTR (h)", format="%.2f"),
+        "mtbf_horas": st.column_config.NumberColumn("MTBF (h)", format="%.2f"),
+        "disponibilidad": st.column_config.NumberColumn("Disponibilidad (%)", format="%.2f")
+    }
+    tab_equipo, tab_area = st.tabs(["Por Equipo", "Por Área"])
+    with tab_equipo:
+        st.dataframe(por_equipo.drop(columns='equipos'), use_container_width=True, hide_index=True,
+                     column_config={"codigo_equipo": "Código Equipo", **columnas_kpi})
+    with tab_area:
+        st.dataframe(indicadores(diario, dias_periodo, por='area'), use_container_width=True, hide_index=True,
+                     column_config={"area": "Área", **columnas_kpi})
+
+def textos_ot(codigos_ot_base):
+    """Descripción, observaciones y comentario de las OT indicadas (columnas de texto largo)"""
+    return pd.read_sql('''
+        SELECT codigo_ot_base, descripcion_trabajo_realizado, observaciones_cierre, comentario
+        FROM ot_unicas WHERE codigo_ot_base IN (SELECT value FROM json_each(?))
+    ''', conn_ot_unicas, params=(json.dumps(list(codigos_ot_base)),))
+
 def mostrar_reporte_ot_culminadas():
     """Muestra el reporte de OT culminadas"""
     # Obtener OT en estado CULMINADO y CERRADO
     try:
-        df = pd.read_sql('''
+        df = pd.read_sql(f'''
             SELECT 
                 codigo_ot_base,
                 codigo_mantto,
@@ -4468,10 +7087,7 @@ def mostrar_reporte_ot_culminadas():
                 hora_final,
                 responsables_finalizacion,
                 duracion_estimada,
-                descripcion_trabajo_realizado,
-                observaciones_cierre,
-                comentario,
-                antiguedad,
+                {antiguedad_sql('ot_unicas')} AS antiguedad,
                 ot_base_creado_en
             FROM ot_unicas 
             WHERE estado IN ('CULMINADO', 'CERRADO')
@@ -4572,20 +7188,28 @@ def mostrar_reporte_ot_culminadas():
     # Gráficos
     col_chart1, col_chart2 = st.columns(2)
     
+    # Conteos desde resumen_ot (mismos filtros que la tabla)
+    filtros_resumen = {
+        'estados': ('CULMINADO', 'CERRADO') if estado_filtro == "Todos" else (estado_filtro,),
+        'area': None if area_filtro == "Todas" else area_filtro,
+        'prioridad': None if prioridad_filtro == "Todas" else prioridad_filtro,
+        'desde': fecha_inicio
+    }
+    
     with col_chart1:
         # Distribución por estado
         if not df_filtrado.empty:
             st.subheader("📊 Distribución por Estado")
-            estado_counts = df_filtrado['estado'].value_counts()
-            st.bar_chart(estado_counts)
+            st.bar_chart(resumen_ot(conn_ot_unicas, 'estado', **filtros_resumen))
     
     with col_chart2:
         # OT culminadas por mes
         if not df_filtrado.empty:
             st.subheader("📅 OT Culminadas por Mes")
-            df_filtrado['mes_culminacion'] = df_filtrado['fecha_finalizacion'].dt.to_period('M').astype(str)
-            mes_counts = df_filtrado['mes_culminacion'].value_counts().sort_index()
-            st.bar_chart(mes_counts)
+            st.bar_chart(resumen_ot(conn_ot_unicas, 'mes', **filtros_resumen))
+    
+    # MTTR / MTBF / disponibilidad precalculados por equipo y día
+    mostrar_indicadores_mantenimiento(fecha_inicio, None if area_filtro == "Todas" else area_filtro)
     
     # Tabla detallada
     st.subheader("📋 Detalle de OT Culminadas")
@@ -4636,24 +7260,39 @@ def mostrar_reporte_ot_culminadas():
                     if pd.notna(ot['dias_culminacion']):
                         st.write(f"**Días para Culminar:** {ot['dias_culminacion']} días")
                 
-                if pd.notna(ot['descripcion_trabajo_realizado']):
-                    st.write("**Descripción del Trabajo Realizado:**")
-                    st.info(ot['descripcion_trabajo_realizado'])
-                
-                if pd.notna(ot['observaciones_cierre']):
-                    st.write("**Observaciones de Cierre:**")
-                    st.info(ot['observaciones_cierre'])
+                # Los textos y el historial se leen solo si se piden
+                if st.toggle("📝 Ver trabajo realizado, observaciones e historial",
+                             key=f"textos_{ot['codigo_ot_base']}"):
+                    textos = textos_ot([ot['codigo_ot_base']])
+                    if not textos.empty:
+                        textos = textos.iloc[0]
+                        if pd.notna(textos['descripcion_trabajo_realizado']):
+                            st.write("**Descripción del Trabajo Realizado:**")
+                            st.info(textos['descripcion_trabajo_realizado'])
+                        
+                        if pd.notna(textos['observaciones_cierre']):
+                            st.write("**Observaciones de Cierre:**")
+                            st.info(textos['observaciones_cierre'])
+                        
+                        if pd.notna(textos['comentario']):
+                            st.write("**Comentario:**")
+                            st.info(textos['comentario'])
+                    
+                    st.write("**Historial de Trabajo:**")
+                    mostrar_historial_ot(ot['codigo_ot_base'])
     
-    # Botón de exportación
+    # Botón de exportación (los textos se agregan al preparar el archivo)
     if not df_filtrado.empty:
-        csv = df_filtrado.to_csv(index=False)
-        st.download_button(
-            label="📥 Exportar a CSV",
-            data=csv,
-            file_name=f"ot_culminadas_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
-            use_container_width=True
-        )
+        if st.button("📄 Preparar CSV", use_container_width=True, key="preparar_csv_culminadas"):
+            df_exportar = df_filtrado.merge(textos_ot(df_filtrado['codigo_ot_base'].tolist()),
+                                            on='codigo_ot_base', how='left')
+            st.download_button(
+                label="📥 Exportar a CSV",
+                data=df_exportar.to_csv(index=False),
+                file_name=f"ot_culminadas_{datetime.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
 
 # ===============================VISUALIZACIÓN Y EXPORTACIÓN DE BASES DE DATOS================================
 
@@ -4688,378 +7327,320 @@ def mostrar_visualizacion_bases_datos():
         with tabs[5]:
             mostrar_exportacion_masiva()
 
+# Columnas de la pestaña de base de datos de avisos
+COLUMNAS_BASE_AVISOS = f'''
+    id, codigo_padre, codigo_mantto, codigo_ot_base, estado,
+    {antiguedad_sql('avisos')} AS antiguedad, area, equipo, codigo_equipo, componentes,
+    descripcion_problema, ingresado_por, ingresado_el, hay_riesgo,
+    tipo_mantenimiento, tipo_preventivo, prioridad, fecha_programada,
+    creado_en
+'''
+
 def mostrar_base_avisos():
     """Muestra y permite exportar la base de datos de avisos"""
     st.subheader("📝 Base de Datos: Avisos de Mantenimiento")
     
     try:
-        # Obtener todos los avisos
-        df = pd.read_sql('''
-            SELECT 
-                id, codigo_padre, codigo_mantto, codigo_ot_base, estado,
-                antiguedad, area, equipo, codigo_equipo, componentes,
-                descripcion_problema, ingresado_por, ingresado_el, hay_riesgo,
-                tipo_mantenimiento, tipo_preventivo, prioridad, fecha_programada,
-                creado_en
-            FROM avisos 
-            ORDER BY creado_en DESC
-        ''', conn_avisos)
-        
-        if df.empty:
-            st.info("No hay avisos registrados en la base de datos.")
-            return
-        
-        # Filtros
+        # Filtros (las opciones salen de SELECT DISTINCT, sin cargar la tabla)
         col1, col2, col3 = st.columns(3)
         with col1:
             estado_filtro = st.selectbox(
                 "Filtrar por estado",
-                ["Todos"] + sorted(df['estado'].unique().tolist()),
+                ["Todos"] + valores_distintos(conn_avisos, 'avisos', 'estado'),
                 key="filtro_estado_avisos"
             )
         with col2:
             area_filtro = st.selectbox(
                 "Filtrar por área",
-                ["Todas"] + sorted(df['area'].unique().tolist()),
+                ["Todas"] + valores_distintos(conn_avisos, 'avisos', 'area'),
                 key="filtro_area_avisos"
             )
         with col3:
             busqueda = st.text_input("🔍 Buscar...", key="busqueda_avisos")
         
-        # Aplicar filtros
-        df_filtrado = df.copy()
-        if estado_filtro != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['estado'] == estado_filtro]
-        if area_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['area'] == area_filtro]
-        if busqueda:
-            mask = (
-                df_filtrado['codigo_padre'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['codigo_mantto'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['equipo'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['descripcion_problema'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mask]
+        fuente = fuente_busqueda(conn_avisos, 'avisos', busqueda, 'creado_en DESC, id DESC')
+        where, params = filtro_sql(
+            {'estado': estado_filtro, 'area': area_filtro}, fuente['busqueda_like'],
+            ('codigo_padre', 'codigo_mantto', 'equipo', 'descripcion_problema')
+        )
+        params = fuente['params'] + params
+        resumen = resumen_consulta(conn_avisos, fuente['origen'], {
+            'total': 'COUNT(*)',
+            'estados': 'COUNT(DISTINCT estado)',
+            'areas': 'COUNT(DISTINCT area)',
+            'con_ot': 'COUNT(codigo_ot_base)'
+        }, where, params)
+        
+        if resumen['total'] == 0:
+            st.info("No hay avisos registrados en la base de datos." if not params else "No hay avisos que coincidan con los filtros.")
+            return
         
         # Mostrar estadísticas
         col_met1, col_met2, col_met3, col_met4 = st.columns(4)
         with col_met1:
-            st.metric("Total Avisos", len(df_filtrado))
+            st.metric("Total Avisos", resumen['total'])
         with col_met2:
-            st.metric("Estados Diferentes", df_filtrado['estado'].nunique())
+            st.metric("Estados Diferentes", resumen['estados'])
         with col_met3:
-            st.metric("Áreas Diferentes", df_filtrado['area'].nunique())
+            st.metric("Áreas Diferentes", resumen['areas'])
         with col_met4:
-            st.metric("Con OT Asignada", df_filtrado['codigo_ot_base'].notna().sum())
-        
-        # Mostrar tabla
-        st.dataframe(df_filtrado, use_container_width=True)
-        
-        # Obtener avisos con imágenes para visualización
-        avisos_con_imagen = pd.read_sql('''
-            SELECT codigo_mantto, imagen_aviso_nombre, imagen_aviso_datos 
+            st.metric("Con OT Asignada", resumen['con_ot'])
+        
+        # Mostrar tabla (una página)
+        pagina, tamano = controles_paginacion("base_avisos", resumen['total'])
+        df_pagina = consultar_pagina(conn_avisos, fuente['origen'], COLUMNAS_BASE_AVISOS + fuente['columnas'],
+                                     where, params, fuente['orden'], pagina, tamano)
+        st.dataframe(df_pagina, use_container_width=True)
+        
+        # Avisos con imágenes de la página visible
+        marcadores = ', '.join('?' * len(df_pagina))
+        avisos_con_imagen = pd.read_sql(f'''
+            SELECT codigo_mantto, imagen_aviso_nombre, imagen_aviso_ref, imagen_aviso_miniatura_ref 
             FROM avisos 
-            WHERE imagen_aviso_datos IS NOT NULL
-        ''', conn_avisos)
+            WHERE imagen_aviso_ref IS NOT NULL AND id IN ({marcadores})
+        ''', conn_avisos, params=df_pagina['id'].tolist())
         
-        # Visualización de imágenes
+        # Galería: miniaturas de la página y la imagen completa a pedido
         if not avisos_con_imagen.empty:
             st.subheader("🖼️ Visualización de Imágenes de Avisos")
-            aviso_seleccionado = st.selectbox(
-                "Seleccionar aviso para ver imagen:",
-                [f"{row['codigo_mantto']} - {row['imagen_aviso_nombre']}" for _, row in avisos_con_imagen.iterrows()],
-                key="imagen_avisos"
-            )
-            
-            if aviso_seleccionado:
-                codigo_mantto = aviso_seleccionado.split(' - ')[0]
-                imagen_data = avisos_con_imagen[avisos_con_imagen['codigo_mantto'] == codigo_mantto].iloc[0]
-                
-                if imagen_data['imagen_aviso_datos']:
-                    st.image(imagen_data['imagen_aviso_datos'], caption=f"Imagen: {imagen_data['imagen_aviso_nombre']}", use_column_width=True)
+            mostrar_galeria_imagenes(avisos_con_imagen, 'codigo_mantto', 'imagen_aviso_nombre',
+                                     'imagen_aviso_ref', 'imagen_aviso_miniatura_ref',
+                                     "imagen_avisos", "aviso")
         
-        # Exportar a Excel (solo si tiene permiso)
+        # Exportar a Excel (solo si tiene permiso): todas las filas filtradas
         permisos = st.session_state.get('permisos', {})
         puede_descargar_excel = permisos.get('puede_descargar_excel', False)
         
-        if not df_filtrado.empty and puede_descargar_excel:
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                df_filtrado.to_excel(writer, sheet_name='Avisos', index=False)
-            
-            st.download_button(
-                label="📥 Exportar a Excel",
-                data=excel_buffer.getvalue(),
-                file_name=f"avisos_mantenimiento_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-        elif not df_filtrado.empty and not puede_descargar_excel:
+        if puede_descargar_excel:
+            exportar_consulta_excel(conn_avisos, fuente['origen'], COLUMNAS_BASE_AVISOS, where, params,
+                                    fuente['orden'], 'Avisos', 'avisos_mantenimiento', 'base_avisos')
+        else:
             st.info("ℹ️ No tiene permisos para exportar datos a Excel")
         
     except Exception as e:
         st.error(f"Error al cargar la base de datos de avisos: {e}")
 
+# Columnas de la pestaña de base de datos de OT únicas
+COLUMNAS_BASE_OT_UNICAS = f'''
+    id, codigo_padre, codigo_mantto, codigo_ot_base, estado,
+    {antiguedad_sql('ot_unicas')} AS antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
+    componentes, descripcion_problema, descripcion_trabajo,
+    responsable, clasificacion, sistema, materiales,
+    fecha_estimada_inicio, duracion_estimada,
+    fecha_inicio_mantenimiento, fecha_finalizacion,
+    creado_en
+'''
+
 def mostrar_base_ot_unicas():
     """Muestra y permite exportar la base de datos de OT únicas"""
     st.subheader("📋 Base de Datos: Órdenes de Trabajo Únicas")
     
     try:
-        # Obtener todas las OT únicas
-        df = pd.read_sql('''
-            SELECT 
-                id, codigo_padre, codigo_mantto, codigo_ot_base, estado,
-                antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
-                componentes, descripcion_problema, descripcion_trabajo,
-                responsable, clasificacion, sistema, materiales,
-                fecha_estimada_inicio, duracion_estimada,
-                fecha_inicio_mantenimiento, fecha_finalizacion,
-                creado_en
-            FROM ot_unicas 
-            ORDER BY ot_base_creado_en DESC
-        ''', conn_ot_unicas)
-        
-        if df.empty:
-            st.info("No hay órdenes de trabajo únicas registradas.")
-            return
-        
-        # Filtros
+        # Filtros (las opciones salen de SELECT DISTINCT, sin cargar la tabla)
         col1, col2, col3 = st.columns(3)
         with col1:
             estado_filtro = st.selectbox(
                 "Filtrar por estado",
-                ["Todos"] + sorted(df['estado'].unique().tolist()),
+                ["Todos"] + valores_distintos(conn_ot_unicas, 'ot_unicas', 'estado'),
                 key="filtro_estado_ot_unicas"
             )
         with col2:
             prioridad_filtro = st.selectbox(
                 "Filtrar por prioridad",
-                ["Todas"] + sorted(df['prioridad_nueva'].unique().tolist()),
+                ["Todas"] + valores_distintos(conn_ot_unicas, 'ot_unicas', 'prioridad_nueva'),
                 key="filtro_prioridad_ot_unicas"
             )
         with col3:
             busqueda = st.text_input("🔍 Buscar...", key="busqueda_ot_unicas")
         
-        # Aplicar filtros
-        df_filtrado = df.copy()
-        if estado_filtro != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['estado'] == estado_filtro]
-        if prioridad_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['prioridad_nueva'] == prioridad_filtro]
-        if busqueda:
-            mask = (
-                df_filtrado['codigo_ot_base'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['codigo_mantto'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['equipo'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['descripcion_trabajo'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mask]
+        fuente = fuente_busqueda(conn_ot_unicas, 'ot_unicas', busqueda, 'ot_base_creado_en DESC, id DESC')
+        where, params = filtro_sql(
+            {'estado': estado_filtro, 'prioridad_nueva': prioridad_filtro}, fuente['busqueda_like'],
+            ('codigo_ot_base', 'codigo_mantto', 'equipo', 'descripcion_trabajo')
+        )
+        params = fuente['params'] + params
+        resumen = resumen_consulta(conn_ot_unicas, fuente['origen'], {
+            'total': 'COUNT(*)',
+            'activas': "SUM(estado IN ('PROGRAMADO', 'PENDIENTE'))",
+            'culminadas': "SUM(estado = 'CULMINADO')",
+            'prioridad_alta': "SUM(prioridad_nueva = '1. ALTO')"
+        }, where, params)
+        
+        if resumen['total'] == 0:
+            st.info("No hay órdenes de trabajo únicas registradas." if not params else "No hay órdenes de trabajo que coincidan con los filtros.")
+            return
         
         # Mostrar estadísticas
         col_met1, col_met2, col_met3, col_met4 = st.columns(4)
         with col_met1:
-            st.metric("Total OT", len(df_filtrado))
+            st.metric("Total OT", resumen['total'])
         with col_met2:
-            st.metric("OT Activas", len(df_filtrado[df_filtrado['estado'].isin(['PROGRAMADO', 'PENDIENTE'])]))
+            st.metric("OT Activas", resumen['activas'])
         with col_met3:
-            st.metric("OT Culminadas", len(df_filtrado[df_filtrado['estado'] == 'CULMINADO']))
+            st.metric("OT Culminadas", resumen['culminadas'])
         with col_met4:
-            st.metric("Prioridad Alta", len(df_filtrado[df_filtrado['prioridad_nueva'] == '1. ALTO']))
+            st.metric("Prioridad Alta", resumen['prioridad_alta'])
         
-        # Mostrar tabla
-        st.dataframe(df_filtrado, use_container_width=True)
+        # Mostrar tabla (una página)
+        pagina, tamano = controles_paginacion("base_ot_unicas", resumen['total'])
+        df_pagina = consultar_pagina(conn_ot_unicas, fuente['origen'], COLUMNAS_BASE_OT_UNICAS + fuente['columnas'],
+                                     where, params, fuente['orden'], pagina, tamano)
+        st.dataframe(df_pagina, use_container_width=True)
         
-        # Visualización de imágenes finales
+        # Visualización de imágenes finales (OT de la página visible)
         st.subheader("🖼️ Visualización de Imágenes Finales")
-        ot_con_imagen = pd.read_sql('''
-            SELECT codigo_ot_base, imagen_final_nombre, imagen_final_datos 
+        marcadores = ', '.join('?' * len(df_pagina))
+        ot_con_imagen = pd.read_sql(f'''
+            SELECT codigo_ot_base, imagen_final_nombre, imagen_final_ref, imagen_final_miniatura_ref 
             FROM ot_unicas 
-            WHERE imagen_final_datos IS NOT NULL
-        ''', conn_ot_unicas)
+            WHERE imagen_final_ref IS NOT NULL AND id IN ({marcadores})
+        ''', conn_ot_unicas, params=df_pagina['id'].tolist())
         
         if not ot_con_imagen.empty:
-            ot_seleccionada = st.selectbox(
-                "Seleccionar OT para ver imagen final:",
-                [f"{row['codigo_ot_base']} - {row['imagen_final_nombre']}" for _, row in ot_con_imagen.iterrows()],
-                key="imagen_ot_unicas"
-            )
-            
-            if ot_seleccionada:
-                codigo_ot = ot_seleccionada.split(' - ')[0]
-                imagen_data = ot_con_imagen[ot_con_imagen['codigo_ot_base'] == codigo_ot].iloc[0]
-                
-                if imagen_data['imagen_final_datos']:
-                    st.image(imagen_data['imagen_final_datos'], caption=f"Imagen Final: {imagen_data['imagen_final_nombre']}", use_column_width=True)
+            mostrar_galeria_imagenes(ot_con_imagen, 'codigo_ot_base', 'imagen_final_nombre',
+                                     'imagen_final_ref', 'imagen_final_miniatura_ref',
+                                     "imagen_ot_unicas", "OT")
         
-        # Exportar a Excel
+        # Exportar a Excel: todas las filas filtradas
         permisos = st.session_state.get('permisos', {})
         puede_descargar_excel = permisos.get('puede_descargar_excel', False)
         
-        if not df_filtrado.empty and puede_descargar_excel:
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                df_filtrado.to_excel(writer, sheet_name='OT_Unicas', index=False)
-            
-            st.download_button(
-                label="📥 Exportar a Excel",
-                data=excel_buffer.getvalue(),
-                file_name=f"ot_unicas_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-        elif not df_filtrado.empty and not puede_descargar_excel:
+        if puede_descargar_excel:
+            exportar_consulta_excel(conn_ot_unicas, fuente['origen'], COLUMNAS_BASE_OT_UNICAS, where, params,
+                                    fuente['orden'], 'OT_Unicas', 'ot_unicas', 'base_ot_unicas')
+        else:
             st.info("ℹ️ No tiene permisos para exportar datos a Excel")
         
     except Exception as e:
         st.error(f"Error al cargar la base de datos de OT únicas: {e}")
 
+# Columnas de la pestaña de base de datos de OT con sufijos
+COLUMNAS_BASE_OT_SUFIJOS = f'''
+    id, codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
+    estado, {antiguedad_sql('ot_sufijos')} AS antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
+    fecha_inicio_mantenimiento, hora_inicio_mantenimiento,
+    hora_finalizacion_mantenimiento, fecha_finalizacion, hora_final,
+    responsables_comienzo, responsables_finalizacion,
+    descripcion_trabajo_realizado, paro_linea, observaciones_cierre,
+    comentario, ot_sufijo_creado_en
+'''
+
 def mostrar_base_ot_sufijos():
     """Muestra y permite exportar la base de datos de OT con sufijos"""
     st.subheader("🔢 Base de Datos: Órdenes de Trabajo con Sufijos")
     
     try:
-        # Obtener todas las OT con sufijos
-        df = pd.read_sql('''
-            SELECT 
-                id, codigo_padre, codigo_mantto, codigo_ot_base, codigo_ot_sufijo,
-                estado, antiguedad, prioridad_nueva, area, equipo, codigo_equipo,
-                fecha_inicio_mantenimiento, hora_inicio_mantenimiento,
-                hora_finalizacion_mantenimiento, fecha_finalizacion, hora_final,
-                responsables_comienzo, responsables_finalizacion,
-                descripcion_trabajo_realizado, paro_linea, observaciones_cierre,
-                comentario, ot_sufijo_creado_en
-            FROM ot_sufijos 
-            ORDER BY ot_sufijo_creado_en DESC
-        ''', conn_ot_sufijos)
-        
-        if df.empty:
-            st.info("No hay órdenes de trabajo con sufijos registradas.")
-            return
-        
-        # Filtros
+        # Filtros (las opciones salen de SELECT DISTINCT, sin cargar la tabla)
         col1, col2 = st.columns(2)
         with col1:
             estado_filtro = st.selectbox(
                 "Filtrar por estado",
-                ["Todos"] + sorted(df['estado'].unique().tolist()),
+                ["Todos"] + valores_distintos(conn_ot_sufijos, 'ot_sufijos', 'estado'),
                 key="filtro_estado_ot_sufijos"
             )
         with col2:
             busqueda = st.text_input("🔍 Buscar...", key="busqueda_ot_sufijos")
         
-        # Aplicar filtros
-        df_filtrado = df.copy()
-        if estado_filtro != "Todos":
-            df_filtrado = df_filtrado[df_filtrado['estado'] == estado_filtro]
-        if busqueda:
-            mask = (
-                df_filtrado['codigo_ot_base'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['codigo_ot_sufijo'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['equipo'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mask]
+        fuente = fuente_busqueda(conn_ot_sufijos, 'ot_sufijos', busqueda, 'ot_sufijo_creado_en DESC, id DESC')
+        where, params = filtro_sql(
+            {'estado': estado_filtro}, fuente['busqueda_like'],
+            ('codigo_ot_base', 'codigo_ot_sufijo', 'equipo')
+        )
+        params = fuente['params'] + params
+        resumen = resumen_consulta(conn_ot_sufijos, fuente['origen'], {
+            'total': 'COUNT(*)',
+            'ot_base': 'COUNT(DISTINCT codigo_ot_base)',
+            'paro_linea': "SUM(paro_linea = 'SI')"
+        }, where, params)
+        
+        if resumen['total'] == 0:
+            st.info("No hay órdenes de trabajo con sufijos registradas." if not params else "No hay registros que coincidan con los filtros.")
+            return
         
         # Mostrar estadísticas
         col_met1, col_met2, col_met3 = st.columns(3)
         with col_met1:
-            st.metric("Total OT Sufijos", len(df_filtrado))
+            st.metric("Total OT Sufijos", resumen['total'])
         with col_met2:
-            st.metric("OT Base Diferentes", df_filtrado['codigo_ot_base'].nunique())
+            st.metric("OT Base Diferentes", resumen['ot_base'])
         with col_met3:
-            st.metric("Con Paro de Línea", len(df_filtrado[df_filtrado['paro_linea'] == 'SI']))
+            st.metric("Con Paro de Línea", resumen['paro_linea'])
         
-        # Mostrar tabla
-        st.dataframe(df_filtrado, use_container_width=True)
+        # Mostrar tabla (una página)
+        pagina, tamano = controles_paginacion("base_ot_sufijos", resumen['total'])
+        df_pagina = consultar_pagina(conn_ot_sufijos, fuente['origen'], COLUMNAS_BASE_OT_SUFIJOS + fuente['columnas'],
+                                     where, params, fuente['orden'], pagina, tamano)
+        st.dataframe(df_pagina, use_container_width=True)
         
-        # Exportar a Excel
+        # Exportar a Excel: todas las filas filtradas
         permisos = st.session_state.get('permisos', {})
         puede_descargar_excel = permisos.get('puede_descargar_excel', False)
         
-        if not df_filtrado.empty and puede_descargar_excel:
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                df_filtrado.to_excel(writer, sheet_name='OT_Sufijos', index=False)
-            
-            st.download_button(
-                label="📥 Exportar a Excel",
-                data=excel_buffer.getvalue(),
-                file_name=f"ot_sufijos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-        elif not df_filtrado.empty and not puede_descargar_excel:
+        if puede_descargar_excel:
+            exportar_consulta_excel(conn_ot_sufijos, fuente['origen'], COLUMNAS_BASE_OT_SUFIJOS, where, params,
+                                    fuente['orden'], 'OT_Sufijos', 'ot_sufijos', 'base_ot_sufijos')
+        else:
             st.info("ℹ️ No tiene permisos para exportar datos a Excel")
         
     except Exception as e:
         st.error(f"Error al cargar la base de datos de OT sufijos: {e}")
 
+# Columnas de la pestaña de base de datos de equipos
+COLUMNAS_BASE_EQUIPOS = '''
+    id, codigo_equipo, equipo, area, descripcion_funcionalidad,
+    especificaciones_tecnica_nombre,
+    (SELECT COUNT(*) FROM equipo_informes i
+     WHERE i.codigo_equipo = equipos.codigo_equipo) AS num_informes,
+    creado_en, actualizado_en
+'''
+
 def mostrar_base_equipos():
     """Muestra y permite exportar la base de datos de equipos"""
     st.subheader("🏭 Base de Datos: Equipos")
     
     try:
-        # Obtener todos los equipos
-        df = pd.read_sql('''
-            SELECT 
-                id, codigo_equipo, equipo, area, descripcion_funcionalidad,
-                especificaciones_tecnica_nombre, informes_json,
-                creado_en, actualizado_en
-            FROM equipos 
-            ORDER BY creado_en DESC
-        ''', conn_equipos)
-        
-        if df.empty:
-            st.info("No hay equipos registrados.")
-            return
-        
-        # Filtros
+        # Filtros (las opciones salen de SELECT DISTINCT, sin cargar la tabla)
         col1, col2 = st.columns(2)
         with col1:
             area_filtro = st.selectbox(
                 "Filtrar por área",
-                ["Todas"] + sorted(df['area'].unique().tolist()),
+                ["Todas"] + valores_distintos(conn_equipos, 'equipos', 'area'),
                 key="filtro_area_equipos"
             )
         with col2:
             busqueda = st.text_input("🔍 Buscar...", key="busqueda_equipos")
         
-        # Aplicar filtros
-        df_filtrado = df.copy()
-        if area_filtro != "Todas":
-            df_filtrado = df_filtrado[df_filtrado['area'] == area_filtro]
-        if busqueda:
-            mask = (
-                df_filtrado['codigo_equipo'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['equipo'].str.contains(busqueda, case=False, na=False) |
-                df_filtrado['descripcion_funcionalidad'].str.contains(busqueda, case=False, na=False)
-            )
-            df_filtrado = df_filtrado[mask]
-        
-        # Contar número de informes
-        def contar_informes(informes_json):
-            if informes_json and informes_json != "[]":
-                try:
-                    return len(json.loads(informes_json))
-                except:
-                    return 0
-            return 0
-        
-        df_filtrado['num_informes'] = df_filtrado['informes_json'].apply(contar_informes)
+        where, params = filtro_sql(
+            {'area': area_filtro}, busqueda,
+            ('codigo_equipo', 'equipo', 'descripcion_funcionalidad')
+        )
+        resumen = resumen_consulta(conn_equipos, 'equipos', {
+            'total': 'COUNT(*)',
+            'areas': 'COUNT(DISTINCT area)',
+            'con_especificaciones': 'COUNT(especificaciones_tecnica_nombre)',
+            'con_informes': 'SUM(EXISTS (SELECT 1 FROM equipo_informes i WHERE i.codigo_equipo = equipos.codigo_equipo))'
+        }, where, params)
+        
+        if resumen['total'] == 0:
+            st.info("No hay equipos registrados." if not params else "No hay equipos que coincidan con los filtros.")
+            return
         
         # Mostrar estadísticas
         col_met1, col_met2, col_met3, col_met4 = st.columns(4)
         with col_met1:
-            st.metric("Total Equipos", len(df_filtrado))
+            st.metric("Total Equipos", resumen['total'])
         with col_met2:
-            st.metric("Áreas Diferentes", df_filtrado['area'].nunique())
+            st.metric("Áreas Diferentes", resumen['areas'])
         with col_met3:
-            st.metric("Con Especificaciones", df_filtrado['especificaciones_tecnica_nombre'].notna().sum())
+            st.metric("Con Especificaciones", resumen['con_especificaciones'])
         with col_met4:
-            st.metric("Con Informes", (df_filtrado['num_informes'] > 0).sum())
+            st.metric("Con Informes", resumen['con_informes'])
         
-        # Mostrar tabla sin la columna informes_json (muy larga)
-        columnas_mostrar = [col for col in df_filtrado.columns if col != 'informes_json']
-        st.dataframe(df_filtrado[columnas_mostrar], use_container_width=True)
+        # Mostrar tabla (una página)
+        pagina, tamano = controles_paginacion("base_equipos", resumen['total'])
+        df_pagina = consultar_pagina(conn_equipos, 'equipos', COLUMNAS_BASE_EQUIPOS, where, params,
+                                     'creado_en DESC, id DESC', pagina, tamano)
+        st.dataframe(df_pagina, use_container_width=True)
         
         # Descarga de documentos de equipos
         st.subheader("📁 Descarga de Documentos de Equipos")
@@ -5069,11 +7650,12 @@ def mostrar_base_equipos():
         with col_doc1:
             # Especificaciones técnicas
             st.write("**Especificaciones Técnicas**")
-            equipos_con_espec = pd.read_sql('''
-                SELECT codigo_equipo, equipo, especificaciones_tecnica_nombre, especificaciones_tecnica_datos
+            marcadores = ', '.join('?' * len(df_pagina))
+            equipos_con_espec = pd.read_sql(f'''
+                SELECT codigo_equipo, equipo, especificaciones_tecnica_nombre, especificaciones_tecnica_ref
                 FROM equipos 
-                WHERE especificaciones_tecnica_datos IS NOT NULL
-            ''', conn_equipos)
+                WHERE especificaciones_tecnica_ref IS NOT NULL AND id IN ({marcadores})
+            ''', conn_equipos, params=df_pagina['id'].tolist())
             
             if not equipos_con_espec.empty:
                 equipo_espec = st.selectbox(
@@ -5087,78 +7669,52 @@ def mostrar_base_equipos():
                     codigo_equipo = equipo_espec.split(' - ')[0]
                     espec_data = equipos_con_espec[equipos_con_espec['codigo_equipo'] == codigo_equipo].iloc[0]
                     
-                    st.download_button(
-                        label=f"📥 Descargar {espec_data['especificaciones_tecnica_nombre']}",
-                        data=espec_data['especificaciones_tecnica_datos'],
-                        file_name=espec_data['especificaciones_tecnica_nombre'],
-                        mime="application/octet-stream",
-                        use_container_width=True
-                    )
+                    ruta_espec = ruta_adjunto(espec_data['especificaciones_tecnica_ref'])
+                    if ruta_espec:
+                        with open(ruta_espec, 'rb') as archivo_espec:
+                            st.download_button(
+                                label=f"📥 Descargar {espec_data['especificaciones_tecnica_nombre']}",
+                                data=archivo_espec,
+                                file_name=espec_data['especificaciones_tecnica_nombre'],
+                                mime="application/octet-stream",
+                                use_container_width=True
+                            )
+                    else:
+                        st.warning("⚠️ El archivo no está disponible en este servidor")
         
         with col_doc2:
             # Informes técnicos
             st.write("**Informes Técnicos**")
-            equipos_con_informes = []
-            for _, row in df_filtrado.iterrows():
-                if row['num_informes'] > 0:
-                    try:
-                        informes = json.loads(row['informes_json'])
-                        for informe in informes:
-                            equipos_con_informes.append({
-                                'codigo_equipo': row['codigo_equipo'],
-                                'equipo': row['equipo'],
-                                'nombre_informe': informe['nombre'],
-                                'datos_base64': informe.get('datos_base64'),
-                                'tipo': informe.get('tipo', 'application/octet-stream')
-                            })
-                    except:
-                        continue
+            equipos_con_informes = pd.read_sql(f'''
+                SELECT i.id, i.codigo_equipo, e.equipo, i.nombre, i.tipo, i.adjunto_ref
+                FROM equipo_informes i
+                JOIN equipos e ON e.codigo_equipo = i.codigo_equipo
+                WHERE e.id IN ({marcadores})
+                ORDER BY i.codigo_equipo, i.id
+            ''', conn_equipos, params=df_pagina['id'].tolist())
             
-            if equipos_con_informes:
+            if not equipos_con_informes.empty:
                 informe_seleccionado = st.selectbox(
                     "Seleccionar informe para descargar:",
-                    [f"{row['codigo_equipo']} - {row['equipo']} ({row['nombre_informe']})" 
-                     for row in equipos_con_informes],
+                    equipos_con_informes['id'].tolist(),
+                    format_func=lambda id_informe: (
+                        lambda fila: f"{fila['codigo_equipo']} - {fila['equipo']} ({fila['nombre']})"
+                    )(equipos_con_informes[equipos_con_informes['id'] == id_informe].iloc[0]),
                     key="descarga_informes"
                 )
                 
                 if informe_seleccionado:
-                    codigo_equipo = informe_seleccionado.split(' - ')[0]
-                    nombre_informe = informe_seleccionado.split('(')[1].rstrip(')')
-                    
-                    for informe_data in equipos_con_informes:
-                        if (informe_data['codigo_equipo'] == codigo_equipo and 
-                            informe_data['nombre_informe'] == nombre_informe):
-                            
-                            # Decodificar base64
-                            if informe_data['datos_base64']:
-                                datos_bytes = base64.b64decode(informe_data['datos_base64'])
-                                st.download_button(
-                                    label=f"📥 Descargar {informe_data['nombre_informe']}",
-                                    data=datos_bytes,
-                                    file_name=informe_data['nombre_informe'],
-                                    mime=informe_data['tipo'],
-                                    use_container_width=True
-                                )
-                            break
+                    informe_data = equipos_con_informes[equipos_con_informes['id'] == informe_seleccionado].iloc[0]
+                    descargar_informe(informe_data.to_dict(), use_container_width=True)
         
-        # Exportar a Excel
+        # Exportar a Excel: todas las filas filtradas
         permisos = st.session_state.get('permisos', {})
         puede_descargar_excel = permisos.get('puede_descargar_excel', False)
         
-        if not df_filtrado.empty and puede_descargar_excel:
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                df_filtrado.to_excel(writer, sheet_name='Equipos', index=False)
-            
-            st.download_button(
-                label="📥 Exportar a Excel",
-                data=excel_buffer.getvalue(),
-                file_name=f"equipos_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
-        elif not df_filtrado.empty and not puede_descargar_excel:
+        if puede_descargar_excel:
+            exportar_consulta_excel(conn_equipos, 'equipos', COLUMNAS_BASE_EQUIPOS, where, params,
+                                    'creado_en DESC, id DESC', 'Equipos', 'equipos', 'base_equipos')
+        else:
             st.info("ℹ️ No tiene permisos para exportar datos a Excel")
         
     except Exception as e:
@@ -5259,111 +7815,315 @@ def mostrar_exportacion_masiva():
     
     if st.button("🚀 Generar Archivo Excel con Todas las Bases de Datos", use_container_width=True):
         try:
-            # Crear buffer para el archivo Excel
-            excel_buffer = BytesIO()
+            consultas = [
+                (hoja, conn, f"SELECT {columnas_exportables(conn, tabla)} FROM {tabla}", ())
+                for hoja, conn, tabla in [
+                    ('Avisos', conn_avisos, 'avisos'),
+                    ('OT_Unicas', conn_ot_unicas, 'ot_unicas'),
+                    ('OT_Sufijos', conn_ot_sufijos, 'ot_sufijos'),
+                    ('Equipos', conn_equipos, 'equipos')
+                ]
+            ]
+            # Colaboradores (sin contraseñas)
+            consultas.append(('Colaboradores', conn_colaboradores, '''
+                SELECT codigo_id, nombre_colaborador, personal, cargo, creado_en, actualizado_en 
+                FROM colaboradores
+            ''', ()))
             
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                # 1. Avisos
-                try:
-                    df_avisos = pd.read_sql('SELECT * FROM avisos', conn_avisos)
-                    df_avisos.to_excel(writer, sheet_name='Avisos', index=False)
-                except Exception as e:
-                    st.error(f"Error al exportar avisos: {e}")
-                
-                # 2. OT Únicas
-                try:
-                    df_ot_unicas = pd.read_sql('SELECT * FROM ot_unicas', conn_ot_unicas)
-                    df_ot_unicas.to_excel(writer, sheet_name='OT_Unicas', index=False)
-                except Exception as e:
-                    st.error(f"Error al exportar OT únicas: {e}")
-                
-                # 3. OT Sufijos
-                try:
-                    df_ot_sufijos = pd.read_sql('SELECT * FROM ot_sufijos', conn_ot_sufijos)
-                    df_ot_sufijos.to_excel(writer, sheet_name='OT_Sufijos', index=False)
-                except Exception as e:
-                    st.error(f"Error al exportar OT sufijos: {e}")
-                
-                # 4. Equipos
-                try:
-                    df_equipos = pd.read_sql('SELECT * FROM equipos', conn_equipos)
-                    df_equipos.to_excel(writer, sheet_name='Equipos', index=False)
-                except Exception as e:
-                    st.error(f"Error al exportar equipos: {e}")
-                
-                # 5. Colaboradores (sin contraseñas)
-                try:
-                    df_colaboradores = pd.read_sql('''
-                        SELECT codigo_id, nombre_colaborador, personal, cargo, creado_en, actualizado_en 
-                        FROM colaboradores
-                    ''', conn_colaboradores)
-                    df_colaboradores.to_excel(writer, sheet_name='Colaboradores', index=False)
-                except Exception as e:
-                    st.error(f"Error al exportar colaboradores: {e}")
-                
-                # 6. Hoja de resumen
-                try:
-                    resumen_data = {
-                        'Base de Datos': ['Avisos', 'OT Únicas', 'OT Sufijos', 'Equipos', 'Colaboradores'],
-                        'Total Registros': [
-                            len(df_avisos) if 'df_avisos' in locals() else 0,
-                            len(df_ot_unicas) if 'df_ot_unicas' in locals() else 0,
-                            len(df_ot_sufijos) if 'df_ot_sufijos' in locals() else 0,
-                            len(df_equipos) if 'df_equipos' in locals() else 0,
-                            len(df_colaboradores) if 'df_colaboradores' in locals() else 0
-                        ],
-                        'Fecha Exportación': [datetime.now().strftime("%Y-%m-%d %H:%M")] * 5
-                    }
-                    df_resumen = pd.DataFrame(resumen_data)
-                    df_resumen.to_excel(writer, sheet_name='Resumen', index=False)
-                except Exception as e:
-                    st.error(f"Error al crear resumen: {e}")
+            with st.spinner("Generando archivo Excel..."):
+                ruta, _ = escribir_excel_streaming(consultas, hoja_resumen='Resumen')
             
-            # Botón de descarga
             st.success("✅ Archivo Excel generado exitosamente!")
             
-            st.download_button(
-                label="📥 Descargar Archivo Completo",
-                data=excel_buffer.getvalue(),
-                file_name=f"backup_completo_sistema_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True
-            )
+            boton_descarga_excel(ruta, "📥 Descargar Archivo Completo", "backup_completo_sistema")
             
         except Exception as e:
             st.error(f"Error al generar el archivo de exportación masiva: {e}")
 
-def crear_backup_local():
-    """Crear backup local de todas las bases de datos"""
+# ===============================BACKUPS LOCALES (API DE BACKUP DE SQLITE)================================
+# Cada base se copia con Connection.backup: la copia se hace en una sola transacción de
+# lectura, así la instantánea es consistente y, en modo WAL, no bloquea a los escritores.
+# El ZIP (DEFLATE) se arma en un hilo aparte. Los backups forman cadenas: uno completo y
+# luego incrementales que solo guardan las páginas que cambiaron desde el backup anterior.
+DIRECTORIO_BACKUPS = Path("backups")
+INCREMENTALES_POR_CADENA = 6
+CADENAS_A_CONSERVAR = 4
+NIVEL_COMPRESION_BACKUP = 6
+
+def _directorio_referencia():
+    """Carpeta con la última instantánea de cada base (contra ella se calculan los incrementales)"""
+    referencia = DIRECTORIO_BACKUPS / 'referencia'
+    referencia.mkdir(parents=True, exist_ok=True)
+    return referencia
+
+def _leer_estado_cadena():
+    """Último backup de la cadena actual, incrementales acumulados y adjuntos ya guardados"""
+    ruta = _directorio_referencia() / 'cadena.json'
+    if not ruta.exists():
+        return {'ultimo': None, 'incrementales': 0, 'adjuntos': []}
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _guardar_estado_cadena(estado_cadena):
+    """Persistir el estado de la cadena de backups (escritura atómica)"""
+    ruta = _directorio_referencia() / 'cadena.json'
+    temporal = ruta.with_suffix('.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado_cadena, f)
+    os.replace(temporal, ruta)
+
+def instantanea_sqlite(origen, destino):
+    """Copia consistente de una base en uso con la API de backup; devuelve el tamaño de página"""
+    if Path(destino).exists():
+        os.remove(destino)
+    conn_origen = sqlite3.connect(f"file:{origen}?mode=ro", uri=True, timeout=30)
+    conn_destino = sqlite3.connect(destino)
     try:
-        backup_dir = Path("backups")
-        backup_dir.mkdir(exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = backup_dir / f"backup_{timestamp}.zip"
-        
-        # Crear archivo ZIP con todas las bases
-        with zipfile.ZipFile(backup_file, 'w') as zipf:
-            databases = []
+        # pages=-1: todo en un paso, sin reinicios si otra conexión escribe a mitad de la copia
+        conn_origen.backup(conn_destino, pages=-1)
+        return conn_destino.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn_destino.close()
+        conn_origen.close()
+
+def _paginas_modificadas(anterior, nuevo, tamano_pagina, destino):
+    """Escribir en destino las páginas de 'nuevo' que difieren de 'anterior'; devuelve sus números"""
+    paginas = []
+    with open(anterior, 'rb') as f_anterior, open(nuevo, 'rb') as f_nuevo:
+        numero = 0
+        while True:
+            pagina = f_nuevo.read(tamano_pagina)
+            if not pagina:
+                break
+            if f_anterior.read(tamano_pagina) != pagina:
+                destino.write(pagina)
+                paginas.append(numero)
+            numero += 1
+    return paginas
+
+def crear_backup_local(completo=False):
+    """Crear un backup de todas las bases y de los adjuntos nuevos.
+    
+    Es completo si se pide, si no hay cadena previa o si la cadena ya tiene
+    INCREMENTALES_POR_CADENA incrementales; si no, es incremental por páginas.
+    Devuelve la ruta del ZIP, o None si no hay bases que respaldar.
+    """
+    DIRECTORIO_BACKUPS.mkdir(exist_ok=True)
+    referencia = _directorio_referencia()
+    estado_cadena = _leer_estado_cadena()
+    
+    bases = [Path(db_path) for db_path in archivos_base() if Path(db_path).exists()]
+    if not bases:
+        print("⚠️ No hay bases de datos para hacer backup")
+        return None
+    
+    anterior = estado_cadena['ultimo']
+    completo = (completo or anterior is None
+                or not (DIRECTORIO_BACKUPS / anterior).exists()
+                or estado_cadena['incrementales'] >= INCREMENTALES_POR_CADENA
+                or any(not (referencia / base.name).exists() for base in bases))
+    tipo = 'completo' if completo else 'incremental'
+    
+    # Con microsegundos: dos backups en el mismo segundo no pueden pisarse
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    backup_file = DIRECTORIO_BACKUPS / f"backup_{timestamp}_{tipo}.zip"
+    temporal = backup_file.with_suffix('.parcial')
+    manifiesto = {'tipo': tipo, 'anterior': None if completo else anterior, 'fecha': timestamp, 'bases': {}}
+    adjuntos_previos = set() if completo else set(estado_cadena['adjuntos'])
+    adjuntos_actuales = []
+    
+    try:
+        with zipfile.ZipFile(temporal, 'w', compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=NIVEL_COMPRESION_BACKUP) as zipf:
+            for base in bases:
+                instantanea = referencia / f"{base.name}.nuevo"
+                tamano_pagina = instantanea_sqlite(base, instantanea)
+                
+                if completo:
+                    zipf.write(instantanea, arcname=base.name)
+                else:
+                    with zipf.open(f"paginas/{base.name}.bin", 'w', force_zip64=True) as destino:
+                        paginas = _paginas_modificadas(referencia / base.name, instantanea,
+                                                       tamano_pagina, destino)
+                    manifiesto['bases'][base.name] = {
+                        'tamano_pagina': tamano_pagina,
+                        'tamano': instantanea.stat().st_size,
+                        'paginas': paginas
+                    }
             
-            # Verificar qué bases de datos existen
-            for db_name in ['avisos.db', 'equipos.db', 'ot_unicas.db', 'ot_sufijos.db', 'colaboradores.db']:
-                db_path = get_database_path(db_name)
-                if Path(db_path).exists():
-                    databases.append(db_path)
+            # Almacén de adjuntos: son inmutables, basta con los que no estén en la cadena
+            for ruta in directorio_adjuntos().glob('??/*'):
+                adjuntos_actuales.append(ruta.name)
+                if ruta.name not in adjuntos_previos:
+                    zipf.write(ruta, arcname=f"adjuntos/{ruta.parent.name}/{ruta.name}")
             
-            for db_path in databases:
-                zipf.write(db_path, arcname=Path(db_path).name)
-        
-        if databases:
-            return backup_file
-        else:
-            st.warning("⚠️ No hay bases de datos para hacer backup")
-            return None
+            zipf.writestr('manifiesto.json', json.dumps(manifiesto))
+        
+        os.replace(temporal, backup_file)
+    except Exception:
+        if temporal.exists():
+            os.remove(temporal)
+        raise
+    
+    # El backup quedó completo: las instantáneas pasan a ser la nueva referencia
+    for base in bases:
+        os.replace(referencia / f"{base.name}.nuevo", referencia / base.name)
+    _guardar_estado_cadena({
+        'ultimo': backup_file.name,
+        'incrementales': 0 if completo else estado_cadena['incrementales'] + 1,
+        'adjuntos': adjuntos_actuales
+    })
+    
+    rotar_backups()
+    print(f"💾 Backup {tipo} creado: {backup_file} ({backup_file.stat().st_size / 1024:.0f} KB)")
+    return backup_file
+
+def rotar_backups():
+    """Conservar las CADENAS_A_CONSERVAR cadenas más recientes (completo + sus incrementales)"""
+    completos = sorted(DIRECTORIO_BACKUPS.glob('backup_*_completo.zip'))
+    if len(completos) <= CADENAS_A_CONSERVAR:
+        return
+    
+    # Los nombres llevan el timestamp, el orden alfabético es el cronológico
+    limite = completos[-CADENAS_A_CONSERVAR].name
+    for ruta in DIRECTORIO_BACKUPS.glob('backup_*.zip'):
+        if ruta.name < limite:
+            try:
+                os.remove(ruta)
+                print(f"🗑️ Backup antiguo eliminado: {ruta.name}")
+            except OSError as e:
+                print(f"⚠️ No se pudo eliminar {ruta.name}: {e}")
+
+def cadena_backup(backup_file):
+    """Lista de backups (del completo al indicado) necesaria para restaurar backup_file"""
+    cadena = []
+    actual = Path(backup_file)
+    while len(cadena) <= INCREMENTALES_POR_CADENA:
+        with zipfile.ZipFile(actual) as zipf:
+            manifiesto = json.loads(zipf.read('manifiesto.json'))
+        cadena.insert(0, (actual, manifiesto))
+        if manifiesto['tipo'] == 'completo':
+            return cadena
+        actual = DIRECTORIO_BACKUPS / manifiesto['anterior']
+        if not actual.exists():
+            raise FileNotFoundError(f"Falta el backup {manifiesto['anterior']} de la cadena")
+    raise ValueError(f"La cadena de {Path(backup_file).name} no llega a un backup completo")
+
+def reconstruir_backup(backup_file):
+    """Armar un ZIP autónomo (bases completas + adjuntos) a partir de una cadena de backups"""
+    cadena = cadena_backup(backup_file)
+    descriptor, salida = tempfile.mkstemp(prefix='backup_', suffix='.zip')
+    os.close(descriptor)
+    
+    with tempfile.TemporaryDirectory() as directorio:
+        directorio = Path(directorio)
+        with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED,
+                             compresslevel=NIVEL_COMPRESION_BACKUP) as zip_salida:
+            for ruta_zip, manifiesto in cadena:
+                with zipfile.ZipFile(ruta_zip) as zipf:
+                    for nombre in zipf.namelist():
+                        if nombre.startswith('adjuntos/'):
+                            with zipf.open(nombre) as origen, zip_salida.open(nombre, 'w') as destino:
+                                shutil.copyfileobj(origen, destino, TAMANO_BLOQUE_ADJUNTO)
+                        elif manifiesto['tipo'] == 'completo' and nombre != 'manifiesto.json':
+                            zipf.extract(nombre, directorio)
+                    
+                    # Aplicar las páginas cambiadas sobre la copia reconstruida
+                    for nombre_base, datos in manifiesto['bases'].items():
+                        with zipf.open(f"paginas/{nombre_base}.bin") as paginas, \
+                             open(directorio / nombre_base, 'r+b') as base:
+                            for numero in datos['paginas']:
+                                base.seek(numero * datos['tamano_pagina'])
+                                base.write(paginas.read(datos['tamano_pagina']))
+                            base.truncate(datos['tamano'])
             
+            for ruta in directorio.glob('*'):
+                zip_salida.write(ruta, arcname=ruta.name)
+    return salida
+
+@st.cache_resource
+def obtener_estado_backups():
+    """Estado compartido (por proceso) del hilo que genera los backups"""
+    return {'lock': threading.Lock(), 'hilo': None, 'ultimo': None, 'error': None}
+
+def _ejecutar_backup(estado, completo):
+    """Hilo de backup: instantáneas, compresión y rotación fuera de la sesión del usuario"""
+    try:
+        backup_file = crear_backup_local(completo)
+        with estado['lock']:
+            estado['ultimo'] = backup_file
+            estado['error'] = None if backup_file else "No hay bases de datos para hacer backup"
     except Exception as e:
-        st.error(f"❌ Error al crear backup local: {e}")
-        return None
+        print(f"❌ Error al crear backup local: {e}")
+        with estado['lock']:
+            estado['error'] = str(e)
+
+def iniciar_backup_local(completo=False):
+    """Lanzar el backup en segundo plano; False si ya hay uno en curso"""
+    estado = obtener_estado_backups()
+    with estado['lock']:
+        if estado['hilo'] is not None and estado['hilo'].is_alive():
+            return False
+        hilo = threading.Thread(target=_ejecutar_backup, args=(estado, completo),
+                                name="backup_local", daemon=True)
+        estado['hilo'] = hilo
+        estado['error'] = None
+    hilo.start()
+    return True
+
+def mostrar_backups_locales():
+    """Controles del backup local en la barra lateral"""
+    estado = obtener_estado_backups()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("💾 Crear Backup Local", use_container_width=True):
+            if not iniciar_backup_local():
+                st.warning("⚠️ Ya hay un backup en curso")
+    with col2:
+        if st.button("📦 Backup Completo", use_container_width=True):
+            if not iniciar_backup_local(completo=True):
+                st.warning("⚠️ Ya hay un backup en curso")
+    
+    with estado['lock']:
+        en_curso = estado['hilo'] is not None and estado['hilo'].is_alive()
+        ultimo, error = estado['ultimo'], estado['error']
+    
+    if en_curso:
+        st.caption("🔄 Generando backup en segundo plano...")
+        if st.button("🔄 Actualizar estado", use_container_width=True):
+            st.rerun()
+        return
+    if error:
+        st.error(f"❌ Error al crear backup local: {error}")
+    if not ultimo or not Path(ultimo).exists():
+        return
+    
+    st.caption(f"🕒 Último backup: {Path(ultimo).name} ({Path(ultimo).stat().st_size / 1024:.0f} KB)")
+    if Path(ultimo).name.endswith('_completo.zip'):
+        with open(ultimo, "rb") as f:
+            st.download_button(
+                label="📥 Descargar Backup",
+                data=f,
+                file_name=Path(ultimo).name,
+                mime="application/zip",
+                use_container_width=True
+            )
+    elif st.button("🧩 Preparar descarga (completo)", use_container_width=True):
+        # Un incremental solo no sirve: se entrega la cadena reconstruida
+        try:
+            salida = reconstruir_backup(ultimo)
+            with open(salida, "rb") as f:
+                st.download_button(
+                    label="📥 Descargar Backup",
+                    data=f,
+                    file_name=Path(ultimo).name.replace('_incremental', ''),
+                    mime="application/zip",
+                    use_container_width=True
+                )
+            os.remove(salida)
+        except Exception as e:
+            st.error(f"❌ Error al reconstruir el backup: {e}")
 
 # ===============================INTERFAZ PRINCIPAL================================
 def main():
@@ -5378,6 +8138,7 @@ def main():
     # Si no está autenticado, mostrar login
     if not st.session_state.autenticado:
         st.title("🔐 Sistema de Mantenimiento - Login")
+        mostrar_estado_hidratacion()
         st.markdown("---")
         
         with st.form("formulario_login"):
@@ -5390,44 +8151,20 @@ def main():
                 if not codigo_id or not contraseña:
                     st.error("❌ Complete todos los campos")
                 else:
-                    # Verificar credenciales
-                    try:
-                        c = conn_colaboradores.cursor()
-                        c.execute('SELECT codigo_id, nombre_colaborador, cargo, contraseña FROM colaboradores WHERE codigo_id = ?', (codigo_id,))
-                        usuario = c.fetchone()
-                        
-                        if usuario:
-                            contraseña_hash = hashlib.sha256(contraseña.encode()).hexdigest()
-                            if usuario[3] == contraseña_hash:
-                                st.session_state.autenticado = True
-                                st.session_state.usuario = {
-                                    'codigo_id': usuario[0],
-                                    'nombre': usuario[1],
-                                    'cargo': usuario[2]
-                                }
-                                st.success(f"✅ ¡Bienvenido, {usuario[1]}!")
-                                st.balloons()
-                                time.sleep(1)
-                                st.rerun()
-                            else:
-                                st.error("❌ Contraseña incorrecta")
-                        else:
-                            # Si no existe el usuario, probar con el admin por defecto
-                            if codigo_id == "70697318" and contraseña == "deseandote1+":
-                                st.session_state.autenticado = True
-                                st.session_state.usuario = {
-                                    'codigo_id': '70697318',
-                                    'nombre': 'Administrador',
-                                    'cargo': 'GERENTE'
-                                }
-                                st.success("✅ ¡Bienvenido, Administrador!")
-                                st.balloons()
-                                time.sleep(1)
-                                st.rerun()
-                            else:
-                                st.error("❌ Usuario no encontrado")
-                    except Exception as e:
-                        st.error(f"❌ Error del sistema: {e}")
+                    resultado = verificar_login(codigo_id, contraseña)
+                    if resultado['autenticado']:
+                        st.session_state.autenticado = True
+                        st.session_state.usuario = {
+                            'codigo_id': resultado['codigo_id'],
+                            'nombre': resultado['nombre'],
+                            'cargo': resultado['cargo']
+                        }
+                        st.success(f"✅ ¡Bienvenido, {resultado['nombre']}!")
+                        st.balloons()
+                        time.sleep(1)
+                        st.rerun()
+                    else:
+                        st.error(f"❌ {resultado['error']}")
         return
 
     # ===============================MENÚ PRINCIPAL (USUARIO AUTENTICADO)================================
@@ -5445,6 +8182,7 @@ def main():
     if st.session_state.use_google_sheets:
         st.sidebar.success("✅ Google Sheets activado")
         st.sidebar.caption("📊 Datos persistentes en la nube")
+        mostrar_estado_hidratacion(st.sidebar)
     else:
         st.sidebar.info("📁 Solo SQLite local")
         if EN_STREAMLIT_CLOUD:
@@ -5465,27 +8203,38 @@ def main():
         if st.session_state.use_google_sheets:
             # Botón para guardar en la nube
             if st.button("⬆️ Sincronizar Todo con Google Sheets", use_container_width=True):
-                with st.spinner("Sincronizando todas las bases de datos..."):
-                    exitos = sincronizar_todas_tablas()
-                    if exitos > 0:
-                        st.success(f"✅ {exitos} tablas sincronizadas exitosamente!")
-                    else:
-                        st.error("❌ Error al sincronizar")
-            
+                encoladas = encolar_todas_tablas()
+                if encoladas > 0:
+                    st.success(f"✅ {encoladas} tablas en cola de sincronización")
+                else:
+                    st.error("❌ Error al encolar la sincronización")
+
+            # Reescritura completa de las hojas (solo si se desincronizaron)
+            if st.button("🧱 Reconstruir hojas", use_container_width=True):
+                encoladas = encolar_todas_tablas(modo=MODO_SYNC_RECONSTRUIR)
+                if encoladas > 0:
+                    st.success(f"✅ {encoladas} hojas en cola para reconstrucción")
+                else:
+                    st.error("❌ Error al encolar la reconstrucción")
+
+            # Estado de la cola
+            estado_sync = obtener_estado_sync()
+            st.caption(f"📬 En cola: {estado_sync['pendientes']} peticiones "
+                       f"({estado_sync['tablas_pendientes']} tablas)")
+            st.caption(f"🕒 Última sincronización exitosa: {estado_sync['ultimo_exito'] or 'Nunca'}")
+            if estado_sync['ultimo_error'] and estado_sync['pendientes'] > 0:
+                st.caption(f"⚠️ Último error: {estado_sync['ultimo_error'][:120]}")
+            resumen = obtener_recursos_gs()['resumen_sync']
+            if resumen:
+                st.caption(f"⏱️ Última ronda ({resumen['fecha']}): {resumen['exitos']}/{len(resumen['tablas'])} "
+                           f"tablas en {resumen['total_segundos']:.1f}s")
+                st.caption(" · ".join(f"{'✅' if ok else '❌'} {tabla} {segundos:.1f}s"
+                                      for tabla, (ok, segundos) in resumen['tablas'].items()))
+
             st.markdown("---")
-            
-        # Backup local
-        if st.button("💾 Crear Backup Local", use_container_width=True):
-            backup_file = crear_backup_local()
-            if backup_file:
-                with open(backup_file, "rb") as f:
-                    st.download_button(
-                        label="📥 Descargar Backup",
-                        data=f,
-                        file_name=backup_file.name,
-                        mime="application/zip",
-                        use_container_width=True
-                    )
+
+        # Backup local (se genera en segundo plano)
+        mostrar_backups_locales()
     
     # Información de usuario
     st.sidebar.markdown("---")
@@ -5499,6 +8248,15 @@ def main():
     
     # ===============================CONTENIDO PRINCIPAL================================
     
+    # Cada sección espera solo las tablas que usa
+    tablas_por_seccion = {
+        "🏭 Gestión de Equipos": ['equipos', 'equipo_informes'],
+        "👥 Colaboradores": ['colaboradores'],
+        "📝 Avisos": ['avisos', 'equipos'],
+        "📋 Órdenes de Trabajo": ['avisos', 'ot_unicas', 'ot_sufijos', 'ot_eventos', 'equipos']
+    }
+    requerir_tablas(*tablas_por_seccion.get(selected_menu, TABLAS_HIDRATACION))
+    
     if selected_menu == "🏠 Inicio":
         st.title(f"🏠 Bienvenido, {st.session_state.usuario['nombre']}")
         
@@ -5507,19 +8265,19 @@ def main():
         
         try:
             with col1:
-                avisos_count = pd.read_sql("SELECT COUNT(*) FROM avisos", conn_avisos).iloc[0][0]
+                avisos_count = contar_registros(conn_avisos, 'avisos')
                 st.metric("Avisos", avisos_count)
             
             with col2:
-                equipos_count = pd.read_sql("SELECT COUNT(*) FROM equipos", conn_equipos).iloc[0][0]
+                equipos_count = contar_registros(conn_equipos, 'equipos')
                 st.metric("Equipos", equipos_count)
             
             with col3:
-                ot_count = pd.read_sql("SELECT COUNT(*) FROM ot_unicas", conn_ot_unicas).iloc[0][0]
+                ot_count = contar_registros(conn_ot_unicas, 'ot_unicas')
                 st.metric("Órdenes de Trabajo", ot_count)
             
             with col4:
-                colab_count = pd.read_sql("SELECT COUNT(*) FROM colaboradores", conn_colaboradores).iloc[0][0]
+                colab_count = contar_registros(conn_colaboradores, 'colaboradores')
                 st.metric("Colaboradores", colab_count)
         except Exception as e:
             print(f"⚠️ Error cargando estadísticas: {e}")
@@ -5615,9 +8373,8 @@ def main():
                     # Opción para sincronizar
                     if st.session_state.use_google_sheets:
                         if st.button("🔄 Sincronizar Equipos con Google Sheets"):
-                            with st.spinner("Sincronizando..."):
-                                if guardar_en_google_sheets('equipos', conn_equipos):
-                                    st.success("✅ Equipos sincronizados exitosamente!")
+                            if encolar_sincronizacion('equipos'):
+                                st.success("✅ Equipos en cola de sincronización")
             except Exception as e:
                 st.error(f"Error: {e}")
     
@@ -5668,9 +8425,8 @@ def main():
                     # Opción para sincronizar
                     if st.session_state.use_google_sheets:
                         if st.button("🔄 Sincronizar Colaboradores con Google Sheets"):
-                            with st.spinner("Sincronizando..."):
-                                if guardar_en_google_sheets('colaboradores', conn_colaboradores):
-                                    st.success("✅ Colaboradores sincronizados exitosamente!")
+                            if encolar_sincronizacion('colaboradores'):
+                                st.success("✅ Colaboradores en cola de sincronización")
             except Exception as e:
                 st.error(f"Error: {e}")
     
@@ -5684,15 +8440,14 @@ def main():
             try:
                 df = pd.read_sql("SELECT * FROM avisos LIMIT 100", conn_avisos)
                 st.dataframe(df, use_container_width=True)
-                total = pd.read_sql("SELECT COUNT(*) as total FROM avisos", conn_avisos).iloc[0]['total']
+                total = contar_registros(conn_avisos, 'avisos')
                 st.write(f"Total registros: {total}")
                 
                 # Sincronizar
                 if st.session_state.use_google_sheets:
                     if st.button("🔄 Sincronizar Avisos"):
-                        with st.spinner("Sincronizando..."):
-                            if guardar_en_google_sheets('avisos', conn_avisos):
-                                st.success("✅ Avisos sincronizados!")
+                        if encolar_sincronizacion('avisos'):
+                            st.success("✅ Avisos en cola de sincronización")
             except:
                 st.info("Tabla vacía o error al cargar")
         
@@ -5701,15 +8456,14 @@ def main():
             try:
                 df = pd.read_sql("SELECT * FROM ot_unicas LIMIT 100", conn_ot_unicas)
                 st.dataframe(df, use_container_width=True)
-                total = pd.read_sql("SELECT COUNT(*) as total FROM ot_unicas", conn_ot_unicas).iloc[0]['total']
+                total = contar_registros(conn_ot_unicas, 'ot_unicas')
                 st.write(f"Total registros: {total}")
                 
                 # Sincronizar
                 if st.session_state.use_google_sheets:
                     if st.button("🔄 Sincronizar OT Únicas"):
-                        with st.spinner("Sincronizando..."):
-                            if guardar_en_google_sheets('ot_unicas', conn_ot_unicas):
-                                st.success("✅ OT Únicas sincronizadas!")
+                        if encolar_sincronizacion('ot_unicas'):
+                            st.success("✅ OT Únicas en cola de sincronización")
             except:
                 st.info("Tabla vacía o error al cargar")
         
@@ -5718,15 +8472,14 @@ def main():
             try:
                 df = pd.read_sql("SELECT * FROM ot_sufijos LIMIT 100", conn_ot_sufijos)
                 st.dataframe(df, use_container_width=True)
-                total = pd.read_sql("SELECT COUNT(*) as total FROM ot_sufijos", conn_ot_sufijos).iloc[0]['total']
+                total = contar_registros(conn_ot_sufijos, 'ot_sufijos')
                 st.write(f"Total registros: {total}")
                 
                 # Sincronizar
                 if st.session_state.use_google_sheets:
                     if st.button("🔄 Sincronizar OT Sufijos"):
-                        with st.spinner("Sincronizando..."):
-                            if guardar_en_google_sheets('ot_sufijos', conn_ot_sufijos):
-                                st.success("✅ OT Sufijos sincronizadas!")
+                        if encolar_sincronizacion('ot_sufijos'):
+                            st.success("✅ OT Sufijos en cola de sincronización")
             except:
                 st.info("Tabla vacía o error al cargar")
         
@@ -5735,15 +8488,14 @@ def main():
             try:
                 df = pd.read_sql("SELECT * FROM equipos LIMIT 100", conn_equipos)
                 st.dataframe(df, use_container_width=True)
-                total = pd.read_sql("SELECT COUNT(*) as total FROM equipos", conn_equipos).iloc[0]['total']
+                total = contar_registros(conn_equipos, 'equipos')
                 st.write(f"Total registros: {total}")
                 
                 # Sincronizar
                 if st.session_state.use_google_sheets:
                     if st.button("🔄 Sincronizar Equipos"):
-                        with st.spinner("Sincronizando..."):
-                            if guardar_en_google_sheets('equipos', conn_equipos):
-                                st.success("✅ Equipos sincronizados!")
+                        if encolar_sincronizacion('equipos'):
+                            st.success("✅ Equipos en cola de sincronización")
             except:
                 st.info("Tabla vacía o error al cargar")
         
@@ -5752,15 +8504,14 @@ def main():
             try:
                 df = pd.read_sql("SELECT codigo_id, nombre_colaborador, personal, cargo, creado_en FROM colaboradores", conn_colaboradores)
                 st.dataframe(df, use_container_width=True)
-                total = pd.read_sql("SELECT COUNT(*) as total FROM colaboradores", conn_colaboradores).iloc[0]['total']
+                total = contar_registros(conn_colaboradores, 'colaboradores')
                 st.write(f"Total registros: {total}")
                 
                 # Sincronizar
                 if st.session_state.use_google_sheets:
                     if st.button("🔄 Sincronizar Colaboradores"):
-                        with st.spinner("Sincronizando..."):
-                            if guardar_en_google_sheets('colaboradores', conn_colaboradores):
-                                st.success("✅ Colaboradores sincronizados!")
+                        if encolar_sincronizacion('colaboradores'):
+                            st.success("✅ Colaboradores en cola de sincronización")
             except:
                 st.info("Tabla vacía o error al cargar")
 
@@ -0,0 +1,193 @@
+# ===============================CREDENCIALES (HASH Y VERIFICACIÓN DE CONTRASEÑAS)================================
+# Las contraseñas se guardan como "algoritmo$parámetros$sal$hash" con sal aleatoria por usuario.
+# Los hash SHA-256 sin sal de versiones anteriores se siguen aceptando y, al iniciar sesión,
+# se reemplazan por el algoritmo actual (necesita_rehash). La verificación corre en un pool
+# pequeño de hilos, así una ráfaga de logins no satura el proceso, y los intentos fallidos
+# por usuario se limitan con un bloqueo que crece en cada fallo.
+#
+# Medir la latencia de verificación con distintos costos:  python credenciales.py
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Parámetros actuales (al cambiarlos, los hash anteriores se actualizan en el siguiente login)
+PARAMETROS_SCRYPT = {'n': 2 ** 14, 'r': 8, 'p': 1}
+ITERACIONES_PBKDF2 = 600_000
+TAMANO_SAL = 16
+TAMANO_HASH = 32
+
+# Verificación fuera del hilo de la sesión
+HILOS_VERIFICACION = 2
+ESPERA_VERIFICACION = 30  # segundos máximos esperando un resultado
+
+# Limitación de intentos por usuario
+INTENTOS_SIN_BLOQUEO = 3
+BLOQUEO_INICIAL = 2      # segundos tras superar los intentos permitidos
+BLOQUEO_MAXIMO = 300     # tope del bloqueo exponencial
+
+def _b64(datos):
+    return base64.b64encode(datos).decode('ascii')
+
+def _desde_b64(texto):
+    return base64.b64decode(texto.encode('ascii'))
+
+# ===============================ALGORITMOS================================
+def _hash_scrypt(contraseña, sal, n, r, p):
+    return hashlib.scrypt(contraseña.encode('utf-8'), salt=sal, n=n, r=r, p=p,
+                          maxmem=128 * r * (n + p + 2), dklen=TAMANO_HASH)
+
+def _generar_scrypt(contraseña):
+    sal = os.urandom(TAMANO_SAL)
+    n, r, p = PARAMETROS_SCRYPT['n'], PARAMETROS_SCRYPT['r'], PARAMETROS_SCRYPT['p']
+    return f"scrypt${n}${r}${p}${_b64(sal)}${_b64(_hash_scrypt(contraseña, sal, n, r, p))}"
+
+def _verificar_scrypt(contraseña, partes):
+    n, r, p, sal, esperado = partes
+    calculado = _hash_scrypt(contraseña, _desde_b64(sal), int(n), int(r), int(p))
+    return hmac.compare_digest(calculado, _desde_b64(esperado))
+
+def _vigente_scrypt(partes):
+    return [int(valor) for valor in partes[:3]] == [PARAMETROS_SCRYPT[k] for k in ('n', 'r', 'p')]
+
+def _hash_pbkdf2(contraseña, sal, iteraciones):
+    return hashlib.pbkdf2_hmac('sha256', contraseña.encode('utf-8'), sal, iteraciones, dklen=TAMANO_HASH)
+
+def _generar_pbkdf2(contraseña):
+    sal = os.urandom(TAMANO_SAL)
+    return f"pbkdf2_sha256${ITERACIONES_PBKDF2}${_b64(sal)}${_b64(_hash_pbkdf2(contraseña, sal, ITERACIONES_PBKDF2))}"
+
+def _verificar_pbkdf2(contraseña, partes):
+    iteraciones, sal, esperado = partes
+    calculado = _hash_pbkdf2(contraseña, _desde_b64(sal), int(iteraciones))
+    return hmac.compare_digest(calculado, _desde_b64(esperado))
+
+def _vigente_pbkdf2(partes):
+    return int(partes[0]) == ITERACIONES_PBKDF2
+
+# nombre: (generar, verificar, parámetros vigentes)
+ALGORITMOS = {
+    'scrypt': (_generar_scrypt, _verificar_scrypt, _vigente_scrypt),
+    'pbkdf2_sha256': (_generar_pbkdf2, _verificar_pbkdf2, _vigente_pbkdf2)
+}
+
+# scrypt depende de que OpenSSL lo traiga; si no, PBKDF2
+ALGORITMO_POR_DEFECTO = 'scrypt' if hasattr(hashlib, 'scrypt') else 'pbkdf2_sha256'
+
+def _es_sha256_legado(almacenado):
+    return len(almacenado) == 64 and all(car in '0123456789abcdef' for car in almacenado.lower())
+
+# ===============================API================================
+def hash_contraseña(contraseña, algoritmo=None):
+    """Hashea la contraseña con sal aleatoria para almacenamiento seguro"""
+    generar, _, _ = ALGORITMOS[algoritmo or ALGORITMO_POR_DEFECTO]
+    return generar(contraseña)
+
+def verificar_contraseña(contraseña_plana, contraseña_hash):
+    """Verifica si la contraseña coincide con el hash (formato actual o SHA-256 legado)"""
+    if not contraseña_hash:
+        return False
+    if _es_sha256_legado(contraseña_hash):
+        calculado = hashlib.sha256(contraseña_plana.encode()).hexdigest()
+        return hmac.compare_digest(calculado, contraseña_hash.lower())
+
+    algoritmo, _, resto = contraseña_hash.partition('$')
+    if algoritmo not in ALGORITMOS:
+        return False
+    try:
+        return ALGORITMOS[algoritmo][1](contraseña_plana, resto.split('$'))
+    except (ValueError, TypeError):
+        # Hash mal formado (p. ej. editado a mano en la hoja)
+        return False
+
+def necesita_rehash(contraseña_hash):
+    """True si el hash es legado o no usa el algoritmo y los parámetros actuales"""
+    if not contraseña_hash or _es_sha256_legado(contraseña_hash):
+        return True
+    algoritmo, _, resto = contraseña_hash.partition('$')
+    if algoritmo != ALGORITMO_POR_DEFECTO:
+        return True
+    try:
+        return not ALGORITMOS[algoritmo][2](resto.split('$'))
+    except (ValueError, IndexError):
+        return True
+
+# Hash de relleno: si el usuario no existe se verifica igual, con el mismo costo
+_HASH_RELLENO = None
+
+def _hash_relleno():
+    global _HASH_RELLENO
+    if _HASH_RELLENO is None:
+        _HASH_RELLENO = hash_contraseña(base64.b64encode(os.urandom(12)).decode('ascii'))
+    return _HASH_RELLENO
+
+# ===============================VERIFICACIÓN EN SEGUNDO PLANO================================
+_pool_verificacion = ThreadPoolExecutor(max_workers=HILOS_VERIFICACION, thread_name_prefix="verificar_credencial")
+
+def verificar_en_segundo_plano(contraseña_plana, contraseña_hash):
+    """Verificar en el pool de credenciales; el costo del KDF no corre en el hilo de la sesión"""
+    futuro = _pool_verificacion.submit(verificar_contraseña, contraseña_plana,
+                                       contraseña_hash or _hash_relleno())
+    return futuro.result(timeout=ESPERA_VERIFICACION) and contraseña_hash is not None
+
+# ===============================LIMITACIÓN DE INTENTOS================================
+_intentos = {}
+_lock_intentos = threading.Lock()
+
+def segundos_bloqueo(codigo_id):
+    """Segundos que faltan para poder volver a intentar con este usuario (0 si puede)"""
+    with _lock_intentos:
+        estado = _intentos.get(codigo_id)
+        if not estado:
+            return 0
+        return max(0, int(estado['bloqueado_hasta'] - time.monotonic() + 0.999))
+
+def registrar_fallo(codigo_id):
+    """Contar un intento fallido; a partir de INTENTOS_SIN_BLOQUEO el bloqueo se duplica"""
+    with _lock_intentos:
+        estado = _intentos.setdefault(codigo_id, {'fallos': 0, 'bloqueado_hasta': 0})
+        estado['fallos'] += 1
+        exceso = estado['fallos'] - INTENTOS_SIN_BLOQUEO
+        if exceso >= 0:
+            espera = min(BLOQUEO_MAXIMO, BLOQUEO_INICIAL * 2 ** exceso)
+            estado['bloqueado_hasta'] = time.monotonic() + espera
+
+def registrar_exito(codigo_id):
+    """Olvidar los fallos de un usuario tras un login correcto"""
+    with _lock_intentos:
+        _intentos.pop(codigo_id, None)
+
+# ===============================BENCHMARK================================
+def medir_costos(repeticiones=5):
+    """Latencia media (ms) de verificar un hash con distintos parámetros de costo"""
+    global PARAMETROS_SCRYPT, ITERACIONES_PBKDF2
+    originales = (dict(PARAMETROS_SCRYPT), ITERACIONES_PBKDF2)
+    resultados = []
+    casos = [('scrypt', {'n': 2 ** exp, 'r': 8, 'p': 1}) for exp in (12, 13, 14, 15, 16)]
+    casos += [('pbkdf2_sha256', iteraciones) for iteraciones in (100_000, 300_000, 600_000, 1_000_000)]
+    try:
+        for algoritmo, costo in casos:
+            if algoritmo == 'scrypt':
+                if not hasattr(hashlib, 'scrypt'):
+                    continue
+                PARAMETROS_SCRYPT = costo
+                etiqueta = f"n=2^{costo['n'].bit_length() - 1} r={costo['r']} p={costo['p']}"
+            else:
+                ITERACIONES_PBKDF2 = costo
+                etiqueta = f"iteraciones={costo}"
+            almacenado = hash_contraseña('contraseña de prueba', algoritmo)
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                verificar_contraseña('contraseña de prueba', almacenado)
+            resultados.append((algoritmo, etiqueta, (time.perf_counter() - inicio) / repeticiones * 1000))
+    finally:
+        PARAMETROS_SCRYPT, ITERACIONES_PBKDF2 = originales
+    return resultados
+
+if __name__ == '__main__':
+    print(f"Algoritmo por defecto: {ALGORITMO_POR_DEFECTO}")
+    for algoritmo, etiqueta, milisegundos in medir_costos():
+        print(f"{algoritmo:14} {etiqueta:26} {milisegundos:8.1f} ms")
@@ -0,0 +1,167 @@
+# ===============================INDICADORES DE MANTENIMIENTO (MTTR, MTBF, DISPONIBILIDAD)================================
+# Los intervalos de cada OT culminada (inicio y fin de mantenimiento) se agregan por equipo y día
+# en la tabla kpi_equipo_diario. La tabla se reconstruye completa en la migración (o tras cargar
+# ot_unicas desde Google Sheets) y en cada culminación solo se recalcula la fila del equipo y el
+# día afectados. Los tableros suman filas diarias ya calculadas en vez de recorrer todo el historial.
+#
+# Definiciones para un periodo de N días:
+#   - fallas: OT culminadas de tipo correctivo (incluye emergencias)
+#   - MTTR = horas de reparación de las fallas / fallas
+#   - MTBF = (horas del periodo - horas de reparación de las fallas) / fallas
+#   - disponibilidad = (horas del periodo - horas de reparación de las fallas) / horas del periodo
+# El tiempo de reparación se asigna al día de finalización de la OT.
+import numpy as np
+import pandas as pd
+
+# Intervalos mayores se consideran errores de captura y no suman tiempo de reparación
+MINUTOS_MAXIMOS_REPARACION = 30 * 24 * 60
+
+ESTADOS_CULMINADOS = ('CULMINADO', 'CERRADO')
+
+# Consulta de intervalos: inicio de ot_unicas o, si falta, el de la culminación en ot_sufijos
+CONSULTA_INTERVALOS = '''
+    SELECT u.codigo_ot_base, u.codigo_equipo, u.area, u.tipo_mantenimiento,
+           COALESCE(u.fecha_inicio_mantenimiento, s.fecha_inicio_mantenimiento) AS fecha_inicio,
+           COALESCE(u.hora_inicio_mantenimiento, s.hora_inicio_mantenimiento) AS hora_inicio,
+           u.fecha_finalizacion, u.hora_final
+    FROM ot_unicas u
+    LEFT JOIN ot_sufijos s ON s.codigo_ot_sufijo = u.codigo_ot_base || '-CULM'
+    WHERE u.estado IN ('CULMINADO', 'CERRADO')
+      AND u.codigo_equipo IS NOT NULL AND u.fecha_finalizacion IS NOT NULL
+'''
+
+COLUMNAS_DIARIAS = ['codigo_equipo', 'fecha', 'area', 'intervenciones', 'fallas',
+                    'minutos_reparacion', 'minutos_reparacion_fallas']
+
+def crear_kpi_equipo_diario(c):
+    """Tabla de indicadores diarios por equipo (una fila por equipo y día de finalización)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS kpi_equipo_diario (
+            codigo_equipo TEXT NOT NULL,
+            fecha DATE NOT NULL,
+            area TEXT,
+            intervenciones INTEGER NOT NULL DEFAULT 0,
+            fallas INTEGER NOT NULL DEFAULT 0,
+            minutos_reparacion REAL NOT NULL DEFAULT 0,
+            minutos_reparacion_fallas REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (codigo_equipo, fecha)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_kpi_equipo_diario_fecha ON kpi_equipo_diario(fecha)")
+
+# ===============================CÁLCULO VECTORIZADO================================
+def _fecha_hora(fechas, horas):
+    """Combinar columnas de fecha y hora (texto 'HH:MM:SS' o 'HH:MM') en datetime; sin hora se toma 00:00
+
+    >>> _fecha_hora(pd.Series(['2024-01-05', '2024-01-05']), pd.Series(['08:30', '08:30:15'])).tolist()
+    [Timestamp('2024-01-05 08:30:00'), Timestamp('2024-01-05 08:30:15')]
+    >>> _fecha_hora(pd.Series(['2024-01-05']), pd.Series([None])).tolist()
+    [Timestamp('2024-01-05 00:00:00')]
+    """
+    fechas = pd.to_datetime(fechas, errors='coerce').dt.normalize()
+    horas = horas.fillna('00:00:00').astype(str).str.strip().str.slice(0, 8)
+    # to_timedelta no entiende 'HH:MM' (lo deja en NaT): se completan los segundos
+    horas = horas.mask(horas.str.fullmatch(r'\d{1,2}:\d{2}'), horas + ':00')
+    horas = pd.to_timedelta(horas, errors='coerce')
+    return fechas + horas.fillna(pd.Timedelta(0))
+
+def intervalos_ot(df):
+    """Agregar a las OT las columnas fecha (día de finalización), minutos_reparacion y es_falla"""
+    resultado = df.copy()
+    inicio = _fecha_hora(resultado['fecha_inicio'], resultado['hora_inicio'])
+    fin = _fecha_hora(resultado['fecha_finalizacion'], resultado['hora_final'])
+    minutos = (fin - inicio).dt.total_seconds().to_numpy(dtype=float) / 60
+    validos = np.isfinite(minutos) & (minutos >= 0) & (minutos <= MINUTOS_MAXIMOS_REPARACION)
+    resultado['minutos_reparacion'] = np.where(validos, minutos, 0.0)
+    resultado['fecha'] = pd.to_datetime(resultado['fecha_finalizacion'], errors='coerce').dt.strftime('%Y-%m-%d')
+    resultado['es_falla'] = (resultado['tipo_mantenimiento'].fillna('').str.upper()
+                             .str.contains('CORRECTIVO', regex=False))
+    return resultado[resultado['fecha'].notna()]
+
+def agregar_diario(intervalos):
+    """Sumar los intervalos por equipo y día (mismas columnas que kpi_equipo_diario)"""
+    if intervalos.empty:
+        return pd.DataFrame(columns=COLUMNAS_DIARIAS)
+    datos = intervalos.assign(
+        minutos_reparacion_fallas=np.where(intervalos['es_falla'], intervalos['minutos_reparacion'], 0.0),
+        fallas=intervalos['es_falla'].astype(int)
+    )
+    diario = datos.groupby(['codigo_equipo', 'fecha'], as_index=False).agg(
+        area=('area', 'last'),
+        intervenciones=('codigo_ot_base', 'size'),
+        fallas=('fallas', 'sum'),
+        minutos_reparacion=('minutos_reparacion', 'sum'),
+        minutos_reparacion_fallas=('minutos_reparacion_fallas', 'sum')
+    )
+    return diario[COLUMNAS_DIARIAS]
+
+def indicadores(diario, dias_periodo, por='codigo_equipo'):
+    """MTTR y MTBF (horas) y disponibilidad (%) por equipo o área a partir de filas diarias.
+
+    Los equipos de un área se suman: el tiempo del periodo se multiplica por la cantidad de
+    equipos con registros, así la disponibilidad del área es el promedio ponderado.
+    """
+    if diario.empty:
+        return pd.DataFrame(columns=[por, 'equipos', 'intervenciones', 'fallas', 'mttr_horas',
+                                     'mtbf_horas', 'disponibilidad'])
+    grupos = diario.groupby(por, as_index=False).agg(
+        equipos=('codigo_equipo', 'nunique'),
+        intervenciones=('intervenciones', 'sum'),
+        fallas=('fallas', 'sum'),
+        minutos_reparacion_fallas=('minutos_reparacion_fallas', 'sum')
+    )
+    horas_periodo = grupos['equipos'].to_numpy(dtype=float) * dias_periodo * 24
+    horas_reparacion = np.minimum(grupos['minutos_reparacion_fallas'].to_numpy(dtype=float) / 60, horas_periodo)
+    fallas = grupos['fallas'].to_numpy(dtype=float)
+    horas_operacion = horas_periodo - horas_reparacion
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grupos['mttr_horas'] = np.where(fallas > 0, horas_reparacion / fallas, np.nan).round(2)
+        grupos['mtbf_horas'] = np.where(fallas > 0, horas_operacion / fallas, np.nan).round(2)
+        grupos['disponibilidad'] = np.where(horas_periodo > 0, horas_operacion / horas_periodo * 100, np.nan).round(2)
+    return grupos.drop(columns='minutos_reparacion_fallas').sort_values('disponibilidad')
+
+# ===============================MANTENIMIENTO DE LA TABLA================================
+def _leer_intervalos(conn, where="", params=()):
+    return pd.read_sql(CONSULTA_INTERVALOS + where, conn, params=params)
+
+def _guardar_diario(c, diario):
+    c.executemany(f'''
+        INSERT OR REPLACE INTO kpi_equipo_diario ({', '.join(COLUMNAS_DIARIAS)})
+        VALUES ({', '.join('?' * len(COLUMNAS_DIARIAS))})
+    ''', [(fila.codigo_equipo, fila.fecha, fila.area, int(fila.intervenciones), int(fila.fallas),
+           float(fila.minutos_reparacion), float(fila.minutos_reparacion_fallas))
+          for fila in diario.itertuples(index=False)])
+
+def reconstruir_kpi_equipo_diario(c):
+    """Recalcular toda la tabla desde las OT culminadas; devuelve la cantidad de filas diarias"""
+    crear_kpi_equipo_diario(c)
+    diario = agregar_diario(intervalos_ot(_leer_intervalos(c.connection)))
+    c.execute("DELETE FROM kpi_equipo_diario")
+    _guardar_diario(c, diario)
+    return len(diario)
+
+def actualizar_kpi_equipo_diario(c, codigo_equipo, fecha):
+    """Recalcular solo la fila de un equipo y un día (se llama en la transacción de la culminación)"""
+    if not codigo_equipo or not fecha:
+        return
+    fecha = pd.Timestamp(fecha).strftime('%Y-%m-%d')
+    intervalos = _leer_intervalos(c.connection, " AND u.codigo_equipo = ? AND date(u.fecha_finalizacion) = ?",
+                                  (codigo_equipo, fecha))
+    c.execute("DELETE FROM kpi_equipo_diario WHERE codigo_equipo = ? AND fecha = ?", (codigo_equipo, fecha))
+    _guardar_diario(c, agregar_diario(intervalos_ot(intervalos)))
+
+def leer_kpi_periodo(conn, desde, hasta, area=None):
+    """Filas diarias precalculadas entre dos fechas (inclusive), opcionalmente de un área"""
+    consulta = f"SELECT {', '.join(COLUMNAS_DIARIAS)} FROM kpi_equipo_diario WHERE fecha BETWEEN ? AND ?"
+    params = [pd.Timestamp(desde).strftime('%Y-%m-%d'), pd.Timestamp(hasta).strftime('%Y-%m-%d')]
+    if area:
+        consulta += " AND area = ?"
+        params.append(area)
+    return pd.read_sql(consulta, conn, params=params)
+
+if __name__ == '__main__':
+    # Pruebas de los ejemplos en los docstrings (CI: python kpi.py)
+    import doctest
+    fallidas, total = doctest.testmod()
+    print(f"{'❌' if fallidas else '✅'} {total - fallidas}/{total} pruebas de kpi.py correctas")
+    raise SystemExit(1 if fallidas else 0)